@@ -0,0 +1,474 @@
+"""
+Cold archive of closed months.
+
+A month whose movements are all closed and that ended more than
+ARCHIVE_AFTER_DAYS ago is never edited again, but its rows and index
+entries still weigh on the hot table. `python archive.py run` writes each
+such month to a zstd-compressed Parquet file in ARCHIVE_DIR, records it in
+movement_archives and ARCHIVE_DIR/manifest.json, moves its KPI rollup rows
+to kpi_archived_rollups and drops the month's partition (see partitions.py).
+
+The file is written from a snapshot of the partition; the catalog row, the
+rollup move and the detach then commit together, after checking that the
+partition still matches that snapshot: a month is either live or archived,
+never both or neither. Reads don't change: KPIs
+add the archived rollup to the live one, and tag-filtered KPIs and exports
+read the matching archived rows from the files.
+
+`python archive.py restore 2024-01` loads a month back into Postgres,
+`python archive.py list` shows what is archived.
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import operator
+import os
+import re
+from collections import defaultdict, deque
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+import kpis
+import partitions
+import periods
+from database import engine
+from models import MovementArchive
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", ROOT_DIR / "archives"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "365"))
+MANIFEST = "manifest.json"
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 20_000  # rows per Parquet row group, written sorted by owner
+RESTORE_BATCH_SIZE = 20_000
+RESTORE_TABLE = "movements_restore"
+READ_BATCH_SIZE = 2_000
+
+# One Parquet column per stored movements column; the search vector is rebuilt on restore
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("owner_id", pa.string()),
+    ("type", pa.string()),
+    ("amount", pa.decimal128(14, 2)),
+    ("currency", pa.string()),
+    ("description", pa.string()),
+    ("responsible", pa.string()),
+    ("business_unit_id", pa.string()),
+    ("status", pa.string()),
+    ("date", pa.date32()),
+    ("tags", pa.list_(pa.string())),
+    ("fingerprint", pa.string()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("updated_at", pa.timestamp("us", tz="UTC")),
+])
+COLUMNS = SCHEMA.names
+KPI_COLUMNS = ["date", "type", "amount", "status", "tags"]
+FILTER_COLUMNS = ["owner_id", "status", "type", "date", "business_unit_id"]
+
+_PARTITION_NAME = re.compile(r"^movements_p(\d{4})_(\d{2})$")
+
+
+def file_name(month: date) -> str:
+    return f"movements-{month:%Y-%m}.parquet"
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _tagged(row_tags: Optional[List[str]], tags: Sequence[str], tag_match: str) -> bool:
+    present = set(row_tags or ())
+    return all(tag in present for tag in tags) if tag_match == "all" else any(tag in present for tag in tags)
+
+
+# --- Reading ---
+
+async def archived_months(
+    db: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> List[MovementArchive]:
+    """Archived months overlapping [date_from, date_to], oldest first."""
+    q = select(MovementArchive).order_by(MovementArchive.month)
+    if date_from:
+        q = q.where(MovementArchive.month >= partitions.month_start(date_from))
+    if date_to:
+        q = q.where(MovementArchive.month <= date_to)
+    return list((await db.execute(q)).scalars().all())
+
+
+def _owner_row_groups(parquet: pq.ParquetFile, owner_id: str) -> List[int]:
+    """Row groups whose owner_id min/max statistics admit `owner_id`; files are written sorted by owner."""
+    column = parquet.schema_arrow.get_field_index("owner_id")
+    groups = []
+    for i in range(parquet.metadata.num_row_groups):
+        stats = parquet.metadata.row_group(i).column(column).statistics
+        if stats is None or not stats.has_min_max or stats.min <= owner_id <= stats.max:
+            groups.append(i)
+    return groups
+
+
+def read_rows(
+    archive: MovementArchive,
+    owner_id: str,
+    columns: Sequence[str] = COLUMNS,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+    tags: Sequence[str] = (),
+    tag_match: str = "any",
+) -> Iterator[List[Dict]]:
+    """
+    `owner_id`'s rows of an archived month that pass the filters, in file
+    order (date, created_at, id), as batches of at most READ_BATCH_SIZE
+    rows read one at a time. Blocking; step it in a thread.
+    """
+    conditions = [pc.field("owner_id") == owner_id]
+    if status:
+        conditions.append(pc.field("status") == status)
+    if type:
+        conditions.append(pc.field("type") == type)
+    if date_from:
+        conditions.append(pc.field("date") >= date_from)
+    if date_to:
+        conditions.append(pc.field("date") <= date_to)
+    if business_unit_id:
+        conditions.append(pc.field("business_unit_id") == business_unit_id)
+    # The filtered columns are read too, and dropped again per row
+    wanted = list(dict.fromkeys([*columns, *FILTER_COLUMNS, *(["tags"] if tags else [])]))
+    condition = functools.reduce(operator.and_, conditions)
+    parquet = pq.ParquetFile(ARCHIVE_DIR / archive.file)
+    try:
+        batches = parquet.iter_batches(
+            batch_size=READ_BATCH_SIZE, row_groups=_owner_row_groups(parquet, owner_id), columns=wanted
+        )
+        for batch in batches:
+            rows = batch.filter(condition).to_pylist()
+            if tags:
+                rows = [row for row in rows if _tagged(row["tags"], tags, tag_match)]
+            if rows:
+                yield [{column: row[column] for column in columns} for row in rows]
+    finally:
+        parquet.close()
+
+
+async def iter_rows(months: Sequence[MovementArchive], owner_id: str, **filters) -> AsyncIterator[List[Dict]]:
+    """Batches of `read_rows` over several months, oldest month first, each read in a thread as it is wanted."""
+    for archive in months:
+        batches = read_rows(archive, owner_id, **filters)
+        while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+            yield batch
+
+
+async def kpi_rows(
+    months: Sequence[MovementArchive],
+    owner_id: str,
+    bucket: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+    tags: Sequence[str] = (),
+    tag_match: str = "any",
+) -> List[kpis.Totals]:
+    """KPI totals of the archived rows matching the filters, per `bucket` (or one row without it)."""
+    totals: Dict[Optional[date], list] = defaultdict(lambda: [Decimal(0), Decimal(0), 0, 0])
+    filters = dict(date_from=date_from, date_to=date_to, business_unit_id=business_unit_id, tags=tags,
+                   tag_match=tag_match, columns=KPI_COLUMNS)
+    async for batch in iter_rows(months, owner_id, **filters):
+        for row in batch:
+            t = totals[kpis.period_start(row["date"], bucket) if bucket else None]
+            t[0 if row["type"] == "income" else 1] += row["amount"]
+            t[2] += 1
+            t[3] += row["status"] == "pending"
+    return [kpis.Totals(period, *values) for period, values in totals.items()]
+
+
+async def merge_sorted(
+    first: AsyncIterator[List],
+    second: AsyncIterator[List],
+    key: Callable,
+) -> AsyncIterator[List]:
+    """Merge two streams of row batches, each already sorted by `key`, into one sorted stream."""
+    streams = [first.__aiter__(), second.__aiter__()]
+    buffers = [deque(), deque()]
+    exhausted = [False, False]
+    while True:
+        for i, stream in enumerate(streams):
+            while not buffers[i] and not exhausted[i]:
+                try:
+                    buffers[i].extend(await stream.__anext__())
+                except StopAsyncIteration:
+                    exhausted[i] = True
+        a, b = buffers
+        if not a and not b:
+            return
+        batch = []
+        while a and b:
+            batch.append((a if key(a[0]) <= key(b[0]) else b).popleft())
+        if (not a and exhausted[0]) or (not b and exhausted[1]):
+            # One side is finished: the rest of the other needs no comparing
+            rest = a or b
+            batch.extend(rest)
+            rest.clear()
+        yield batch
+
+
+# --- Archiving ---
+
+async def _write_file(conn: AsyncConnection, partition: str, path: Path) -> int:
+    """Write every row of `partition` to a Parquet file at `path`, sorted by owner, date, created_at and id."""
+    query = text(
+        f"SELECT {', '.join(c if c not in ('type', 'status') else f'{c}::text AS {c}' for c in COLUMNS)} "
+        f"FROM {partition} ORDER BY owner_id, date, created_at, id"
+    ).columns(tags=JSONB)
+    rows = 0
+    result = await conn.stream(query)
+    with pq.ParquetWriter(path, SCHEMA, compression=COMPRESSION) as writer:
+        async for batch in result.mappings().partitions(ROW_GROUP_SIZE):
+            writer.write_table(pa.Table.from_pylist([dict(row) for row in batch], schema=SCHEMA))
+            rows += len(batch)
+    return rows
+
+
+async def _contents(conn: AsyncConnection, partition: str) -> tuple:
+    """(row count, hash of every row) of `partition`, to tell whether it changed between two transactions."""
+    row = (await conn.execute(
+        text(f"SELECT count(*), coalesce(sum(hashtextextended(m::text, 0)), 0) FROM {partition} m")
+    )).one()
+    return tuple(row)
+
+
+async def archive_month(month: date) -> dict:
+    """
+    Move one month of movements to the archive. Every movement in it must be
+    closed. Returns the new catalog entry.
+    """
+    month = partitions.month_start(month)
+    name = partitions.partition_name(month)
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = ARCHIVE_DIR / file_name(month)
+    partial = path.with_name(path.name + ".partial")
+
+    async def archived(conn: AsyncConnection) -> bool:
+        return await conn.scalar(select(MovementArchive.month).where(MovementArchive.month == month)) is not None
+
+    # The file is written from one snapshot without blocking anyone; a partition lock here would
+    # deadlock against updates by id, which lock every partition while holding movements
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+        async with conn.begin():
+            if await archived(conn):
+                raise ValueError(f"{month:%Y-%m} is already archived")
+            if await conn.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is None:
+                raise ValueError(f"{name} does not exist")
+            still_open = await conn.scalar(text(f"SELECT count(*) FROM {name} WHERE status <> 'closed'"))
+            if still_open:
+                raise ValueError(f"{name} has {still_open} movements that are not closed")
+            contents = await _contents(conn, name)
+            if not contents[0]:
+                raise ValueError(f"{name} is empty; drop it with `python partitions.py detach {month:%Y-%m} --drop`")
+            try:
+                rows = await _write_file(conn, name, partial)
+            except BaseException:
+                partial.unlink(missing_ok=True)
+                raise
+
+    async def swap(conn: AsyncConnection) -> dict:
+        # movements first, as detach_month does: the check and the swap see no concurrent write
+        await conn.execute(text("LOCK TABLE movements IN ACCESS EXCLUSIVE MODE"))
+        if await archived(conn):
+            raise ValueError(f"{month:%Y-%m} is already archived")
+        if await _contents(conn, name) != contents:
+            raise ValueError(f"{name} changed while it was being written; run the archive again")
+        await conn.execute(
+            text(
+                "INSERT INTO kpi_archived_rollups "
+                "SELECT owner_id, business_unit_id, day, status, income_total, expense_total, movement_count "
+                "FROM kpi_daily_rollups WHERE day >= :first AND day < :next"
+            ),
+            {"first": month, "next": partitions.month_start(month, 1)},
+        )
+        await partitions.detach_month(conn, month)
+        await conn.execute(text(f"DROP TABLE {name}"))
+        entry = {
+            "month": month,
+            "file": path.name,
+            "row_count": rows,
+            "sha256": _sha256(partial),
+            "archived_at": datetime.now(timezone.utc),
+        }
+        await conn.execute(insert(MovementArchive).values(**entry))
+        # In place before the commit: a catalog row never points at a missing file
+        os.replace(partial, path)
+        return entry
+
+    try:
+        entry = await partitions.with_lock_retries(swap, f"the archive of {name}")
+    finally:
+        partial.unlink(missing_ok=True)
+    await write_manifest()
+    return entry
+
+
+async def restore_month(month: date) -> int:
+    """Load an archived month back into movements. Returns the number of rows inserted."""
+    month = partitions.month_start(month)
+    async with engine.connect() as conn:
+        archive = (await conn.execute(select(MovementArchive).where(MovementArchive.month == month))).first()
+    if archive is None:
+        raise ValueError(f"{month:%Y-%m} is not archived")
+    path = ARCHIVE_DIR / archive.file
+    if not path.exists() or _sha256(path) != archive.sha256:
+        raise ValueError(f"{path} is missing or does not match its checksum")
+
+    async def restore(conn: AsyncConnection) -> int:
+        await partitions.ensure_months(conn, month, month)
+        # Staged with COPY, then moved in one statement: the rollup and version triggers run once
+        await conn.execute(text(f"CREATE TEMP TABLE {RESTORE_TABLE} (LIKE movements) ON COMMIT DROP"))
+        raw = (await conn.get_raw_connection()).driver_connection
+        tags = COLUMNS.index("tags")
+        for batch in pq.ParquetFile(path).iter_batches(RESTORE_BATCH_SIZE):
+            records = [
+                tuple(json.dumps(value) if i == tags else value for i, value in enumerate(row.values()))
+                for row in batch.to_pylist()
+            ]
+            await raw.copy_records_to_table(RESTORE_TABLE, columns=COLUMNS, records=records)
+        columns = ", ".join(COLUMNS)
+        # The rows come back exactly as they were closed
+        await conn.execute(text(f"SET LOCAL {periods.GUARD_SETTING} = 'off'"))
+        # Lines imported again since the archive keep their new copy
+        result = await conn.execute(
+            text(f"INSERT INTO movements ({columns}) SELECT {columns} FROM {RESTORE_TABLE} ON CONFLICT DO NOTHING")
+        )
+        # The insert triggers rebuilt these totals in the live rollup
+        await conn.execute(
+            text("DELETE FROM kpi_archived_rollups WHERE day >= :first AND day < :next"),
+            {"first": month, "next": partitions.month_start(month, 1)},
+        )
+        await conn.execute(delete(MovementArchive).where(MovementArchive.month == month))
+        return result.rowcount
+
+    rows = await partitions.with_lock_retries(restore, f"the restore of {month:%Y-%m}")
+    path.unlink()
+    await write_manifest()
+    return rows
+
+
+async def write_manifest() -> dict:
+    """Rewrite ARCHIVE_DIR/manifest.json from the catalog, which is authoritative."""
+    async with engine.connect() as conn:
+        archives = (await conn.execute(select(MovementArchive).order_by(MovementArchive.month))).all()
+    manifest = {
+        "format": "parquet",
+        "compression": COMPRESSION,
+        "columns": {field.name: str(field.type) for field in SCHEMA},
+        "sort": ["owner_id", "date", "created_at", "id"],
+        "months": [
+            {
+                "month": f"{a.month:%Y-%m}",
+                "file": a.file,
+                "rows": a.row_count,
+                "sha256": a.sha256,
+                "archived_at": a.archived_at.isoformat(),
+            }
+            for a in archives
+        ],
+    }
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    partial = ARCHIVE_DIR / (MANIFEST + ".partial")
+    partial.write_text(json.dumps(manifest, indent=2) + "\n")
+    os.replace(partial, ARCHIVE_DIR / MANIFEST)
+    return manifest
+
+
+async def due_months(today: Optional[date] = None) -> List[date]:
+    """Months with a partition that ended more than ARCHIVE_AFTER_DAYS ago, oldest first."""
+    cutoff = (today or date.today()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    async with engine.connect() as conn:
+        names = [partition["name"] for partition in await partitions.list_partitions(conn)]
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if partitions.month_start(month, 1) <= cutoff:
+                months.append(month)
+    return months
+
+
+async def run(dry_run: bool = False) -> int:
+    """Archive every due month whose movements are all closed. Returns how many were archived."""
+    archived = 0
+    for month in await due_months():
+        if dry_run:
+            logger.info(f"Would archive {month:%Y-%m}")
+            continue
+        try:
+            entry = await archive_month(month)
+        except ValueError as e:
+            logger.info(f"Skipping {month:%Y-%m}: {e}")
+            continue
+        archived += 1
+        logger.info(f"Archived {month:%Y-%m}: {entry['row_count']} movements in {entry['file']}")
+    return archived
+
+
+def _month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Move closed months of movements to and from Parquet files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help=f"archive every closed month older than {ARCHIVE_AFTER_DAYS} days")
+    run_parser.add_argument("--dry-run", action="store_true", help="only list the months that are due")
+    one = sub.add_parser("archive", help="archive one month now, whatever its age")
+    one.add_argument("month", type=_month, help="YYYY-MM")
+    restore = sub.add_parser("restore", help="load an archived month back into movements")
+    restore.add_argument("month", type=_month, help="YYYY-MM")
+    sub.add_parser("list", help="show the archived months (and rewrite the manifest)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "run":
+            archived = await run(dry_run=args.dry_run)
+            if not args.dry_run:
+                logger.info(f"{archived} months archived")
+        elif args.command == "archive":
+            entry = await archive_month(args.month)
+            logger.info(f"Archived {args.month:%Y-%m}: {entry['row_count']} movements in {entry['file']}")
+        elif args.command == "restore":
+            rows = await restore_month(args.month)
+            logger.info(f"Restored {rows} movements of {args.month:%Y-%m}")
+        else:
+            for month in (await write_manifest())["months"]:
+                print(f"{month['month']}  {month['rows']:>10} rows  {month['file']}  {month['archived_at']}")
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    raise SystemExit(asyncio.run(_main()))
@@ -0,0 +1,10 @@
+"""
+Reproducible HTTP load benchmarks for the API.
+
+- seed: deterministic movements at a chosen scale (10k, 1m, 10m rows)
+- scenarios: the inbox, register, classify and KPI dashboard flows
+- runner: closed-loop async client and the uvicorn child process
+- report: JSON results (throughput, p50/p95/p99 per endpoint) and compare
+
+See __main__ for the command line.
+"""
@@ -0,0 +1,176 @@
+"""
+Command line entry point; run from backend/:
+
+    python -m benchmarks seed --scale 1m --database-url postgresql+asyncpg://.../suma_bench
+    python -m benchmarks run --scale 1m --database-url ... --concurrency 32 --duration 60 --out base.json
+    python -m benchmarks run --url http://127.0.0.1:8001 --out new.json
+    python -m benchmarks compare base.json new.json --threshold 0.1
+
+`run` with --database-url starts the API against that database (which it
+seeds to --scale first) and stops it afterwards, authenticating the virtual
+users as the seeded benchmark owner with a throwaway signing key. With --url
+it targets a server that is already running, as the registered user behind
+--token (a Firebase ID token). Use a dedicated database: seeding and the
+write scenarios modify it.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from . import auth, report, runner, scenarios, seed
+
+# API settings worth recording with a run because they change its numbers
+SERVER_SETTINGS = (
+    "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_STATEMENT_CACHE_SIZE", "DB_PGBOUNCER", "SQL_PROFILE", "TENANT_RLS",
+)
+
+
+async def _seed(database_url: str, rows: int) -> int:
+    engine = create_async_engine(database_url)
+    try:
+        return await seed.ensure_scale(engine, rows)
+    finally:
+        await engine.dispose()
+
+
+async def _undo(database_url: str, sessions) -> None:
+    engine = create_async_engine(database_url)
+    try:
+        await seed.undo_writes(
+            engine,
+            [i for s in sessions for i in s.created],
+            [i for s in sessions for i in s.classified],
+        )
+    finally:
+        await engine.dispose()
+
+
+def cmd_seed(args) -> int:
+    count = asyncio.run(_seed(args.database_url, seed.parse_scale(args.scale)))
+    print(f"movements: {count}")
+    return 0
+
+
+def cmd_run(args) -> int:
+    if not args.url and not args.database_url:
+        print("run needs --url or --database-url", file=sys.stderr)
+        return 2
+    if args.url and not args.token:
+        print("run --url needs --token (or BENCH_ID_TOKEN)", file=sys.stderr)
+        return 2
+    mix = scenarios.parse_mix(args.mix) if args.mix else scenarios.DEFAULT_MIX
+    rows = seed.parse_scale(args.scale)
+
+    process = None
+    signer = None
+    base_url, token = args.url, args.token
+    if not base_url:
+        signer = auth.LocalSigner()
+        # The server creates the tables on startup, so it has to come up before seeding
+        process = runner.start_server(args.database_url, args.port, signer.server_env())
+        base_url = f"http://127.0.0.1:{args.port}"
+        token = signer.token(seed.OWNER_UID)
+    try:
+        movements = asyncio.run(_seed(args.database_url, rows)) if args.database_url else None
+        started_at = datetime.now(timezone.utc).isoformat()
+        recorder, sessions, elapsed = asyncio.run(
+            runner.run_load(base_url, mix, args.concurrency, args.duration, args.warmup, args.seed, token=token)
+        )
+    finally:
+        if process is not None:
+            runner.stop_server(process)
+        if signer is not None:
+            signer.close()
+
+    if args.database_url and not args.keep_writes:
+        asyncio.run(_undo(args.database_url, sessions))
+
+    meta = {
+        "started_at": started_at,
+        "revision": runner.git_revision(),
+        "target": base_url if args.url else "spawned",
+        "scale": args.scale,
+        "movements": movements,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "mix": mix,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "settings": {name: os.environ[name] for name in SERVER_SETTINGS if name in os.environ},
+    }
+    results = report.build_results(meta, recorder.latencies, recorder.errors, elapsed)
+    print(report.format_table(results))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+def cmd_compare(args) -> int:
+    base, new = report.load(args.base), report.load(args.new)
+    for key in ("scale", "concurrency", "mix"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"warning: runs differ in {key}: {base['meta'].get(key)} vs {new['meta'].get(key)}", file=sys.stderr)
+    rows = report.compare(base, new, args.threshold)
+    print(report.format_comparison(rows))
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="HTTP load benchmarks for the Suma API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="grow a database to a benchmark scale")
+    seed_parser.add_argument("--scale", default="10k", help="10k, 1m, 10m or a row count")
+    seed_parser.add_argument(
+        "--database-url", default=os.environ.get("DATABASE_URL"), required="DATABASE_URL" not in os.environ
+    )
+    seed_parser.set_defaults(func=cmd_seed)
+
+    run_parser = commands.add_parser("run", help="run the load scenarios and report latencies")
+    target = run_parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="benchmark an already running API instead of starting one")
+    target.add_argument("--database-url", help="start the API against this database, seeded to --scale")
+    run_parser.add_argument(
+        "--token", default=os.environ.get("BENCH_ID_TOKEN"), help="ID token of the user to run as, with --url"
+    )
+    run_parser.add_argument("--scale", default="10k", help="10k, 1m, 10m or a row count")
+    run_parser.add_argument("--port", type=int, default=8010)
+    run_parser.add_argument("--concurrency", type=int, default=16, help="simultaneous virtual users")
+    run_parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before measuring")
+    default_mix = ",".join(f"{name}={weight}" for name, weight in scenarios.DEFAULT_MIX.items())
+    run_parser.add_argument("--mix", help=f"scenario weights, default {default_mix}")
+    run_parser.add_argument("--seed", type=int, default=0, help="random seed for the virtual users")
+    run_parser.add_argument("--keep-writes", action="store_true", help="keep the rows written by the run")
+    run_parser.add_argument("--out", help="write the JSON results here")
+    run_parser.set_defaults(func=cmd_run)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.10, help="relative change that counts (0.10 = 10%%)"
+    )
+    compare_parser.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per request otherwise
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
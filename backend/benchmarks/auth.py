@@ -0,0 +1,51 @@
+"""
+Tokens for the virtual users of a spawned server.
+
+Every scoped endpoint needs a registered owner, and a benchmark must not
+depend on a live Firebase project: the harness generates a throwaway RSA
+key, points the server at its public half (FIREBASE_SIGNING_KEYS_FILE) and
+signs Firebase-shaped ID tokens for the benchmark owner with the private half.
+"""
+import json
+import os
+import tempfile
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+PROJECT_ID = "suma-bench"
+KEY_ID = "bench"
+TOKEN_LIFETIME = 3600  # seconds; longer than any run
+
+
+class LocalSigner:
+    def __init__(self):
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public = self._key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        fd, self.keys_file = tempfile.mkstemp(prefix="suma-bench-keys-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({KEY_ID: public.decode()}, f)
+
+    def server_env(self) -> dict:
+        """Environment that makes the API trust this signer (and only it)."""
+        return {"FIREBASE_PROJECT_ID": PROJECT_ID, "FIREBASE_SIGNING_KEYS_FILE": self.keys_file}
+
+    def token(self, uid: str) -> str:
+        now = int(time.time())
+        claims = {
+            "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+            "aud": PROJECT_ID,
+            "sub": uid,
+            "iat": now,
+            "exp": now + TOKEN_LIFETIME,
+            "auth_time": now,
+            "firebase": {"sign_in_provider": "custom"},
+        }
+        return jwt.encode(claims, self._key, algorithm="RS256", headers={"kid": KEY_ID})
+
+    def close(self) -> None:
+        os.unlink(self.keys_file)
@@ -0,0 +1,107 @@
+"""
+Result files and regression checks.
+
+A result file is JSON: run settings under "meta", and per endpoint (plus
+"total") the request count, errors, throughput and latency percentiles in
+milliseconds. `compare` flags endpoints whose p95/p99 grew or whose
+throughput dropped by more than a relative threshold.
+"""
+import json
+import math
+from typing import Dict, List, Sequence
+
+PERCENTILES = (50, 95, 99)
+
+# Latency changes smaller than this are noise on any machine, whatever the ratio
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: Sequence[float], errors: int, elapsed: float) -> dict:
+    """Stats for one endpoint from its latencies in seconds over a run of `elapsed` seconds."""
+    values = sorted(v * 1000 for v in latencies)
+    stats = {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+    for pct in PERCENTILES:
+        stats[f"p{pct}_ms"] = round(percentile(values, pct), 2)
+    return stats
+
+
+def build_results(meta: dict, latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> dict:
+    endpoints = {
+        name: summarize(values, errors.get(name, 0), elapsed)
+        for name, values in sorted(latencies.items())
+    }
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "meta": {**meta, "elapsed_s": round(elapsed, 2)},
+        "endpoints": endpoints,
+        "total": summarize(everything, sum(errors.values()), elapsed),
+    }
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base: dict, new: dict, threshold: float = 0.10) -> List[dict]:
+    """
+    One row per endpoint and metric present in both runs, flagged as a
+    regression when it got worse by more than `threshold` (0.10 = 10%).
+    """
+    rows = []
+    pairs = [
+        (name, base["endpoints"][name], stats)
+        for name, stats in new["endpoints"].items()
+        if name in base["endpoints"]
+    ]
+    pairs.append(("total", base["total"], new["total"]))
+    for name, old, cur in pairs:
+        for metric in ("p95_ms", "p99_ms", "throughput_rps", "errors"):
+            before, after = old[metric], cur[metric]
+            change = (after - before) / before if before else (0.0 if after == before else math.inf)
+            if metric == "throughput_rps":
+                regression = change < -threshold
+            elif metric == "errors":
+                regression = after > before
+            else:
+                regression = change > threshold and after - before >= MIN_LATENCY_DELTA_MS
+            rows.append({
+                "endpoint": name, "metric": metric, "base": before, "new": after,
+                "change": change, "regression": regression,
+            })
+    return rows
+
+
+def format_table(results: dict) -> str:
+    lines = [f"{'endpoint':<44} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}"]
+    for name, stats in [*results["endpoints"].items(), ("total", results["total"])]:
+        lines.append(
+            f"{name:<44} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8.1f} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[dict]) -> str:
+    lines = [f"{'endpoint':<44} {'metric':<15} {'base':>9} {'new':>9} {'change':>8}"]
+    for row in rows:
+        change = "new" if math.isinf(row["change"]) else f"{row['change'] * 100:+.1f}%"
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(
+            f"{row['endpoint']:<44} {row['metric']:<15} {row['base']:>9} {row['new']:>9} {change:>8}{flag}"
+        )
+    return "\n".join(lines)
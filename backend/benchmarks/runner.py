@@ -0,0 +1,140 @@
+"""
+Closed-loop load generator: `concurrency` virtual users each pick a
+scenario by weight, run it, and start the next one as soon as it finishes,
+for `warmup` seconds (discarded) and then `duration` seconds (measured).
+"""
+import asyncio
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from . import scenarios
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+STARTUP_TIMEOUT = 60  # seconds to wait for a spawned server to answer /api/health
+
+
+class Recorder:
+    """Latencies and error counts per endpoint name, ignored while warming up."""
+
+    def __init__(self):
+        self.recording = False
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, elapsed: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies[name].append(elapsed)
+        if not ok:
+            self.errors[name] += 1
+
+
+class Session:
+    """One virtual user: its HTTP client, random stream and the rows it wrote."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.created: List[str] = []
+        self.classified: List[str] = []
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """Time one request; returns None when it failed at the transport level."""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(name, time.perf_counter() - started, False)
+            logger.debug(f"{name} failed: {e}")
+            return None
+        self.recorder.record(name, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+
+async def run_load(
+    base_url: str,
+    mix: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    warmup: float = 5.0,
+    seed: int = 0,
+    timeout: float = 30.0,
+    token: Optional[str] = None,
+):
+    """Drive the API at `base_url` as the owner of `token`; returns (recorder, sessions, measured seconds)."""
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout, headers=headers) as client:
+        # Per-user random streams keep each user's choices reproducible for a given seed
+        sessions = [Session(client, recorder, random.Random(seed * 100_003 + i)) for i in range(concurrency)]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + warmup + duration
+
+        async def user(session: Session):
+            while loop.time() < deadline:
+                await scenarios.SCENARIOS[scenarios.pick(mix, session.rng)](session)
+
+        async def clock():
+            await asyncio.sleep(warmup)
+            recorder.recording = True
+            started = time.perf_counter()
+            await asyncio.sleep(duration)
+            recorder.recording = False
+            return time.perf_counter() - started
+
+        measured, *_ = await asyncio.gather(clock(), *(user(s) for s in sessions))
+    return recorder, sessions, measured
+
+
+def start_server(database_url: str, port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Start the API with uvicorn in a child process and wait until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **(env or {}), "DATABASE_URL": database_url},
+    )
+    url = f"http://127.0.0.1:{port}/api/health"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    stop_server(process)
+    raise RuntimeError(f"API server did not answer on port {port} within {STARTUP_TIMEOUT}s")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,98 @@
+"""
+User flows the load generator replays, each built from the requests the
+frontend makes for that screen. A scenario is an async function taking a
+Session; every request it makes is timed under the endpoint name given.
+"""
+import random
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict
+
+from .seed import DESCRIPTIONS, END_DATE, RESPONSIBLES, TAGS, UNITS
+
+API = "/api/v1"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Default weights: the inbox is the screen people live in
+DEFAULT_MIX = {"inbox": 4, "register": 2, "classify": 2, "dashboard": 1}
+
+
+async def inbox(session) -> None:
+    """Pending movements, newest first; a third of the time the user scrolls to page 2."""
+    params = {"status": "pending", "limit": 50}
+    response = await session.request("GET /movements?status=pending", "GET", f"{API}/movements", params=params)
+    cursor = response.headers.get(NEXT_CURSOR_HEADER) if response is not None else None
+    if cursor and session.rng.random() < 0.33:
+        await session.request(
+            "GET /movements?status=pending (page 2)", "GET", f"{API}/movements", params={**params, "cursor": cursor}
+        )
+
+
+async def register(session) -> None:
+    """Record a new movement as the register form does."""
+    rng = session.rng
+    unit = rng.choice(UNITS)[0] if rng.random() < 0.9 else None
+    body = {
+        "type": "income" if rng.random() < 0.6 else "expense",
+        "amount": rng.randrange(1000, 200000, 50),
+        "description": f"{rng.choice(DESCRIPTIONS)} benchmark",
+        "responsible": rng.choice(RESPONSIBLES),
+        "business_unit_id": unit,
+        "date": (date.fromisoformat(END_DATE) - timedelta(days=rng.randrange(30))).isoformat(),
+        "tags": [rng.choice(TAGS)],
+    }
+    response = await session.request("POST /movements", "POST", f"{API}/movements", json=body)
+    if response is not None and response.status_code == 200:
+        session.created.append(response.json()["id"])
+
+
+async def classify(session) -> None:
+    """Open the inbox and classify one of its movements."""
+    response = await session.request(
+        "GET /movements?status=pending", "GET", f"{API}/movements", params={"status": "pending", "limit": 20}
+    )
+    if response is None or response.status_code != 200 or not response.json():
+        return
+    movement = session.rng.choice(response.json())
+    body = {"status": "classified", "tags": [session.rng.choice(TAGS)]}
+    response = await session.request("PATCH /movements/{id}", "PATCH", f"{API}/movements/{movement['id']}", json=body)
+    if response is not None and response.status_code == 200:
+        session.classified.append(movement["id"])
+
+
+async def dashboard(session) -> None:
+    """The KPI screen: reference data, the period summary and a monthly series."""
+    rng = session.rng
+    end = date.fromisoformat(END_DATE)
+    params = {"date_from": (end - timedelta(days=rng.choice((30, 90, 365)))).isoformat(), "date_to": END_DATE}
+    if rng.random() < 0.5:
+        params["business_unit_id"] = rng.choice(UNITS)[0]
+    await session.request("GET /business-units", "GET", f"{API}/business-units")
+    await session.request("GET /tags", "GET", f"{API}/tags")
+    await session.request("GET /kpis/summary", "GET", f"{API}/kpis/summary", params=params)
+    await session.request(
+        "GET /kpis/timeseries", "GET", f"{API}/kpis/timeseries", params={**params, "bucket": "month"}
+    )
+
+
+SCENARIOS: Dict[str, Callable[..., Awaitable[None]]] = {
+    "inbox": inbox,
+    "register": register,
+    "classify": classify,
+    "dashboard": dashboard,
+}
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Parse "inbox=4,register=1" into scenario weights."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = int(weight) if weight else 1
+    return mix
+
+
+def pick(mix: Dict[str, int], rng: random.Random) -> str:
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
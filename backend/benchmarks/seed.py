@@ -0,0 +1,160 @@
+"""
+Bring the movements table of a benchmark database up to a target size.
+
+Rows are generated server-side with generate_series. Every value is derived
+from the row number, so a given scale always produces the same data: ids,
+dates, amounts and the pending/classified/closed mix are stable across runs
+and machines. Growing an existing dataset only appends the missing rows.
+
+Everything belongs to one benchmark owner (OWNER_ID), whose user row is
+created here; the spawned server authenticates the virtual users as that
+owner (see auth.py).
+"""
+import logging
+import re
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+BATCH_SIZE = 500_000  # rows per INSERT; each one is a transaction and one rollup trigger run
+DAYS = 730  # movement dates fall in the two years up to END_DATE
+END_DATE = "2026-01-31"
+
+OWNER_ID = "bench-owner"
+OWNER_UID = "bench-owner"  # Firebase uid in the virtual users' tokens
+
+UNITS = [
+    ("bench-unit-1", "Sucursal Centro", "branch"),
+    ("bench-unit-2", "Sucursal Escazu", "branch"),
+    ("bench-unit-3", "Feria del Agricultor", "event"),
+    ("bench-unit-4", "Tienda en linea", "brand"),
+]
+TAGS = ["SINPE", "Efectivo", "Proveedor", "Planilla", "Servicios", "Transporte"]
+DESCRIPTIONS = [
+    "Venta de cafe molido", "Compra de bolsas", "Ventas feria sabado", "Gasolina transporte",
+    "Pedido especial empanadas", "Pago proveedor lacteos", "Venta queso fresco", "Recibo de luz",
+    "Cobro SINPE cliente", "Compra de harina", "Alquiler local", "Venta pollo asado",
+]
+RESPONSIBLES = ["Maria", "Carlos", "Ana", "Jose", "Lucia"]
+
+
+def parse_scale(value: str) -> int:
+    """Accept a named scale (10k, 1m, 10m) or a plain row count."""
+    value = value.strip().lower()
+    if value in SCALES:
+        return SCALES[value]
+    if not re.fullmatch(r"\d+", value):
+        raise ValueError(f"Unknown scale {value!r}; use {', '.join(SCALES)} or a row count")
+    return int(value)
+
+
+def _array(values) -> str:
+    return "ARRAY[" + ", ".join("'" + v.replace("'", "''") + "'" for v in values) + "]"
+
+
+# :first and :last bound the row numbers generated by one batch
+_INSERT_MOVEMENTS = f"""
+INSERT INTO movements
+    (id, owner_id, type, amount, currency, description, responsible, business_unit_id,
+     status, date, tags, created_at, updated_at)
+SELECT
+    md5('bench-movement-' || i)::uuid::text,
+    '{OWNER_ID}',
+    (CASE WHEN i % 5 < 3 THEN 'income' ELSE 'expense' END)::movement_type,
+    round((1000 + (hashint % 200000)) / 10.0) * 10,
+    'CRC',
+    ({_array(DESCRIPTIONS)})[1 + i % {len(DESCRIPTIONS)}] || ' ' || i,
+    CASE WHEN i % 7 = 0 THEN NULL ELSE ({_array(RESPONSIBLES)})[1 + i % {len(RESPONSIBLES)}] END,
+    CASE WHEN i % 11 = 0 THEN NULL ELSE ({_array([u[0] for u in UNITS])})[1 + i % {len(UNITS)}] END,
+    -- roughly 20% pending, 50% classified, 30% closed
+    (CASE WHEN hashint % 10 < 2 THEN 'pending' WHEN hashint % 10 < 7 THEN 'classified' ELSE 'closed' END)
+        ::movement_status,
+    day,
+    jsonb_build_array(({_array(TAGS)})[1 + hashint % {len(TAGS)}]),
+    day + make_interval(secs => hashint % 86400),
+    day + make_interval(secs => hashint % 86400)
+FROM (
+    SELECT i,
+           hashint,
+           DATE '{END_DATE}' - hashint % {DAYS} AS day
+    FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS i,
+         LATERAL (SELECT hashint8(i) & 2147483647 AS hashint) AS h
+) AS g
+ON CONFLICT (id, date) DO NOTHING
+"""
+
+_COUNT_OWNED = text(f"SELECT count(*) FROM movements WHERE owner_id = '{OWNER_ID}'")
+
+
+async def ensure_scale(engine: AsyncEngine, rows: int) -> int:
+    """
+    Seed reference data and movements until the benchmark owner has at least
+    `rows` movements; returns the final count. Tables must already exist (the
+    API creates them on startup).
+    """
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, firebase_uid, display_name, role, created_at, updated_at) "
+                "VALUES (:id, :uid, 'Benchmark', 'user', :now, :now) ON CONFLICT (id) DO NOTHING"
+            ),
+            {"id": OWNER_ID, "uid": OWNER_UID, "now": END_DATE},
+        )
+        for unit_id, name, unit_type in UNITS:
+            await conn.execute(
+                text(
+                    "INSERT INTO business_units (id, owner_id, name, type, created_at) "
+                    "VALUES (:id, :owner_id, :name, :type, :now) ON CONFLICT (id) DO NOTHING"
+                ),
+                {"id": unit_id, "owner_id": OWNER_ID, "name": name, "type": unit_type, "now": END_DATE},
+            )
+        for name in TAGS:
+            await conn.execute(
+                text(
+                    "INSERT INTO tags (id, owner_id, name, created_at) "
+                    "VALUES (:id, :owner_id, :name, :now) ON CONFLICT (id) DO NOTHING"
+                ),
+                {"id": f"bench-tag-{name.lower()}", "owner_id": OWNER_ID, "name": name, "now": END_DATE},
+            )
+        count = (await conn.execute(_COUNT_OWNED)).scalar()
+
+    if count >= rows:
+        logger.info(f"movements already holds {count} rows, not seeding")
+        return count
+
+    started = time.perf_counter()
+    # One partition per month of the date range rather than everything in the default partition (see partitions.py)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"SELECT movements_ensure_partitions(DATE '{END_DATE}' - {DAYS}, DATE '{END_DATE}')"))
+    # Row numbers continue after the existing rows so growing a dataset keeps the old ones
+    for first in range(count + 1, rows + 1, BATCH_SIZE):
+        last = min(first + BATCH_SIZE - 1, rows)
+        async with engine.begin() as conn:
+            await conn.execute(text(_INSERT_MOVEMENTS), {"first": first, "last": last})
+        logger.info(f"seeded {last}/{rows} movements")
+
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE movements"))
+        await conn.execute(text("ANALYZE kpi_daily_rollups"))
+        count = (await conn.execute(_COUNT_OWNED)).scalar()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"seeded to {count} movements in {elapsed:.1f}s")
+    return count
+
+
+async def undo_writes(engine: AsyncEngine, created, classified) -> None:
+    """Put the dataset back the way a run found it: drop created movements, reopen classified ones."""
+    async with engine.begin() as conn:
+        if created:
+            await conn.execute(text("DELETE FROM movements WHERE id = ANY(:ids)"), {"ids": list(created)})
+        if classified:
+            await conn.execute(
+                text("UPDATE movements SET status = 'pending' WHERE id = ANY(:ids)"), {"ids": list(classified)}
+            )
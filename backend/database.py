@@ -1,17 +1,154 @@
+from sqlalchemy import Table, exc
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from pathlib import Path
 from dotenv import load_dotenv
+from typing import Sequence
+import asyncio
+import logging
 import os
+import time
+import uuid
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / ".env")
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.environ["DATABASE_URL"]
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Pool settings are per process: with N uvicorn workers Postgres sees up to
+# N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections from this app.
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # seconds; -1 keeps connections forever
+POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", True)
+POOL_PREWARM = int(os.environ.get("DB_POOL_PREWARM", str(POOL_SIZE)))  # connections opened at startup
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "100"))
+# PgBouncer in transaction pooling mode hands each transaction a different server
+# connection, so statements prepared on one are missing (or clash) on the next.
+PGBOUNCER = _env_flag("DB_PGBOUNCER", False)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how often and how long checkouts wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # Only a full pool makes a checkout wait; opening an overflow connection is not queueing
+        if self._max_overflow < 0 or self.checkedout() < self.size() + self._max_overflow:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.waits += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "waits": self.waits,
+            "wait_time_ms": round(self.wait_time * 1000, 1),
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "timeouts": self.timeouts,
+        }
+
+
+def _connect_args() -> dict:
+    if PGBOUNCER:
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            # Unnamed statements still exist for a moment; unique names avoid "already exists"
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    # SQLAlchemy prepares statements itself (prepared_statement_cache_size); asyncpg's own cache is kept in step
+    return {"statement_cache_size": STATEMENT_CACHE_SIZE, "prepared_statement_cache_size": STATEMENT_CACHE_SIZE}
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=POOL_PRE_PING,
+    connect_args=_connect_args() if DATABASE_URL.startswith("postgresql+asyncpg") else {},
+)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+def pool_stats() -> dict:
+    return engine.pool.stats()
+
+
+async def warm_pool(count: int = POOL_PREWARM) -> None:
+    """Open `count` connections now so the first requests don't pay for the handshakes."""
+    count = min(count, POOL_SIZE)
+    if count <= 0:
+        return
+    connections = await asyncio.gather(*(engine.connect() for _ in range(count)), return_exceptions=True)
+    for conn in connections:
+        if isinstance(conn, BaseException):
+            logger.warning(f"Could not pre-warm a database connection: {conn}")
+        else:
+            await conn.close()
+
+
+async def dispose_engine() -> None:
+    await engine.dispose()
+
+
 async def get_db():
     async with async_session() as session:
         yield session
+
+
+async def copy_records(db: AsyncSession, table: Table, columns: Sequence[str], records: Sequence[tuple]) -> None:
+    """
+    Bulk-load `records` (tuples in `columns` order) into `table` within the
+    session's current transaction. Uses COPY on asyncpg and a multi-row
+    INSERT on other drivers.
+    """
+    conn = await db.connection()
+    if conn.dialect.driver == "asyncpg":
+        raw = (await conn.get_raw_connection()).driver_connection
+        if "owner_id" in db.info:
+            # Postgres refuses COPY FROM into tables whose row security policies apply; sessions scoped
+            # for them (TENANT_RLS, see tenancy.py) COPY into a temporary table and move the rows with a
+            # single INSERT ... SELECT, so the policies are checked and statement triggers fire once
+            staging, names = f"copy_{table.name}", ", ".join(columns)
+            await raw.execute(
+                f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {names} FROM {table.name} WITH NO DATA"
+            )
+            await raw.copy_records_to_table(staging, columns=list(columns), records=records)
+            await raw.execute(f"INSERT INTO {table.name} ({names}) SELECT {names} FROM {staging}")
+            await raw.execute(f"DROP TABLE {staging}")
+        else:
+            await raw.copy_records_to_table(table.name, columns=list(columns), records=records)
+    else:
+        await conn.execute(table.insert(), [dict(zip(columns, record)) for record in records])
@@ -0,0 +1,133 @@
+"""
+Conditional GET for list and KPI endpoints.
+
+Every write statement on a versioned table bumps the counters in
+`table_versions` of each owner whose rows it touched (statement-level
+triggers reading the transition tables, same transaction as the write).
+An endpoint's ETag hashes its path, query string, the caller and the
+caller's counters for the tables it reads, so checking If-None-Match costs
+one primary-key lookup and a 304 skips the real query and serialization
+entirely.
+
+The counters are read before the endpoint's own query: a write landing in
+between can only make the ETag older than the body, which costs the client
+one extra 200 later, never a stale 304.
+
+A counter row is locked by every write transaction on its owner's rows
+until that transaction commits, so concurrent writers of one tenant
+serialize on it for the (short) rest of their transaction; other tenants
+are not affected.
+"""
+import hashlib
+from typing import Callable, Set
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import DDL, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from models import BusinessUnit, Movement, Tag, TableVersion
+from tenancy import get_owner_id
+
+
+def _bump(owners: str) -> str:
+    """Bump (or create) the counter of every owner in `owners` (a query returning owner_id)."""
+    return f"""
+        INSERT INTO table_versions AS v (table_name, owner_id, version)
+        SELECT DISTINCT TG_TABLE_NAME, coalesce(owner_id, ''), 1 FROM ({owners}) AS changed
+        ORDER BY 2
+        ON CONFLICT (table_name, owner_id) DO UPDATE SET version = v.version + 1;"""
+
+
+# Transition tables only exist for the events that define them, hence one branch per event
+VERSION_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{_bump("SELECT owner_id FROM new_rows")}
+    ELSIF TG_OP = 'DELETE' THEN{_bump("SELECT owner_id FROM old_rows")}
+    ELSIF TG_OP = 'UPDATE' THEN{_bump("SELECT owner_id FROM new_rows UNION SELECT owner_id FROM old_rows")}
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+VERSION_TRIGGERS = [
+    """CREATE TRIGGER {table}_version_insert AFTER INSERT ON {table}
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump()""",
+    """CREATE TRIGGER {table}_version_update AFTER UPDATE ON {table}
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump()""",
+    """CREATE TRIGGER {table}_version_delete AFTER DELETE ON {table}
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump()""",
+    """CREATE TRIGGER {table}_version_truncate AFTER TRUNCATE ON {table}
+       FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump()""",
+]
+
+VERSIONED_TABLES = [Movement.__table__, BusinessUnit.__table__, Tag.__table__]
+
+# Bump when the JSON shape of a conditional endpoint changes, so clients don't keep old bodies
+RESPONSE_FORMAT = "1"
+
+CACHE_CONTROL = "private, no-cache"  # clients may keep the body but must revalidate
+
+# Fresh databases are built with metadata.create_all(); install the triggers there too
+for _table in VERSIONED_TABLES:
+    event.listen(_table, "after_create", DDL(VERSION_FUNCTION))
+    for _trigger in VERSION_TRIGGERS:
+        event.listen(_table, "after_create", DDL(_trigger.format(table=_table.name)))
+
+
+def _if_none_match(header: str) -> Set[str]:
+    """Entity tags of an If-None-Match header; weak tags compare equal to strong ones here."""
+    tags = set()
+    for tag in header.split(","):
+        tag = tag.strip()
+        tags.add(tag[2:] if tag.startswith("W/") else tag)
+    return tags
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already covers `etag`."""
+    header = request.headers.get("if-none-match")
+    return bool(header) and (header.strip() == "*" or etag in _if_none_match(header))
+
+
+def conditional(*tables: str) -> Callable:
+    """
+    Dependency for GET endpoints whose body depends only on the request URL
+    and the caller's rows of `tables`: sets ETag, and answers a matching
+    If-None-Match with 304 before the endpoint runs.
+    """
+    async def check(
+        request: Request,
+        response: Response,
+        owner_id: str = Depends(get_owner_id),
+        db: AsyncSession = Depends(get_db),
+    ) -> None:
+        result = await db.execute(
+            select(TableVersion.table_name, TableVersion.version).where(
+                TableVersion.owner_id == owner_id, TableVersion.table_name.in_(tables)
+            )
+        )
+        versions = dict(result.all())
+        key = "|".join([
+            RESPONSE_FORMAT,
+            request.url.path,
+            owner_id,
+            str(sorted(request.query_params.multi_items())),
+            *(f"{table}:{versions.get(table, 0)}" for table in tables),
+        ])
+        etag = '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+        if not_modified(request, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return check
@@ -0,0 +1,97 @@
+"""
+Streaming movement exports (CSV / NDJSON).
+
+Rows are read through a server-side cursor in fixed-size batches and
+rendered batch by batch, so memory stays flat whatever the row count.
+Rows of archived months (see archive.py) come in as a second sorted stream
+and are merged in export order.
+"""
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy.sql import Select
+
+import archive
+from database import async_session
+from models import Movement
+
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_COLUMNS = [
+    Movement.id, Movement.date, Movement.type, Movement.amount, Movement.currency,
+    Movement.description, Movement.responsible, Movement.business_unit_id,
+    Movement.status, Movement.tags, Movement.created_at, Movement.updated_at,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def _export_order(row) -> tuple:
+    return row["date"], row["created_at"], row["id"]
+
+
+def _plain(value):
+    """Render typed column values the way the JSON API does."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):  # also datetime
+        return value.isoformat()
+    return value
+
+
+def _render_csv(rows: List[Dict]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            ";".join(row["tags"] or []) if field == "tags" else _plain(row[field])
+            for field in EXPORT_FIELDS
+        ])
+    return buffer.getvalue()
+
+
+def _render_ndjson(rows: List[Dict]) -> str:
+    return "".join(
+        json.dumps({field: _plain(value) for field, value in row.items()}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_FIELDS)
+    return buffer.getvalue()
+
+
+FORMATS: Dict[str, tuple] = {
+    # format: (media type, header, batch renderer)
+    "csv": ("text/csv; charset=utf-8", _csv_header, _render_csv),
+    "ndjson": ("application/x-ndjson", lambda: "", _render_ndjson),
+}
+
+
+async def stream_export(
+    query: Select,
+    render: Callable[[List[Dict]], str],
+    header: str = "",
+    session_info: Optional[Dict] = None,
+    archived: Optional[AsyncIterator[List[Dict]]] = None,
+) -> AsyncIterator[str]:
+    """
+    Yield the rendered rows of `query` batch by batch, merged with the
+    `archived` batches (already in export order) when given.
+    Opens its own session (with `session_info`, see tenancy.py): the request's
+    session is closed before a streaming body is sent.
+    """
+    if header:
+        yield header
+    async with async_session(info=session_info or {}) as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        batches = result.mappings().partitions()
+        if archived is not None:
+            batches = archive.merge_sorted(batches, archived, _export_order)
+        async for batch in batches:
+            yield render(batch)
@@ -1,20 +1,42 @@
 """
 Firebase Admin SDK initialization and authentication utilities
+
+ID tokens are verified locally (RS256 against Google's published signing
+keys, held in a SigningKeyStore that this module refreshes itself). The
+Admin SDK is only used for revocation checks.
 """
 import os
+import re
 import json
+import time
+import asyncio
+import hashlib
 import logging
 from functools import lru_cache
-from typing import Optional
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import httpx
+import jwt
 import firebase_admin
 from firebase_admin import credentials, auth
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+
+from cache import TTLCache
+import metrics
 
 logger = logging.getLogger(__name__)
 
 security = HTTPBearer(auto_error=False)
 
+# Revocation checks need a fresh lookup on every request, so they bypass the cache
+CHECK_REVOKED = os.environ.get("FIREBASE_CHECK_REVOKED", "").lower() in ("1", "true", "yes")
+
+# Decoded claims keyed by SHA-256 of the ID token, each expiring at the token's `exp`
+_token_cache = TTLCache(maxsize=int(os.environ.get("FIREBASE_TOKEN_CACHE_SIZE", "10000")))
+
 
 @lru_cache()
 def get_firebase_app():
@@ -50,9 +72,227 @@ def get_firebase_app():
     return None
 
 
-def verify_firebase_token(id_token: str) -> dict:
+@lru_cache()
+def get_project_id() -> Optional[str]:
+    """Firebase project that ID tokens must be issued for (aud / iss claims)."""
+    project_id = os.environ.get("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    app = get_firebase_app()
+    return app.project_id if app else None
+
+
+# --- Signing keys ---
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+
+# A key source returns ({kid: PEM certificate or public key}, max_age seconds or None)
+KeySource = Callable[[], Awaitable[Tuple[Dict[str, str], Optional[float]]]]
+
+
+def _parse_max_age(cache_control: Optional[str]) -> Optional[float]:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return float(match.group(1)) if match else None
+
+
+async def google_key_source() -> Tuple[Dict[str, str], Optional[float]]:
+    """Fetch Google's securetoken certificates, honoring Cache-Control max-age."""
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.get(GOOGLE_CERTS_URL)
+        response.raise_for_status()
+    return response.json(), _parse_max_age(response.headers.get("cache-control"))
+
+
+def static_key_source(keys: Dict[str, str], max_age: Optional[float] = None) -> KeySource:
+    """Key source serving a fixed keyset, for tests and benchmarks."""
+    async def source():
+        return dict(keys), max_age
+    return source
+
+
+def file_key_source(path: str) -> KeySource:
+    """Key source reading a {kid: PEM} JSON file on every refresh."""
+    async def source():
+        with open(path) as f:
+            return json.load(f), None
+    return source
+
+
+def _load_public_key(pem: str):
+    data = pem.encode()
+    if b"BEGIN CERTIFICATE" in data:
+        return x509.load_pem_x509_certificate(data).public_key()
+    return load_pem_public_key(data)
+
+
+class SigningKeyStore:
     """
-    Verify a Firebase ID token and return the decoded claims.
+    In-process cache of the public keys that sign Firebase ID tokens.
+
+    Keys are kept until the source's max-age expires and are refreshed in
+    the background `refresh_margin` seconds before that. A token signed
+    with an unknown kid triggers an early refresh (key rotation), at most
+    once every `min_refresh_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        source: KeySource,
+        default_max_age: float = 3600,
+        refresh_margin: float = 300,
+        min_refresh_interval: float = 30,
+    ):
+        self.source = source
+        self.default_max_age = default_max_age
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.expires_at = 0.0
+        self.refreshed_at = 0.0
+        self._keys: Dict[str, object] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def set_source(self, source: KeySource) -> None:
+        """Swap the key source (e.g. a local keyset) and drop the cached keys."""
+        self.source = source
+        self._keys = {}
+        self.expires_at = 0.0
+        self.refreshed_at = 0.0
+
+    async def refresh(self) -> None:
+        requested_at = time.time()
+        async with self._lock:
+            if self.refreshed_at >= requested_at:
+                return  # a concurrent caller refreshed while we waited
+            pems, max_age = await self.source()
+            self._keys = {kid: _load_public_key(pem) for kid, pem in pems.items()}
+            self.refreshed_at = time.time()
+            self.expires_at = self.refreshed_at + (max_age if max_age is not None else self.default_max_age)
+            logger.info(f"Loaded {len(self._keys)} Firebase signing keys (valid {int(self.expires_at - self.refreshed_at)}s)")
+
+    async def get_key(self, kid: str):
+        now = time.time()
+        if not self._keys or now >= self.expires_at:
+            await self.refresh()
+        elif kid not in self._keys and now - self.refreshed_at >= self.min_refresh_interval:
+            await self.refresh()
+        return self._keys.get(kid)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            delay = max(self.expires_at - self.refresh_margin - time.time(), 5)
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the current keys; get_key() refreshes inline once they expire
+                logger.warning(f"Firebase signing key refresh failed: {e}")
+                self.expires_at = max(self.expires_at, time.time() + self.refresh_margin + 30)
+
+    async def start(self) -> None:
+        """Pre-warm the keys and keep them fresh in the background."""
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Could not pre-warm Firebase signing keys: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "expires_in": max(int(self.expires_at - time.time()), 0),
+        }
+
+
+def _default_key_source() -> KeySource:
+    path = os.environ.get("FIREBASE_SIGNING_KEYS_FILE")
+    return file_key_source(path) if path else google_key_source
+
+
+key_store = SigningKeyStore(_default_key_source())
+
+
+def set_key_source(source: KeySource) -> None:
+    """Hook for tests and benchmarks to verify tokens against a local keyset."""
+    key_store.set_source(source)
+
+
+def decode_firebase_token(id_token: str, key, project_id: str) -> dict:
+    """
+    Check signature and claims of a Firebase ID token with local crypto only.
+    Raises jwt.InvalidTokenError subclasses on failure.
+    """
+    claims = jwt.decode(
+        id_token,
+        key,
+        algorithms=["RS256"],
+        audience=project_id,
+        issuer=f"https://securetoken.google.com/{project_id}",
+        options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+    )
+    sub = claims["sub"]
+    if not isinstance(sub, str) or not sub or len(sub) > 128:
+        raise jwt.InvalidTokenError("Invalid subject")
+    if claims.get("auth_time", 0) > time.time():
+        raise jwt.InvalidTokenError("Token auth_time is in the future")
+    claims["uid"] = sub
+    return claims
+
+
+async def verify_token_locally(id_token: str) -> dict:
+    """
+    Verify a Firebase ID token against the managed key store.
+    The RSA signature check runs in the threadpool; reading the kid from the
+    header (base64 and JSON of a few dozen bytes) costs less than the hop.
+    Bad signatures and claims get 401, a key store that cannot fetch 503.
+    """
+    project_id = get_project_id()
+    if not project_id:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication service not configured"
+        )
+
+    try:
+        header = jwt.get_unverified_header(id_token)
+        if header.get("alg") != "RS256" or not header.get("kid"):
+            raise jwt.InvalidTokenError("Token must be RS256 signed with a kid")
+    except jwt.InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+
+    try:
+        key = await key_store.get_key(header["kid"])
+    except Exception as e:
+        # The keys could not be fetched (network, 5xx): the token itself may be fine
+        logger.error(f"Firebase signing keys unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Authentication keys unavailable")
+
+    try:
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return await run_in_threadpool(decode_firebase_token, id_token, key, project_id)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+    except Exception as e:
+        logger.error(f"Token verification failed: {e}")
+        raise HTTPException(status_code=401, detail="Authentication failed")
+
+
+def verify_firebase_token(id_token: str, check_revoked: bool = False) -> dict:
+    """
+    Verify a Firebase ID token through the Admin SDK and return the decoded claims.
+    Blocking (may fetch keys and, with check_revoked, the user record):
+    call verify_token() from async code.
     """
     app = get_firebase_app()
     if not app:
@@ -62,7 +302,7 @@ def verify_firebase_token(id_token: str) -> dict:
         )
 
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = auth.verify_id_token(id_token, check_revoked=check_revoked)
         return decoded_token
     except auth.ExpiredIdTokenError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -75,6 +315,33 @@ def verify_firebase_token(id_token: str) -> dict:
         raise HTTPException(status_code=401, detail="Authentication failed")
 
 
+async def verify_token(id_token: str) -> dict:
+    """
+    Verify a Firebase ID token without blocking the event loop.
+    Claims of tokens already seen are served from memory until the token expires.
+    """
+    started = time.perf_counter()
+    path = "admin" if CHECK_REVOKED else "cache"
+    try:
+        if CHECK_REVOKED:
+            return await run_in_threadpool(verify_firebase_token, id_token, True)
+
+        key = hashlib.sha256(id_token.encode()).hexdigest()
+        claims = _token_cache.get(key)
+        if claims is None:
+            path = "local"
+            claims = await verify_token_locally(id_token)
+            _token_cache.set(key, claims, expires_at=claims.get("exp"))
+        return dict(claims)
+    finally:
+        metrics.FIREBASE_VERIFY_SECONDS.observe(time.perf_counter() - started, (path,))
+
+
+def token_cache_stats() -> dict:
+    """Size and hit/miss counters of the decoded-token cache, plus signing key state."""
+    return {**_token_cache.stats(), "check_revoked": CHECK_REVOKED, "signing_keys": key_store.stats()}
+
+
 async def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
 ) -> dict:
@@ -88,7 +355,7 @@ async def get_current_user(
             detail="Authorization header required"
         )
 
-    return verify_firebase_token(credentials.credentials)
+    return await verify_token(credentials.credentials)
 
 
 async def get_optional_user(
@@ -102,6 +369,6 @@ async def get_optional_user(
         return None
 
     try:
-        return verify_firebase_token(credentials.credentials)
+        return await verify_token(credentials.credentials)
     except HTTPException:
         return None
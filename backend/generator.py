@@ -0,0 +1,333 @@
+"""
+Synthetic movements for demos, load tests and query tuning.
+
+Generates any number of plausible movements for the configured business
+units, tags, responsables and date range:
+
+- income follows the retail calendar (December aguinaldo peak, busy
+  weekends), expenses cluster on the 1st and 15th (rent, payroll)
+- amounts are log-normal and rounded to 50 colones
+- recent movements are mostly pending, older ones classified; months wholly
+  older than close_after_days at the end of the range are then closed, for
+  every configured unit and for the movements without one (see periods.py)
+
+Rows are produced in batches on a worker thread and loaded with COPY, one
+transaction per batch, so memory stays flat whatever the size. A batch
+that fails (the rows already exist, or fall in a closed period) stops the
+load with a ValueError that says how many rows went in before it.
+Everything is loaded for one owner (tenant). The same seed and settings
+always produce the same rows, ids included; ids are also salted with the
+owner, so different owners can load the same dataset side by side.
+
+    python generator.py --owner <user id> --movements 1000000 --seed 42
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from asyncpg.exceptions import PostgresError, UniqueViolationError
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session, copy_records
+from models import MOVEMENT_COPY_COLUMNS, BusinessUnit, Movement, PeriodClose, Tag
+import partitions
+import periods
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TZ = timezone(timedelta(hours=-6))  # Costa Rica, no DST
+
+DEFAULT_UNITS = ["Sucursal Centro", "Feria del Agricultor", "Tienda en linea"]
+DEFAULT_TAGS = ["SINPE", "Efectivo", "Proveedor", "Planilla", "Servicios"]
+DEFAULT_RESPONSIBLES = ["Maria", "Carlos", "Ana", "Jose"]
+
+INCOME_DESCRIPTIONS = [
+    "Venta de cafe molido", "Ventas feria sabado", "Pedido especial empanadas", "Venta queso fresco",
+    "Cobro SINPE cliente", "Venta pollo asado", "Venta de tamales", "Abono de cliente", "Venta de pan casero",
+]
+EXPENSE_DESCRIPTIONS = [
+    "Compra de bolsas", "Gasolina transporte", "Pago proveedor lacteos", "Recibo de luz", "Compra de harina",
+    "Alquiler local", "Pago de planilla", "Recibo de agua", "Compra de empaques", "Mantenimiento equipo",
+]
+
+# Relative volume by calendar month
+INCOME_MONTHS = {1: 0.8, 2: 0.85, 3: 0.95, 7: 1.05, 11: 1.2, 12: 1.6}
+EXPENSE_MONTHS = {11: 1.2, 12: 1.1}
+INCOME_WEEKDAYS = (0.8, 0.9, 0.9, 1.0, 1.2, 1.5, 1.2)  # Monday first
+PAYDAYS = {1: 3.0, 15: 3.0}
+
+# (median colones, log-normal sigma)
+AMOUNTS = {"income": (15000, 0.9), "expense": (22000, 1.0)}
+
+# Status odds by age in days at the end of the range: (max age, {status: weight}).
+# Movements only become closed with their period, see _close_periods().
+STATUS_BY_AGE = [
+    (14, {"pending": 0.6, "classified": 0.4}),
+    (60, {"pending": 0.15, "classified": 0.85}),
+    (None, {"pending": 0.03, "classified": 0.97}),
+]
+CLOSE_AFTER_DAYS = 60
+
+
+@dataclass
+class GeneratorConfig:
+    movements: int = 1000
+    units: List[str] = field(default_factory=lambda: list(DEFAULT_UNITS))
+    tags: List[str] = field(default_factory=lambda: list(DEFAULT_TAGS))
+    responsibles: List[str] = field(default_factory=lambda: list(DEFAULT_RESPONSIBLES))
+    date_from: Optional[date] = None  # defaults to a year before date_to
+    date_to: Optional[date] = None  # defaults to today
+    income_share: float = 0.6
+    seed: Optional[int] = None  # random when unset; the one used is reported
+    batch_size: int = 50_000
+    close_after_days: Optional[int] = CLOSE_AFTER_DAYS  # None leaves every period open
+
+    def resolve(self) -> "GeneratorConfig":
+        """Fill in the defaults that depend on today or on randomness."""
+        date_to = self.date_to or date.today()
+        date_from = self.date_from or date_to - timedelta(days=365)
+        if date_from > date_to:
+            raise ValueError("date_from must not be after date_to")
+        if self.movements < 1 or self.batch_size < 1:
+            raise ValueError("movements and batch_size must be positive")
+        if not 0 <= self.income_share <= 1:
+            raise ValueError("income_share must be between 0 and 1")
+        if self.close_after_days is not None and self.close_after_days < 0:
+            raise ValueError("close_after_days must not be negative")
+        seed = self.seed if self.seed is not None else random.randrange(2**31)
+        return GeneratorConfig(
+            self.movements, self.units, self.tags, self.responsibles,
+            date_from, date_to, self.income_share, seed, self.batch_size, self.close_after_days,
+        )
+
+
+def _day_weights(days: List[date], months: Dict[int, float], weekdays=None, paydays=None) -> List[float]:
+    weights = []
+    for day in days:
+        weight = months.get(day.month, 1.0)
+        if weekdays:
+            weight *= weekdays[day.weekday()]
+        if paydays:
+            weight *= paydays.get(day.day, 1.0)
+        weights.append(weight)
+    return list(accumulate(weights))
+
+
+def _id_salt(owner_id: str) -> int:
+    return int.from_bytes(hashlib.sha256(owner_id.encode()).digest()[:16], "big")
+
+
+def _new_id(rng: random.Random, salt: int) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128) ^ salt, version=4))
+
+
+def _status_table() -> List[Tuple[Optional[int], List[str], List[float]]]:
+    return [(age, list(odds), list(accumulate(odds.values()))) for age, odds in STATUS_BY_AGE]
+
+
+def generate_rows(config: GeneratorConfig, unit_ids: List[str], owner_id: str) -> Iterator[List[tuple]]:
+    """Yield batches of `owner_id`'s movement records in MOVEMENT_COPY_COLUMNS order for a resolved config."""
+    rng = random.Random(config.seed)
+    salt = _id_salt(owner_id)
+    days = [config.date_from + timedelta(days=n) for n in range((config.date_to - config.date_from).days + 1)]
+    day_weights = {
+        "income": _day_weights(days, INCOME_MONTHS, weekdays=INCOME_WEEKDAYS),
+        "expense": _day_weights(days, EXPENSE_MONTHS, paydays=PAYDAYS),
+    }
+    descriptions = {"income": INCOME_DESCRIPTIONS, "expense": EXPENSE_DESCRIPTIONS}
+    # A few busy units and a long tail
+    unit_weights = list(accumulate(1 / (rank + 1) for rank in range(len(unit_ids))))
+    statuses = _status_table()
+
+    remaining = config.movements
+    while remaining > 0:
+        size = min(config.batch_size, remaining)
+        remaining -= size
+        batch = []
+        for _ in range(size):
+            kind = "income" if rng.random() < config.income_share else "expense"
+            cumulative = day_weights[kind]
+            day = days[bisect_left(cumulative, rng.random() * cumulative[-1])]
+            median, sigma = AMOUNTS[kind]
+            amount = max(round(rng.lognormvariate(math.log(median), sigma) / 50) * 50, 100)
+
+            age = (config.date_to - day).days
+            _, names, odds = next(entry for entry in statuses if entry[0] is None or age <= entry[0])
+            status = names[bisect_left(odds, rng.random() * odds[-1])]
+
+            unit = None
+            if unit_ids and rng.random() < 0.92:
+                unit = unit_ids[bisect_left(unit_weights, rng.random() * unit_weights[-1])]
+            responsible = rng.choice(config.responsibles) if config.responsibles and rng.random() < 0.85 else None
+            tag_count = rng.choices((0, 1, 2), weights=(20, 65, 15))[0]
+            tags = rng.sample(config.tags, min(tag_count, len(config.tags)))
+
+            # Business hours, local time
+            local = datetime(day.year, day.month, day.day, tzinfo=LOCAL_TZ) + timedelta(
+                seconds=rng.randrange(7 * 3600, 21 * 3600)
+            )
+            created_at = local.astimezone(timezone.utc)
+            updated_at = created_at
+            if status != "pending":
+                updated_at += timedelta(minutes=rng.randrange(10, 72 * 60))
+
+            batch.append((
+                _new_id(rng, salt), kind, Decimal(amount), "CRC",
+                rng.choice(descriptions[kind]), responsible, unit, status, day, json.dumps(tags),
+                created_at, updated_at, owner_id,
+            ))
+        yield batch
+
+
+async def _ensure_reference_data(
+    db: AsyncSession, config: GeneratorConfig, owner_id: str
+) -> Tuple[List[str], int, int]:
+    """Ids of the owner's configured units, creating missing units and tags by name."""
+    now = datetime.now(timezone.utc).isoformat()
+    rng = random.Random(f"reference-{config.seed}")
+    salt = _id_salt(owner_id)
+
+    existing = dict(
+        (await db.execute(select(BusinessUnit.name, BusinessUnit.id).where(BusinessUnit.owner_id == owner_id))).all()
+    )
+    new_units = [
+        BusinessUnit(id=_new_id(rng, salt), owner_id=owner_id, name=name, created_at=now)
+        for name in config.units if name not in existing
+    ]
+    existing_tags = set((await db.execute(select(Tag.name).where(Tag.owner_id == owner_id))).scalars())
+    new_tags = [
+        Tag(id=_new_id(rng, salt), owner_id=owner_id, name=name, created_at=now)
+        for name in config.tags if name not in existing_tags
+    ]
+    db.add_all(new_units + new_tags)
+    await db.commit()
+
+    existing.update((unit.name, unit.id) for unit in new_units)
+    return [existing[name] for name in config.units], len(new_units), len(new_tags)
+
+
+async def _close_periods(db: AsyncSession, config: GeneratorConfig, unit_ids: List[str], owner_id: str) -> int:
+    """Close the months of the range older than close_after_days at its end, skipping closed ones."""
+    if config.close_after_days is None:
+        return 0
+    last = min(
+        partitions.month_start(config.date_to - timedelta(days=config.close_after_days)),
+        partitions.month_start(date.today()),
+    )
+    months = []
+    month = partitions.month_start(config.date_from)
+    while month < last:
+        months.append(month)
+        month = partitions.month_start(month, 1)
+    already = set((await db.execute(
+        select(PeriodClose.business_unit_id, PeriodClose.month)
+        .where(PeriodClose.owner_id == owner_id, PeriodClose.month.in_(months))
+    )).all()) if months else set()
+
+    closed = 0
+    for month in months:
+        for unit in unit_ids + [""]:
+            if (unit, month) not in already:
+                await periods.close_period(db, owner_id, unit, month)
+                await db.commit()
+                closed += 1
+    return closed
+
+
+async def generate(db: AsyncSession, config: GeneratorConfig, owner_id: str) -> dict:
+    """Load `config.movements` synthetic movements for `owner_id` and report what was loaded and how fast."""
+    config = config.resolve()
+    started = time.perf_counter()
+    unit_ids, units, tags = await _ensure_reference_data(db, config, owner_id)
+    # Historical months would otherwise pile up in the default partition until the next maintenance run
+    await partitions.ensure_months(db, config.date_from, config.date_to)
+    await db.commit()
+
+    loaded = 0
+    batches = generate_rows(config, unit_ids, owner_id)
+    while True:
+        # Building a batch is pure CPU; keep it off the event loop
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        try:
+            await copy_records(db, Movement.__table__, MOVEMENT_COPY_COLUMNS, batch)
+        except (DBAPIError, PostgresError) as e:  # COPY raises the driver's own errors
+            if isinstance(e, (IntegrityError, UniqueViolationError)):
+                reason = f"Movements from seed {config.seed} already exist for this owner"
+            else:
+                reason = periods.closed_period_message(e)
+                if reason is None:
+                    raise
+            await db.rollback()
+            raise ValueError(f"{reason}; {loaded} of {config.movements} movements were loaded before it") from e
+        await db.commit()
+        loaded += len(batch)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Generated {loaded}/{config.movements} movements ({loaded / elapsed:,.0f} rows/s)")
+
+    closed = await _close_periods(db, config, unit_ids, owner_id)
+    elapsed = time.perf_counter() - started
+    return {
+        "movements": loaded,
+        "units_created": units,
+        "tags_created": tags,
+        "periods_closed": closed,
+        "seed": config.seed,
+        "date_from": config.date_from.isoformat(),
+        "date_to": config.date_to.isoformat(),
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(loaded / elapsed) if elapsed else 0,
+    }
+
+
+def _names(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Load synthetic movements")
+    parser.add_argument("--owner", required=True, help="id of the user (tenant) who owns the movements")
+    parser.add_argument("--movements", type=int, default=1000)
+    parser.add_argument("--seed", type=int, help="fixed seed for a reproducible dataset")
+    parser.add_argument("--units", type=_names, default=DEFAULT_UNITS, help="comma-separated unit names")
+    parser.add_argument("--tags", type=_names, default=DEFAULT_TAGS, help="comma-separated tag names")
+    parser.add_argument("--responsibles", type=_names, default=DEFAULT_RESPONSIBLES, help="comma-separated names")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="first date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="last date (YYYY-MM-DD)")
+    parser.add_argument("--income-share", type=float, default=0.6)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    # Off by default: the owner's real movements in those months would be frozen too
+    parser.add_argument("--close-after-days", type=int,
+                        help="close the months older than this at the end of the range (default: none)")
+    args = parser.parse_args()
+
+    config = GeneratorConfig(
+        movements=args.movements, units=args.units, tags=args.tags, responsibles=args.responsibles,
+        date_from=args.date_from, date_to=args.date_to, income_share=args.income_share,
+        seed=args.seed, batch_size=args.batch_size,
+        close_after_days=args.close_after_days,
+    )
+    async with async_session() as db:
+        report = await generate(db, config, args.owner)
+    logger.info(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    raise SystemExit(asyncio.run(_main()))
@@ -0,0 +1,175 @@
+"""
+Import pipeline for bank statements and SINPE Móvil notifications.
+
+Parsers are registered by name in PARSERS. Uploads are decoded and parsed
+as a stream of chunks and the resulting movements are inserted as
+`pending` in batches. Each movement carries a fingerprint (source, bank
+reference, amount, date) backed by a unique index per owner, so re-importing an
+overlapping statement skips the lines already stored. Undated notifications
+are stored under the import day, so theirs are looked up on any date.
+"""
+import codecs
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from importers import bank_csv, sinpe
+from importers.base import ParsedMovement, ParseError, StatementParser
+from models import Movement
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+PARSERS: Dict[str, Callable[[], StatementParser]] = {
+    "bcr": bank_csv.bcr,
+    "bn": bank_csv.bn,
+    "bac": bank_csv.bac,
+    "csv": bank_csv.generic,
+    "sinpe": sinpe.SinpeNotificationParser,
+}
+
+
+def register_parser(name: str, factory: Callable[[], StatementParser]) -> None:
+    """Add an import format; `factory` must return a fresh parser per upload."""
+    PARSERS[name] = factory
+
+
+def get_parser(name: str) -> Optional[StatementParser]:
+    factory = PARSERS.get(name)
+    return factory() if factory else None
+
+
+def list_parsers() -> List[dict]:
+    return [{"name": name, "label": factory().label} for name, factory in PARSERS.items()]
+
+
+async def _lines(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[str]:
+    """Decode a byte stream incrementally and yield complete lines."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _insert_batch(
+    db: AsyncSession,
+    source: str,
+    batch: List[tuple],
+    owner_id: str,
+    business_unit_id: Optional[str],
+) -> int:
+    """Insert (movement, fingerprint) pairs, skipping fingerprints the owner already has. Returns rows inserted."""
+    undated = [fingerprint for m, fingerprint in batch if m.undated]
+    if undated:
+        # The unique index includes the date, which differs from one import day to the next
+        stored = await db.execute(
+            select(Movement.fingerprint).where(Movement.owner_id == owner_id, Movement.fingerprint.in_(undated))
+        )
+        known = set(stored.scalars())
+        batch = [(m, fingerprint) for m, fingerprint in batch if fingerprint not in known]
+        if not batch:
+            return 0
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "owner_id": owner_id,
+            "type": m.type,
+            "amount": m.amount,
+            "currency": "CRC",
+            "description": m.description,
+            "responsible": None,
+            "business_unit_id": business_unit_id,
+            "status": "pending",
+            "date": m.date,
+            "tags": m.tags,
+            "fingerprint": fingerprint,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for m, fingerprint in batch
+    ]
+    stmt = (
+        pg_insert(Movement)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[Movement.owner_id, Movement.fingerprint, Movement.date])
+        .returning(Movement.id)
+    )
+    result = await db.execute(stmt)
+    inserted = len(result.all())
+    await db.commit()
+    return inserted
+
+
+async def run_import(
+    db: AsyncSession,
+    parser: StatementParser,
+    chunks: AsyncIterator[bytes],
+    owner_id: str,
+    business_unit_id: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict:
+    """
+    Parse `chunks` with `parser` and store the movements in batches, owned by `owner_id`.
+    Each batch commits on its own: an interrupted import can simply be re-run.
+    """
+    stats = {"parser": parser.name, "lines": 0, "parsed": 0, "inserted": 0, "duplicates": 0, "errors": []}
+    batch: List[tuple] = []
+    # Identical lines within one upload are told apart by their order in it
+    occurrences: Counter = Counter()
+
+    def add(movements: List[ParsedMovement]):
+        for m in movements:
+            base = m.fingerprint(parser.name)
+            occurrences[base] += 1
+            n = occurrences[base]
+            batch.append((m, base if n == 1 else m.fingerprint(parser.name, occurrence=n)))
+        stats["parsed"] += len(movements)
+
+    async def flush():
+        if batch:
+            inserted = await _insert_batch(db, parser.name, batch, owner_id, business_unit_id)
+            stats["inserted"] += inserted
+            stats["duplicates"] += len(batch) - inserted
+            batch.clear()
+
+    def record_error(line_no: int, error: Exception):
+        if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+            stats["errors"].append({"line": line_no, "error": str(error)})
+
+    async for line in _lines(chunks, parser.encoding):
+        stats["lines"] += 1
+        try:
+            parsed = parser.feed(line)
+        except ParseError as e:
+            record_error(stats["lines"], e)
+            continue
+        add(parsed)
+        if len(batch) >= batch_size:
+            await flush()
+
+    try:
+        add(parser.finish())
+    except ParseError as e:
+        record_error(stats["lines"], e)
+    await flush()
+
+    logger.info(
+        f"Import {parser.name}: {stats['inserted']} inserted, {stats['duplicates']} duplicates, "
+        f"{len(stats['errors'])} errors"
+    )
+    return stats
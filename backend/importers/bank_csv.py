@@ -0,0 +1,117 @@
+"""
+Bank statement CSV layouts (BCR, Banco Nacional, BAC Credomatic).
+
+Statements start with a preamble (account, period, balances) followed by
+a header row. Columns are located by header name, so the same parser
+handles the small variations between exports of one bank; each layout
+only declares the header names it uses and its file encoding.
+"""
+import csv
+from typing import Dict, List, Optional, Sequence
+
+from importers.base import ParsedMovement, ParseError, StatementParser, normalize, parse_amount, parse_date
+
+# Logical column -> accepted header names (normalized: lowercase, no accents)
+COMMON_HEADERS: Dict[str, Sequence[str]] = {
+    "date": ("fecha", "fecha movimiento", "fecha de movimiento", "fecha transaccion",
+             "fecha de transaccion", "fecha contable", "fecha valor"),
+    "reference": ("referencia", "numero de referencia", "documento", "numero de documento",
+                  "comprobante", "no. documento", "num. documento", "referencia de transaccion"),
+    "description": ("descripcion", "concepto", "detalle", "descripcion de transaccion", "descripcion del movimiento"),
+    "debit": ("debito", "debitos", "debito de transaccion", "retiros", "cargos", "monto debito"),
+    "credit": ("credito", "creditos", "credito de transaccion", "depositos", "abonos", "monto credito"),
+    "amount": ("monto", "importe", "monto de transaccion"),
+}
+
+
+class CsvStatementParser(StatementParser):
+    delimiters = (";", ",", "\t")
+
+    def __init__(self, name: str, label: str, tag: str, encoding: str = "utf-8-sig",
+                 headers: Optional[Dict[str, Sequence[str]]] = None):
+        self.name = name
+        self.label = label
+        self.tag = tag
+        self.encoding = encoding
+        self.headers = {key: tuple(COMMON_HEADERS[key]) + tuple((headers or {}).get(key, ()))
+                        for key in COMMON_HEADERS}
+        self._columns: Optional[Dict[str, int]] = None
+        self._delimiter = ","
+
+    def _match_header(self, line: str) -> Optional[Dict[str, int]]:
+        for delimiter in self.delimiters:
+            if delimiter not in line:
+                continue
+            cells = [normalize(cell) for cell in next(csv.reader([line], delimiter=delimiter))]
+            columns = {}
+            for key, names in self.headers.items():
+                for index, cell in enumerate(cells):
+                    if cell in names and key not in columns:
+                        columns[key] = index
+            has_amount = "amount" in columns or "debit" in columns or "credit" in columns
+            if "date" in columns and has_amount:
+                self._delimiter = delimiter
+                return columns
+        return None
+
+    def feed(self, line: str) -> List[ParsedMovement]:
+        if not line.strip():
+            return []
+        if self._columns is None:
+            # Still in the preamble: wait for the header row
+            self._columns = self._match_header(line)
+            return []
+
+        cells = next(csv.reader([line], delimiter=self._delimiter))
+        cols = self._columns
+
+        def cell(key: str) -> str:
+            index = cols.get(key)
+            return cells[index].strip() if index is not None and index < len(cells) else ""
+
+        date_text = cell("date")
+        if not date_text:
+            return []
+        try:
+            movement_date = parse_date(date_text)
+        except ParseError:
+            # Footer rows (totals, balances) have no date in the date column
+            if not any(c.isdigit() for c in date_text):
+                return []
+            raise
+
+        debit = abs(parse_amount(cell("debit"))) if cell("debit") else 0.0
+        credit = abs(parse_amount(cell("credit"))) if cell("credit") else 0.0
+        if not debit and not credit and cell("amount"):
+            signed = parse_amount(cell("amount"))
+            credit, debit = (signed, 0.0) if signed >= 0 else (0.0, -signed)
+        if not debit and not credit:
+            raise ParseError("Line has no amount")
+
+        return [ParsedMovement(
+            date=movement_date,
+            amount=credit or debit,
+            type="income" if credit else "expense",
+            description=cell("description"),
+            reference=cell("reference"),
+            tags=[self.tag],
+        )]
+
+
+def bcr() -> CsvStatementParser:
+    return CsvStatementParser("bcr", "Banco de Costa Rica (CSV)", "BCR", encoding="latin-1")
+
+
+def bn() -> CsvStatementParser:
+    return CsvStatementParser("bn", "Banco Nacional (CSV)", "BN", encoding="latin-1",
+                              headers={"reference": ("oficina referencia",)})
+
+
+def bac() -> CsvStatementParser:
+    return CsvStatementParser("bac", "BAC Credomatic (CSV)", "BAC",
+                              headers={"date": ("fecha de la transaccion",),
+                                       "description": ("descripcion de la transaccion",)})
+
+
+def generic() -> CsvStatementParser:
+    return CsvStatementParser("csv", "Estado de cuenta genérico (CSV)", "Banco")
@@ -0,0 +1,118 @@
+"""
+Parser interface and value parsing shared by all import formats.
+"""
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import List, Optional
+
+
+class ParseError(ValueError):
+    """A line or message could not be turned into a movement."""
+
+
+@dataclass
+class ParsedMovement:
+    date: date
+    amount: float
+    type: str  # income | expense
+    description: str = ""
+    reference: str = ""
+    tags: List[str] = field(default_factory=list)
+    undated: bool = False  # `date` is the parser's default, not read from the line
+
+    def fingerprint(self, source: str, occurrence: int = 1) -> str:
+        """
+        Stable identity of a bank line: source, bank reference, amount and date.
+        Lines without a reference fall back to their description; `occurrence`
+        numbers repeated identical lines within one upload. An undated line
+        leaves the date out, since it changes with the day of the import.
+        """
+        key = self.reference or f"desc:{normalize(self.description)}"
+        when = "undated" if self.undated else self.date.isoformat()
+        raw = f"{source}|{key}|{self.type}|{self.amount:.2f}|{when}"
+        if occurrence > 1:
+            raw += f"|{occurrence}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class StatementParser:
+    """
+    Incremental parser: receives decoded lines one at a time via feed() and
+    returns the movements completed so far; finish() flushes any tail.
+    A new instance is created for every upload.
+    """
+    name = ""
+    label = ""
+    encoding = "utf-8-sig"
+
+    def feed(self, line: str) -> List[ParsedMovement]:
+        raise NotImplementedError
+
+    def finish(self) -> List[ParsedMovement]:
+        return []
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free, single-spaced text for header and keyword matching."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+_CURRENCY = re.compile(r"(₡|¢|crc|colones|\$|usd)", re.IGNORECASE)
+
+
+def parse_amount(text: str) -> float:
+    """
+    Parse amounts as written by Costa Rican banks: "₡1,234.56", "1.234,56",
+    "1 234,56", "-500", "(500.00)". Returns a signed float.
+    """
+    raw = _CURRENCY.sub("", text or "").replace("\u00a0", " ").strip()
+    negative = raw.startswith("-") or raw.endswith("-") or (raw.startswith("(") and raw.endswith(")"))
+    digits = re.sub(r"[^\d.,]", "", raw)
+    if not re.search(r"\d", digits):
+        raise ParseError(f"Invalid amount: {text!r}")
+
+    last_dot, last_comma = digits.rfind("."), digits.rfind(",")
+    if last_dot >= 0 and last_comma >= 0:
+        decimal = "." if last_dot > last_comma else ","
+    elif last_comma >= 0:
+        decimal = "," if digits.count(",") == 1 and len(digits) - last_comma - 1 in (1, 2) else None
+    elif last_dot >= 0:
+        # "1.500" and "1.500.000" use dots for thousands; amounts never carry 3 decimals
+        decimal = "." if digits.count(".") == 1 and len(digits) - last_dot - 1 != 3 else None
+    else:
+        decimal = None
+
+    if decimal:
+        whole, _, frac = digits.rpartition(decimal)
+        digits = re.sub(r"[.,]", "", whole) + "." + frac
+    else:
+        digits = re.sub(r"[.,]", "", digits)
+
+    value = float(digits)
+    return -value if negative else value
+
+
+_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y", "%Y/%m/%d", "%d.%m.%Y")
+
+
+def parse_date(text: str) -> date:
+    """Parse day-first dates (dd/mm/yyyy and variants) and ISO dates."""
+    value = (text or "").strip().split(" ")[0]
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ParseError(f"Invalid date: {text!r}")
+
+
+def optional_date(text: Optional[str]) -> Optional[date]:
+    try:
+        return parse_date(text) if text else None
+    except ParseError:
+        return None
@@ -0,0 +1,98 @@
+"""
+SINPE Móvil notification messages (SMS and e-mail text).
+
+Messages are separated by blank lines. Exports with one SMS per line and
+no blank lines are also accepted: a block whose lines each read as a
+complete notification is split into one movement per line.
+"""
+import re
+from datetime import date
+from typing import List, Optional
+
+from importers.base import ParsedMovement, ParseError, StatementParser, normalize, optional_date, parse_amount
+
+_AMOUNT = re.compile(
+    r"(?:₡|¢|CRC|colones)\s*(\d[\d.,\s]*\d|\d)|(\d[\d.,]*\d|\d)\s*(?:colones|CRC)",
+    re.IGNORECASE,
+)
+_REFERENCE = re.compile(
+    r"(?:comprobante|referencia|ref|documento|transacci[oó]n)\.?\s*(?:n[oº°]\.?|#|:)?\s*([A-Z0-9-]*\d[A-Z0-9-]{3,})",
+    re.IGNORECASE,
+)
+_DATE = re.compile(r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2})\b")
+_DETAIL = re.compile(r"(?:descripci[oó]n|detalle|concepto|motivo)\s*:\s*([^\n.]+)", re.IGNORECASE)
+_WORD = r"[A-ZÁÉÍÓÚÑÜ][A-ZÁÉÍÓÚÑÜ.]*(?![a-záéíóúñü])"  # an all-caps word, not the capital of "Referencia"
+_NAME = rf"({_WORD}(?:\s+{_WORD})*)"
+_FROM = re.compile(r"\bde\s+" + _NAME)
+_TO = re.compile(r"\ba\s+" + _NAME)
+
+_INCOME_WORDS = ("recib", "acredit", "deposit", "ingres")
+_EXPENSE_WORDS = ("envi", "pago", "pagado", "debit", "transferiste", "transfirio", "rebaj", "retir")
+
+
+class SinpeNotificationParser(StatementParser):
+    name = "sinpe"
+    label = "Notificaciones SINPE Móvil (SMS / correo)"
+    tag = "SINPE"
+
+    def __init__(self, default_date: Optional[date] = None):
+        self.default_date = default_date or date.today()
+        self._block: List[str] = []
+
+    def parse_message(self, text: str) -> ParsedMovement:
+        words = normalize(text)
+        if "sinpe" not in words and not any(w in words for w in _INCOME_WORDS + _EXPENSE_WORDS):
+            raise ParseError("Not a SINPE notification")
+
+        amount_match = _AMOUNT.search(text)
+        if not amount_match:
+            raise ParseError("Notification has no amount")
+        amount = abs(parse_amount(amount_match.group(1) or amount_match.group(2)))
+
+        if any(w in words for w in _INCOME_WORDS):
+            movement_type, party = "income", _FROM.search(text)
+        elif any(w in words for w in _EXPENSE_WORDS):
+            movement_type, party = "expense", _TO.search(text)
+        else:
+            raise ParseError("Cannot tell whether the notification is a payment or a receipt")
+
+        description = "SINPE Móvil"
+        if party:
+            description += (" de " if movement_type == "income" else " a ") + party.group(1).strip()
+        detail = _DETAIL.search(text)
+        if detail:
+            description += f": {detail.group(1).strip()}"
+
+        date_match = _DATE.search(text)
+        when = optional_date(date_match.group(1) if date_match else None)
+        reference = _REFERENCE.search(text)
+        return ParsedMovement(
+            date=when or self.default_date,
+            amount=amount,
+            type=movement_type,
+            description=description,
+            reference=reference.group(1) if reference else "",
+            tags=[self.tag],
+            undated=when is None,
+        )
+
+    def _flush(self) -> List[ParsedMovement]:
+        lines, self._block = self._block, []
+        if not lines:
+            return []
+        if len(lines) > 1:
+            # One SMS per line?
+            try:
+                return [self.parse_message(line) for line in lines]
+            except ParseError:
+                pass
+        return [self.parse_message(" ".join(lines))]
+
+    def feed(self, line: str) -> List[ParsedMovement]:
+        if line.strip():
+            self._block.append(line.strip())
+            return []
+        return self._flush()
+
+    def finish(self) -> List[ParsedMovement]:
+        return self._flush()
@@ -0,0 +1,257 @@
+"""
+KPI aggregate queries.
+
+Every KPI figure (income, expense, count, pending) is computed in a single
+grouped pass using aggregate FILTER clauses. Unfiltered-by-tag queries read
+the per-day rollup table; tag filters need per-movement data and fall back
+to the raw movements table (through the GIN index on tags).
+
+Archived months (see archive.py) count too: the rollup source adds the
+archived rollup, and tag-filtered totals of their rows are added with
+`merge_rows`.
+
+Months closed for every business unit (see periods.py) are answered from
+their frozen snapshots instead, when the range covers them whole and the
+buckets don't split them: the live sources then only read the open months.
+
+Every query is scoped to one owner; both sources are indexed by owner first.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    Date, Integer, Numeric, and_, cast, exists, false, func, literal, literal_column, or_, select, union_all,
+)
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import Select
+
+import partitions
+from models import KpiArchivedRollup, KpiDailyRollup, Movement, PeriodClose
+
+BUCKETS = ("day", "week", "month")
+# Buckets whose periods never straddle a month, so a month's snapshot lands in exactly one of them
+SNAPSHOT_BUCKETS = (None, "month")
+
+DateRange = Tuple[Optional[date], Optional[date]]  # inclusive; None = unbounded
+
+
+def _open_ranges(date_from: Optional[date], date_to: Optional[date], closed: Sequence[date]) -> List[DateRange]:
+    """[date_from, date_to] without the `closed` months (which lie inside it)."""
+    ranges = []
+    start = date_from
+    for month in sorted(closed):
+        if start is None or start < month:
+            ranges.append((start, month - timedelta(days=1)))
+        start = partitions.month_start(month, 1)
+    if date_to is None or start is None or start <= date_to:
+        ranges.append((start, date_to))
+    return ranges
+
+
+def _in_ranges(day, ranges: Sequence[DateRange]) -> list:
+    """Where clauses keeping `day` inside `ranges`; spelled as plain bounds so partitions are pruned."""
+    bounds = [[*([day >= start] if start else []), *([day <= end] if end else [])] for start, end in ranges]
+    if len(bounds) == 1:
+        return bounds[0]
+    # Several ranges only come from closed months in between, so each has at least one bound
+    return [or_(false(), *(and_(*b) for b in bounds))]
+
+
+def _rollup_source(owner_id: str, ranges: Sequence[DateRange], business_unit_id: Optional[str]):
+    """(day column, aggregate columns, where clauses) over the live and archived rollups."""
+
+    def rows(rollup):
+        q = select(rollup.day, rollup.status, rollup.income_total, rollup.expense_total, rollup.movement_count)
+        q = q.where(rollup.owner_id == owner_id, *_in_ranges(rollup.day, ranges))
+        if business_unit_id:
+            q = q.where(rollup.business_unit_id == business_unit_id)
+        return q
+
+    r = union_all(rows(KpiDailyRollup), rows(KpiArchivedRollup)).subquery("rollups").c
+    columns = [
+        func.coalesce(func.sum(r.income_total), 0).label("total_income"),
+        func.coalesce(func.sum(r.expense_total), 0).label("total_expense"),
+        func.coalesce(func.sum(r.movement_count), 0).label("movement_count"),
+        func.coalesce(func.sum(r.movement_count).filter(r.status == "pending"), 0).label("pending_count"),
+    ]
+    return r.day, columns, []
+
+
+def _movement_source(
+    owner_id: str,
+    ranges: Sequence[DateRange],
+    business_unit_id: Optional[str],
+    tags: Sequence[str],
+    tag_match: str,
+):
+    """(day column, aggregate columns, where clauses) over the raw movements table."""
+    m = Movement
+    columns = [
+        func.coalesce(func.sum(m.amount).filter(m.type == "income"), 0).label("total_income"),
+        func.coalesce(func.sum(m.amount).filter(m.type == "expense"), 0).label("total_expense"),
+        func.count().label("movement_count"),
+        func.count().filter(m.status == "pending").label("pending_count"),
+    ]
+    where = [m.owner_id == owner_id, *_in_ranges(m.date, ranges)]
+    if business_unit_id:
+        where.append(m.business_unit_id == business_unit_id)
+    if tags:
+        where.append(m.tagged(tags, tag_match))
+    return m.date, columns, where
+
+
+def _source(owner_id, date_from, date_to, business_unit_id, tags, tag_match, closed):
+    ranges = _open_ranges(date_from, date_to, closed)
+    if tags:
+        return _movement_source(owner_id, ranges, business_unit_id, tags, tag_match)
+    return _rollup_source(owner_id, ranges, business_unit_id)
+
+
+def summary_query(
+    owner_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+    tags: Sequence[str] = (),
+    tag_match: str = "any",
+    closed: Sequence[date] = (),
+) -> Select:
+    """One row: total_income, total_expense, movement_count, pending_count. Leaves out the `closed` months."""
+    _, columns, where = _source(owner_id, date_from, date_to, business_unit_id, tags, tag_match, closed)
+    return select(*columns).where(*where)
+
+
+def timeseries_query(
+    owner_id: str,
+    bucket: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+    tags: Sequence[str] = (),
+    tag_match: str = "any",
+    closed: Sequence[date] = (),
+) -> Select:
+    """One row per bucket with data: period plus the summary columns, oldest first. Leaves out the `closed` months."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    day, columns, where = _source(owner_id, date_from, date_to, business_unit_id, tags, tag_match, closed)
+    # Inline the unit so SELECT and GROUP BY render the same expression
+    unit = literal_column(f"'{bucket}'")
+    period = cast(func.date_trunc(unit, day), Date).label("period")
+    return select(period, *columns).where(*where).group_by(period).order_by(period)
+
+
+def closed_months_query(
+    owner_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+) -> Select:
+    """
+    The months wholly inside [date_from, date_to] that are closed (see periods.py)
+    for every business unit with movements in them, oldest first: their
+    snapshots can stand in for their rows.
+    """
+    c = PeriodClose
+    q = select(c.month).distinct().where(c.owner_id == owner_id).order_by(c.month)
+    if date_from:
+        q = q.where(c.month >= partitions.month_start(date_from, 0 if date_from.day == 1 else 1))
+    if date_to:
+        q = q.where(c.month < partitions.month_start(date_to + timedelta(days=1)))
+    if business_unit_id:
+        return q.where(c.business_unit_id == business_unit_id)
+    # Starts from the (few) closes, so owners who never close a period pay one index probe
+    for rollup in (KpiDailyRollup, KpiArchivedRollup):
+        other = aliased(PeriodClose)
+        still_open = select(literal(1)).where(
+            rollup.owner_id == owner_id,
+            rollup.day >= c.month,
+            rollup.day < c.month + literal_column("interval '1 month'"),
+            ~select(other.month).where(
+                other.owner_id == owner_id,
+                other.business_unit_id == rollup.business_unit_id,
+                other.month == c.month,
+            ).correlate_except(other).exists(),
+        )
+        q = q.where(~exists(still_open))
+    return q
+
+
+def snapshot_query(
+    owner_id: str,
+    months: Sequence[date],
+    bucket: Optional[str] = None,
+    business_unit_id: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> Select:
+    """
+    The summary columns over the period snapshots of `months`, per month with
+    the month bucket. With `tag`, only the totals of the movements carrying it.
+    """
+    c = PeriodClose
+    if tag:
+        totals = c.tag_totals[tag]
+        income = totals["income"].astext.cast(Numeric)
+        expense = totals["expense"].astext.cast(Numeric)
+        count = totals["movement_count"].astext.cast(Integer)
+    else:
+        income, expense, count = c.income_total, c.expense_total, c.movement_count
+    columns = [
+        func.coalesce(func.sum(income), 0).label("total_income"),
+        func.coalesce(func.sum(expense), 0).label("total_expense"),
+        func.coalesce(func.sum(count), 0).label("movement_count"),
+        literal(0).label("pending_count"),  # closing a period closes its movements
+    ]
+    where = [c.owner_id == owner_id, c.month.in_(months)]
+    if business_unit_id:
+        where.append(c.business_unit_id == business_unit_id)
+    if tag:
+        where.append(c.tag_totals.has_key(tag))
+    if bucket == "month":
+        return select(c.month.label("period"), *columns).where(*where).group_by(c.month).order_by(c.month)
+    return select(*columns).where(*where)
+
+
+class Totals(NamedTuple):
+    """An aggregate row computed outside Postgres, shaped like the query rows."""
+    period: Optional[date]
+    total_income: Decimal
+    total_expense: Decimal
+    movement_count: int
+    pending_count: int
+
+
+def period_start(day: date, bucket: str) -> date:
+    """date_trunc(bucket, day) for rows aggregated in Python; weeks start on Monday."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def merge_rows(*sources) -> List[Totals]:
+    """Sum aggregate rows of several sources per period (summary rows have none), oldest first."""
+    merged = {}
+    for rows in sources:
+        for row in rows:
+            period = getattr(row, "period", None)
+            values = (row.total_income, row.total_expense, row.movement_count, row.pending_count)
+            if period in merged:
+                values = tuple(a + b for a, b in zip(merged[period], values))
+            merged[period] = values
+    return [Totals(period, *merged[period]) for period in sorted(merged, key=lambda p: (p is not None, p))]
+
+
+def to_kpis(row) -> dict:
+    """Shape an aggregate row as the KPI fields of the API."""
+    total_income = float(row.total_income)
+    total_expense = float(row.total_expense)
+    return {
+        "total_income": total_income,
+        "total_expense": total_expense,
+        "balance": total_income - total_expense,
+        "movement_count": int(row.movement_count),
+        "pending_count": int(row.pending_count),
+    }
@@ -0,0 +1,114 @@
+"""
+The worker's one LISTEN connection to Postgres.
+
+Everything that reacts to NOTIFY (the reference data cache in refdata.py,
+the live event streams in live.py) subscribes its channel here instead of
+opening a connection of its own, so a worker holds a single session-level
+connection for all of them. The connection is checked every KEEPALIVE
+seconds and reopened after RECONNECT_DELAY when it drops; subscribers are
+told both ways, since notifications sent while it was down are lost.
+
+LISTEN needs a session-level connection; behind PgBouncer in transaction
+mode point DATABASE_LISTEN_URL at Postgres (or a session-mode pool).
+"""
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+LISTEN_URL = os.environ.get("DATABASE_LISTEN_URL") or DATABASE_URL
+KEEPALIVE = 30  # seconds between liveness checks of the LISTEN connection
+RECONNECT_DELAY = 2  # seconds
+
+
+class Listener:
+    def __init__(self):
+        self.connected = False
+        self.reconnects = 0
+        # channel -> (on_notify(payload), on_connection(connected))
+        self._channels: Dict[str, Tuple[Callable[[str], None], Callable[[bool], None]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, on_notify: Callable[[str], None], on_connection: Callable[[bool], None]) -> None:
+        """
+        Call on_notify(payload) for every notification on `channel`, and
+        on_connection(True/False) when the connection comes up or goes down.
+        Subscribe before start().
+        """
+        self._channels[channel] = (on_notify, on_connection)
+
+    def _set_connected(self, connected: bool) -> None:
+        self.connected = connected
+        for _, on_connection in self._channels.values():
+            try:
+                on_connection(connected)
+            except Exception:
+                logger.exception("LISTEN subscriber failed")
+
+    def _dispatch(self, connection, pid, channel, payload) -> None:
+        try:
+            self._channels[channel][0](payload)
+        except Exception:
+            logger.exception(f"Handling a {channel} notification failed")
+
+    async def _listen(self) -> None:
+        url = make_url(LISTEN_URL).set(drivername="postgresql")
+        dsn = url.render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda _: closed.set())
+                for channel in self._channels:
+                    await conn.add_listener(channel, self._dispatch)
+                self._set_connected(True)
+                logger.info(f"Listening for {', '.join(self._channels)} notifications")
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(conn.fetchval("SELECT 1"), KEEPALIVE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"LISTEN connection failed: {e}")
+            finally:
+                if self.connected:
+                    self._set_connected(False)
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def start(self) -> None:
+        if not self._channels or self._task is not None:
+            return
+        if make_url(LISTEN_URL).get_backend_name() != "postgresql":
+            logger.warning("LISTEN needs PostgreSQL; notifications are off")
+            return
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.connected:
+            self._set_connected(False)
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "channels": list(self._channels),
+            "reconnects": self.reconnects,
+        }
+
+
+listener = Listener()
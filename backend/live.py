@@ -0,0 +1,256 @@
+"""
+Live movement and KPI updates over Server-Sent Events (GET /api/v1/live).
+
+Statement triggers on movements NOTIFY the `movement_events` channel on
+commit, once per statement and owner. Each notification carries the
+operation, the ids of the rows (up to MAX_IDS) and the change the
+statement made to the owner's KPI totals. Every worker receives them on
+its one LISTEN connection (see listener.py) and fans them out in memory to
+the open streams of that owner. A thousand connected phones therefore cost
+one database connection and no polling at all. Rows that were created or
+updated are read once per notification, and only when the owner has a
+stream on this worker. Every client then gets the same serialized bytes.
+
+A stream carries these events:
+
+    ready      once, on connect
+    movements  {"op": "insert" | "update" | "delete", "count": n, "ids": [...],
+                "movements": [...]}; movements (insert and update only) are
+               the rows as the list endpoints return them. A statement over
+               MAX_IDS rows sends "ids": null, and the client refetches.
+    kpis       the change to the owner's unfiltered KPI summary, same keys;
+               skipped when the totals did not change
+    reset      events may have been lost (the LISTEN connection dropped, or
+               the client fell QUEUE_SIZE events behind): refetch everything
+
+A comment line goes out every PING_INTERVAL seconds so proxies keep the
+connection open.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import DDL, event, select
+
+from database import async_session
+from listener import listener
+from models import Movement
+from tenancy import session_info
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "movement_events"
+MAX_IDS = 100  # 100 uuids keep a notification well under Postgres' 8000 byte payload limit
+MAX_STREAMS = int(os.environ.get("LIVE_MAX_STREAMS", "5000"))  # per worker
+QUEUE_SIZE = 100  # events buffered per stream before it is reset
+PENDING_SIZE = 10000  # notifications waiting to be published, per worker
+PING_INTERVAL = 15  # seconds
+RETRY_MS = 3000  # reconnect delay suggested to clients
+
+
+def _notify(changes: str) -> str:
+    """One notification per owner of `changes` (movement rows with a +1/-1 sign)."""
+    return f"""
+        PERFORM pg_notify('{CHANNEL}', json_build_object(
+            'op', lower(TG_OP),
+            'owner', owner_id,
+            'count', count(DISTINCT id),
+            'ids', CASE WHEN count(DISTINCT id) <= {MAX_IDS} THEN array_agg(DISTINCT id) END,
+            'income', coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+            'expense', coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+            'movements', sum(sign),
+            'pending', coalesce(sum(sign) FILTER (WHERE status = 'pending'), 0)
+        )::text)
+        FROM ({changes}) AS changed
+        WHERE owner_id IS NOT NULL
+        GROUP BY owner_id;"""
+
+
+_NEW_ROWS = "SELECT owner_id, id, type, amount, status, 1 AS sign FROM new_rows"
+_OLD_ROWS = "SELECT owner_id, id, type, amount, status, -1 AS sign FROM old_rows"
+
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION movement_events_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{_notify(_NEW_ROWS)}
+    ELSIF TG_OP = 'DELETE' THEN{_notify(_OLD_ROWS)}
+    ELSIF TG_OP = 'UPDATE' THEN{_notify(_NEW_ROWS + " UNION ALL " + _OLD_ROWS)}
+    ELSE
+        PERFORM pg_notify('{CHANNEL}', json_build_object('op', 'truncate')::text);
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+NOTIFY_TRIGGERS = [
+    """CREATE TRIGGER movements_events_insert AFTER INSERT ON movements
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+    """CREATE TRIGGER movements_events_update AFTER UPDATE ON movements
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+    """CREATE TRIGGER movements_events_delete AFTER DELETE ON movements
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+    """CREATE TRIGGER movements_events_truncate AFTER TRUNCATE ON movements
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+]
+
+# Fresh databases are built with metadata.create_all(); install the triggers there too
+event.listen(Movement.__table__, "after_create", DDL(NOTIFY_FUNCTION))
+for _trigger in NOTIFY_TRIGGERS:
+    event.listen(Movement.__table__, "after_create", DDL(_trigger))
+
+
+def _event(name: str, data: object) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+RESET = _event("reset", {})
+PING = b": ping\n\n"
+
+
+class Stream:
+    """One connected client: the events waiting to be sent to it."""
+    __slots__ = ("owner_id", "queue")
+
+    def __init__(self, owner_id: str):
+        self.owner_id = owner_id
+        self.queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+
+
+class LiveHub:
+    def __init__(self):
+        self.listening = False
+        self.published = 0
+        self.resets = 0
+        self._streams: Dict[str, Set[Stream]] = defaultdict(set)
+        self._pending: asyncio.Queue = asyncio.Queue(PENDING_SIZE)
+        self._render: Optional[Callable[[Movement], dict]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def stream_count(self) -> int:
+        return sum(len(streams) for streams in self._streams.values())
+
+    def _send(self, stream: Stream, message: bytes) -> None:
+        try:
+            stream.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind refetches instead of catching up
+            while not stream.queue.empty():
+                stream.queue.get_nowait()
+            stream.queue.put_nowait(RESET)
+            self.resets += 1
+
+    def _reset_all(self) -> None:
+        while not self._pending.empty():
+            self._pending.get_nowait()
+        for streams in self._streams.values():
+            for stream in streams:
+                self._send(stream, RESET)
+
+    def _on_notify(self, payload: str) -> None:
+        notification = json.loads(payload)
+        if notification["op"] == "truncate":
+            self._reset_all()
+        elif notification["owner"] in self._streams:
+            try:
+                self._pending.put_nowait(notification)
+            except asyncio.QueueFull:
+                self._reset_all()
+
+    def _on_connection(self, connected: bool) -> None:
+        self.listening = connected
+        # Whatever happened while the connection was down went unnoticed
+        self._reset_all()
+
+    async def _load(self, owner_id: str, ids: List[str]) -> list:
+        async with async_session(info=session_info(owner_id)) as db:
+            result = await db.execute(
+                select(Movement)
+                .where(Movement.owner_id == owner_id, Movement.id.in_(ids))
+                .order_by(Movement.created_at, Movement.id)
+            )
+            return [self._render(movement) for movement in result.scalars()]
+
+    async def _publish(self, notification: dict) -> None:
+        owner_id = notification["owner"]
+        data = {"op": notification["op"], "count": notification["count"], "ids": notification["ids"]}
+        if data["ids"] is not None and data["op"] != "delete":
+            # Rows deleted since the notification are simply missing; their own event follows
+            data["movements"] = await self._load(owner_id, data["ids"])
+        messages = [_event("movements", data)]
+        delta = {
+            "total_income": notification["income"],
+            "total_expense": notification["expense"],
+            "balance": notification["income"] - notification["expense"],
+            "movement_count": notification["movements"],
+            "pending_count": notification["pending"],
+        }
+        if any(delta.values()):
+            messages.append(_event("kpis", delta))
+        for stream in list(self._streams.get(owner_id, ())):
+            for message in messages:
+                self._send(stream, message)
+        self.published += 1
+
+    async def _run(self) -> None:
+        # One at a time, so every client sees its owner's events in commit order
+        while True:
+            notification = await self._pending.get()
+            try:
+                await self._publish(notification)
+            except Exception:
+                logger.exception("Publishing a movement event failed")
+                for stream in list(self._streams.get(notification["owner"], ())):
+                    self._send(stream, RESET)
+
+    async def stream(self, owner_id: str) -> AsyncIterator[bytes]:
+        """The event stream body of one client of `owner_id`."""
+        stream = Stream(owner_id)
+        self._streams[owner_id].add(stream)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode() + _event("ready", {"live": self.listening})
+            while True:
+                try:
+                    message = await asyncio.wait_for(stream.queue.get(), PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    message = PING
+                yield message
+        finally:
+            streams = self._streams.get(owner_id)
+            if streams is not None:
+                streams.discard(stream)
+                if not streams:
+                    del self._streams[owner_id]
+
+    async def start(self, render: Callable[[Movement], dict]) -> None:
+        """Subscribe to the worker's LISTEN connection; `render` turns a movement into its JSON object."""
+        self._render = render
+        listener.subscribe(CHANNEL, self._on_notify, self._on_connection)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.listening = False
+
+    def stats(self) -> dict:
+        return {
+            "listening": self.listening,
+            "streams": self.stream_count,
+            "owners": len(self._streams),
+            "published": self.published,
+            "resets": self.resets,
+        }
+
+
+hub = LiveHub()
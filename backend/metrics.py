@@ -0,0 +1,226 @@
+"""
+Prometheus metrics, served as text by GET /api/metrics.
+
+Dependency-free and cheap enough to leave on: recording is a contextvar
+lookup and a few dict updates; rendering happens only when scraped.
+Metrics are per process, so scrape every uvicorn worker (or run one).
+
+- MetricsMiddleware times every HTTP request by route template (not raw
+  path, which would explode label cardinality) and counts statuses.
+- instrument_engine() hooks SQLAlchemy cursor execution to attribute query
+  counts and DB time to the request that issued them.
+- Other modules record into the metric objects defined here (Firebase
+  verification) or register collectors read at scrape time (pool gauges).
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self.values[labels] = value
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(total)}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by method, route and status.", ("method", "route", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.", ("method",))
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed, by route.", ("route",))
+DB_SECONDS = Counter("db_query_seconds_total", "Time spent executing SQL, by route.", ("route",))
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request.", ("route",), buckets=COUNT_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement latency.", buckets=QUERY_BUCKETS)
+FIREBASE_VERIFY_SECONDS = Histogram(
+    "firebase_token_verify_duration_seconds",
+    "Firebase ID token verification time by path (cache, local, admin).",
+    ("path",),
+    buckets=QUERY_BUCKETS,
+)
+
+_METRICS: List[_Metric] = [
+    REQUESTS, REQUEST_SECONDS, IN_FLIGHT,
+    DB_QUERIES, DB_SECONDS, DB_QUERIES_PER_REQUEST, DB_QUERY_SECONDS,
+    FIREBASE_VERIFY_SECONDS,
+]
+# Callables returning freshly computed metrics at scrape time (e.g. pool gauges)
+_collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[_Metric]]) -> None:
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for metric in collector():
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Request tracking ---
+
+class _RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_current: ContextVar[Optional[_RequestStats]] = ContextVar("metrics_request", default=None)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering, unlike BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        stats = _RequestStats()
+        token = _current.set(stats)
+        IN_FLIGHT.inc((method,))
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec((method,))
+            _current.reset(token)
+            # Set by FastAPI routing once a route matched; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS.inc((method, route, str(status)))
+            REQUEST_SECONDS.observe(elapsed, (method, route))
+            if stats.queries:
+                DB_QUERIES.inc((route,), stats.queries)
+                DB_SECONDS.inc((route,), stats.db_time)
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, (route,))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    DB_QUERY_SECONDS.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run through `engine` (an AsyncEngine or Engine)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,131 @@
+"""kpi_daily_rollups
+
+Revision ID: 0b1a6b821024
+Revises: 5f3e5d374ab7
+Create Date: 2026-10-17 10:03:27.554108
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0b1a6b821024'
+down_revision: Union[str, Sequence[str], None] = '5f3e5d374ab7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_FUNCTION = """
+CREATE OR REPLACE FUNCTION kpi_rollup_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO kpi_daily_rollups AS r
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(business_unit_id, ''), date, coalesce(status, ''),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+               sum(sign)
+        FROM (SELECT business_unit_id, date, status, type, amount, 1 AS sign FROM new_rows) AS changed
+        GROUP BY 1, 2, 3
+        HAVING sum(sign) <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'income') <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'expense') <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (business_unit_id, day, status) DO UPDATE SET
+            income_total = r.income_total + excluded.income_total,
+            expense_total = r.expense_total + excluded.expense_total,
+            movement_count = r.movement_count + excluded.movement_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO kpi_daily_rollups AS r
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(business_unit_id, ''), date, coalesce(status, ''),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+               sum(sign)
+        FROM (SELECT business_unit_id, date, status, type, amount, -1 AS sign FROM old_rows) AS changed
+        GROUP BY 1, 2, 3
+        HAVING sum(sign) <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'income') <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'expense') <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (business_unit_id, day, status) DO UPDATE SET
+            income_total = r.income_total + excluded.income_total,
+            expense_total = r.expense_total + excluded.expense_total,
+            movement_count = r.movement_count + excluded.movement_count;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO kpi_daily_rollups AS r
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(business_unit_id, ''), date, coalesce(status, ''),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+               sum(sign)
+        FROM (SELECT business_unit_id, date, status, type, amount, 1 AS sign FROM new_rows UNION ALL SELECT business_unit_id, date, status, type, amount, -1 AS sign FROM old_rows) AS changed
+        GROUP BY 1, 2, 3
+        HAVING sum(sign) <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'income') <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'expense') <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (business_unit_id, day, status) DO UPDATE SET
+            income_total = r.income_total + excluded.income_total,
+            expense_total = r.expense_total + excluded.expense_total,
+            movement_count = r.movement_count + excluded.movement_count;
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE kpi_daily_rollups;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+TRIGGERS = [
+    """CREATE TRIGGER movements_kpi_rollup_insert AFTER INSERT ON movements
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+    """CREATE TRIGGER movements_kpi_rollup_update AFTER UPDATE ON movements
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+    """CREATE TRIGGER movements_kpi_rollup_delete AFTER DELETE ON movements
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+    """CREATE TRIGGER movements_kpi_rollup_truncate AFTER TRUNCATE ON movements
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('kpi_daily_rollups',
+    sa.Column('business_unit_id', sa.String(), nullable=False),
+    sa.Column('day', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('income_total', sa.Float(), nullable=False),
+    sa.Column('expense_total', sa.Float(), nullable=False),
+    sa.Column('movement_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('business_unit_id', 'day', 'status')
+    )
+
+    # Hold off writers so the backfill and the triggers see the same rows
+    op.execute("LOCK TABLE movements IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(ROLLUP_FUNCTION)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute("""
+        INSERT INTO kpi_daily_rollups
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(business_unit_id, ''), date, coalesce(status, ''),
+               coalesce(sum(amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(amount) FILTER (WHERE type = 'expense'), 0),
+               count(*)
+        FROM movements
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for event in ('insert', 'update', 'delete', 'truncate'):
+        op.execute(f"DROP TRIGGER IF EXISTS movements_kpi_rollup_{event} ON movements")
+    op.execute("DROP FUNCTION IF EXISTS kpi_rollup_apply()")
+    op.drop_table('kpi_daily_rollups')
@@ -0,0 +1,53 @@
+"""movement_archives
+
+Cold archive of closed months (see archive.py): the catalog of archived
+months and the KPI rollup rows that left the live rollup with them.
+
+Revision ID: 1339f9980753
+Revises: 2e19188a7412
+Create Date: 2026-10-17 19:20:07.514822
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '1339f9980753'
+down_revision: Union[str, Sequence[str], None] = '2e19188a7412'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'kpi_archived_rollups',
+        sa.Column('owner_id', sa.String(), nullable=False),
+        sa.Column('business_unit_id', sa.String(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('income_total', sa.Numeric(18, 2), nullable=False),
+        sa.Column('expense_total', sa.Numeric(18, 2), nullable=False),
+        sa.Column('movement_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('owner_id', 'business_unit_id', 'day', 'status'),
+    )
+    op.create_index('ix_kpi_archived_rollups_owner_day', 'kpi_archived_rollups', ['owner_id', 'day'])
+    op.create_table(
+        'movement_archives',
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('file', sa.String(), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('month'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Archived months must be restored first (python archive.py restore); their totals would be lost
+    op.drop_table('movement_archives')
+    op.drop_index('ix_kpi_archived_rollups_owner_day', table_name='kpi_archived_rollups')
+    op.drop_table('kpi_archived_rollups')
@@ -0,0 +1,285 @@
+"""partition_movements
+
+Turn movements into a table range-partitioned by month on the movement date
+(see partitions.py) without a long table lock:
+
+1. build the partitioned table next to the old one, with one partition per
+   month that has movements, last month through three months ahead and a
+   default partition; a row trigger mirrors writes made meanwhile
+2. copy the rows over in primary-key batches, each in its own transaction
+3. swap the tables in one short transaction and move the rollup and ETag
+   triggers and the row-level security policy over
+
+The primary key becomes (id, date) and the fingerprint index gains the date:
+unique indexes on a partitioned table must contain the partition key.
+
+Revision ID: 2e19188a7412
+Revises: b906c802d1a2
+Create Date: 2026-10-17 18:05:41.733190
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '2e19188a7412'
+down_revision: Union[str, Sequence[str], None] = 'b906c802d1a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+MONTHS_AHEAD = 3
+MAINTENANCE_LOCK_ID = 7_150_002
+
+COLUMNS = [
+    'id', 'owner_id', 'type', 'amount', 'currency', 'description', 'responsible', 'business_unit_id',
+    'status', 'date', 'tags', 'fingerprint', 'created_at', 'updated_at',
+]
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('spanish', search_fold(coalesce(description, ''))), 'A') || "
+    "setweight(to_tsvector('spanish', search_fold(coalesce(responsible, ''))), 'B')"
+)
+
+TABLE = """
+CREATE TABLE {name} (
+    id varchar NOT NULL,
+    owner_id varchar NOT NULL CONSTRAINT movements_owner_id_fkey REFERENCES users (id) ON DELETE CASCADE,
+    type movement_type NOT NULL,
+    amount numeric(14, 2) NOT NULL,
+    currency varchar,
+    description text,
+    responsible varchar,
+    business_unit_id varchar,
+    status movement_status NOT NULL,
+    date date NOT NULL,
+    tags jsonb,
+    fingerprint varchar,
+    search_vector tsvector GENERATED ALWAYS AS ({search_vector}) STORED,
+    created_at timestamptz NOT NULL,
+    updated_at timestamptz NOT NULL,
+    CONSTRAINT {name}_pkey PRIMARY KEY ({primary_key})
+){partitioning}
+"""
+
+# (name, definition) on both tables; the fingerprint index is the only one that changes
+INDEXES = [
+    ('ix_movements_owner_created_at_id', '(owner_id, created_at, id)'),
+    ('ix_movements_owner_status_created_at_id', '(owner_id, status, created_at, id)'),
+    ('ix_movements_owner_type_created_at_id', '(owner_id, type, created_at, id)'),
+    ('ix_movements_owner_date_id', '(owner_id, date, id)'),
+    ('ix_movements_owner_business_unit_id_date', '(owner_id, business_unit_id, date)'),
+    ('ix_movements_tags', 'USING gin (tags jsonb_path_ops)'),
+    ('ix_movements_search_vector', 'USING gin (search_vector)'),
+]
+TRIGRAM_INDEX = ('ix_movements_description_trgm', 'USING gin (search_fold(description) gin_trgm_ops)')
+FINGERPRINT_INDEX = 'ux_movements_owner_fingerprint'
+
+RLS_POLICY = """
+CREATE POLICY movements_owner_isolation ON movements
+    USING (owner_id = current_setting('app.owner_id', true))
+    WITH CHECK (owner_id = current_setting('app.owner_id', true))
+"""
+
+# Writes to the old table while the copy runs; an update may move a row to another month
+SYNC_FUNCTION = """
+CREATE FUNCTION movements_partition_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM movements_partitioned WHERE id = OLD.id AND date = OLD.date;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO movements_partitioned ({columns}) VALUES ({values});
+    END IF;
+    RETURN NULL;
+END;
+$$
+""".format(columns=', '.join(COLUMNS), values=', '.join(f'NEW.{column}' for column in COLUMNS))
+
+ENSURE_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION movements_ensure_partitions(first_month date, last_month date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month date;
+    part text;
+    columns text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock({MAINTENANCE_LOCK_ID});
+    -- Rows routed to the default partition meanwhile would make the ATTACH fail
+    LOCK TABLE movements_default IN EXCLUSIVE MODE;
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = 'movements'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+    FOR month IN
+        SELECT generate_series(date_trunc('month', first_month), date_trunc('month', last_month),
+                               interval '1 month')::date
+        UNION
+        SELECT DISTINCT date_trunc('month', date)::date FROM movements_default
+        ORDER BY 1
+    LOOP
+        part := 'movements_p' || to_char(month, 'YYYY_MM');
+        -- A detached month keeps its name until it is archived; new rows for it wait in the default partition
+        CONTINUE WHEN to_regclass(part) IS NOT NULL;
+        EXECUTE format('CREATE TABLE %I (LIKE movements INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+                       'INCLUDING GENERATED INCLUDING INDEXES)', part);
+        EXECUTE format('WITH moved AS (DELETE FROM movements_default WHERE date >= $1 AND date < $2 RETURNING %s) '
+                       'INSERT INTO %I (%s) SELECT %s FROM moved', columns, part, columns, columns)
+            USING month, (month + interval '1 month')::date;
+        EXECUTE format('ALTER TABLE movements ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       part, month, (month + interval '1 month')::date);
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$
+"""
+
+
+def _month_start(day: date, months: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _indexes(conn, table: str, suffix: str = '') -> list:
+    """Index statements for `table`, with the trigram index only where the old table had it."""
+    indexes = list(INDEXES)
+    trigram = conn.execute(sa.text("SELECT to_regclass(:name)"), {"name": TRIGRAM_INDEX[0]}).scalar()
+    if trigram is not None:
+        indexes.append(TRIGRAM_INDEX)
+    return [f"CREATE INDEX {name}{suffix} ON {table} {definition}" for name, definition in indexes]
+
+
+def _table_triggers() -> list:
+    triggers = []
+    for name, function in (('kpi_rollup', 'kpi_rollup_apply'), ('version', 'table_version_bump')):
+        triggers += [
+            f"""CREATE TRIGGER movements_{name}_insert AFTER INSERT ON movements
+               REFERENCING NEW TABLE AS new_rows
+               FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+            f"""CREATE TRIGGER movements_{name}_update AFTER UPDATE ON movements
+               REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+               FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+            f"""CREATE TRIGGER movements_{name}_delete AFTER DELETE ON movements
+               REFERENCING OLD TABLE AS old_rows
+               FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+            f"""CREATE TRIGGER movements_{name}_truncate AFTER TRUNCATE ON movements
+               FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+        ]
+    return triggers
+
+
+def _copy_grants(conn, table: str) -> None:
+    """Give `table` the privileges other roles (e.g. the API's) hold on movements."""
+    grants = conn.execute(sa.text(
+        "SELECT grantee, string_agg(privilege_type, ', ') FROM information_schema.role_table_grants "
+        "WHERE table_schema = current_schema() AND table_name = 'movements' "
+        "AND grantee <> (SELECT tableowner FROM pg_tables "
+        "                WHERE schemaname = current_schema() AND tablename = 'movements') "
+        "GROUP BY grantee"
+    )).all()
+    for grantee, privileges in grants:
+        op.execute(f'GRANT {privileges} ON {table} TO "{grantee}"')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    op.execute(TABLE.format(name='movements_partitioned', search_vector=SEARCH_VECTOR, primary_key='id, date',
+                            partitioning=' PARTITION BY RANGE (date)'))
+    for statement in _indexes(conn, 'movements_partitioned', suffix='_new'):
+        op.execute(statement)
+    op.execute(f"CREATE UNIQUE INDEX {FINGERPRINT_INDEX}_new ON movements_partitioned (owner_id, fingerprint, date)")
+    _copy_grants(conn, 'movements_partitioned')
+
+    today = date.today()
+    months = {row[0] for row in conn.execute(sa.text("SELECT DISTINCT date_trunc('month', date)::date FROM movements"))}
+    months.update(_month_start(today, n) for n in range(-1, MONTHS_AHEAD + 1))
+    # A month detached earlier still holds its name; its rows go to the default partition
+    detached = {row[0] for row in conn.execute(
+        sa.text("SELECT relname FROM pg_class WHERE relkind = 'r' AND relname ~ '^movements_p'")
+    )}
+    for month in sorted(months):
+        if f"movements_p{month:%Y_%m}" in detached:
+            continue
+        op.execute(
+            f"CREATE TABLE movements_p{month:%Y_%m} PARTITION OF movements_partitioned "
+            f"FOR VALUES FROM ('{month}') TO ('{_month_start(month, 1)}')"
+        )
+    op.execute("CREATE TABLE movements_default PARTITION OF movements_partitioned DEFAULT")
+
+    op.execute(SYNC_FUNCTION)
+    op.execute(
+        "CREATE TRIGGER movements_partition_sync AFTER INSERT OR UPDATE OR DELETE ON movements "
+        "FOR EACH ROW EXECUTE FUNCTION movements_partition_sync()"
+    )
+
+    with op.get_context().autocommit_block():
+        # FOR SHARE waits for a concurrent update of a row and copies its new version;
+        # rows the trigger already copied are skipped
+        last_id = ""
+        while True:
+            upto = conn.execute(
+                sa.text(
+                    "SELECT max(id) FROM (SELECT id FROM movements WHERE id > :last_id "
+                    "ORDER BY id LIMIT :batch_size) AS batch"
+                ),
+                {"last_id": last_id, "batch_size": BATCH_SIZE},
+            ).scalar()
+            if upto is None:
+                break
+            conn.execute(
+                sa.text(
+                    f"INSERT INTO movements_partitioned ({', '.join(COLUMNS)}) "
+                    f"SELECT {', '.join(COLUMNS)} FROM movements WHERE id > :last_id AND id <= :upto "
+                    "FOR SHARE ON CONFLICT DO NOTHING"
+                ),
+                {"last_id": last_id, "upto": upto},
+            )
+            last_id = upto
+
+    # The swap: the old table goes with its triggers, indexes and policy
+    op.execute("LOCK TABLE movements IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TABLE movements")
+    op.execute("DROP FUNCTION movements_partition_sync()")
+    op.execute("ALTER TABLE movements_partitioned RENAME TO movements")
+    op.execute("ALTER TABLE movements RENAME CONSTRAINT movements_partitioned_pkey TO movements_pkey")
+    for name in [name for name, _ in INDEXES + [TRIGRAM_INDEX]] + [FINGERPRINT_INDEX]:
+        op.execute(f"ALTER INDEX IF EXISTS {name}_new RENAME TO {name}")
+    for trigger in _table_triggers():
+        op.execute(trigger)
+    op.execute(RLS_POLICY)
+    op.execute("ALTER TABLE movements ENABLE ROW LEVEL SECURITY")
+    op.execute(ENSURE_FUNCTION)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Rewrites the table under an exclusive lock; not meant for production use.
+    # Partitions detached earlier are left alone.
+    conn = op.get_bind()
+    op.execute("LOCK TABLE movements IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP FUNCTION IF EXISTS movements_ensure_partitions(date, date)")
+    op.execute(TABLE.format(name='movements_unpartitioned', search_vector=SEARCH_VECTOR, primary_key='id',
+                            partitioning=''))
+    _copy_grants(conn, 'movements_unpartitioned')
+    op.execute(
+        f"INSERT INTO movements_unpartitioned ({', '.join(COLUMNS)}) SELECT {', '.join(COLUMNS)} FROM movements"
+    )
+    indexes = _indexes(conn, 'movements')
+    op.execute("DROP TABLE movements")
+    op.execute("ALTER TABLE movements_unpartitioned RENAME TO movements")
+    op.execute("ALTER TABLE movements RENAME CONSTRAINT movements_unpartitioned_pkey TO movements_pkey")
+    for statement in indexes:
+        op.execute(statement)
+    # Fails if one owner has the same fingerprint on two dates, which imports never produce
+    op.execute(f"CREATE UNIQUE INDEX {FINGERPRINT_INDEX} ON movements (owner_id, fingerprint)")
+    for trigger in _table_triggers():
+        op.execute(trigger)
+    op.execute(RLS_POLICY)
+    op.execute("ALTER TABLE movements ENABLE ROW LEVEL SECURITY")
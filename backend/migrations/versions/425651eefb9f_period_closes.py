@@ -0,0 +1,135 @@
+"""period_closes
+
+Accounting period close (see periods.py): the frozen totals of each closed
+month and business unit, and the statement triggers on movements that
+refuse writes to a closed period.
+
+Revision ID: 425651eefb9f
+Revises: 1339f9980753
+Create Date: 2026-10-17 21:05:41.902317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = '425651eefb9f'
+down_revision: Union[str, Sequence[str], None] = '1339f9980753'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EVENTS = ('insert', 'update', 'delete')
+
+
+LOCK_KEY = "hashtextextended(p.owner_id || ':' || p.business_unit_id || ':' || to_char(p.month, 'YYYY-MM-DD'), 0)"
+
+
+def _first_closing(rows: str) -> str:
+    return f"""
+        SELECT p.business_unit_id, p.month INTO hit
+        FROM (
+            SELECT DISTINCT owner_id, coalesce(business_unit_id, '') AS business_unit_id,
+                date_trunc('month', date)::date AS month
+            FROM ({rows}) AS changed
+            WHERE owner_id IS NOT NULL
+        ) AS p
+        WHERE NOT pg_try_advisory_xact_lock_shared({LOCK_KEY})
+        LIMIT 1;"""
+
+
+def _first_closed(rows: str) -> str:
+    return f"""
+        SELECT c.business_unit_id, c.month INTO hit
+        FROM ({rows}) AS changed
+        JOIN period_closes c ON c.owner_id = changed.owner_id
+            AND c.business_unit_id = coalesce(changed.business_unit_id, '')
+            AND c.month = date_trunc('month', changed.date)::date
+        -- Rows deleted along with their owner go wherever the owner goes
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = changed.owner_id)
+        LIMIT 1;"""
+
+
+def _check(rows: str) -> str:
+    return f"""{_first_closing(rows)}
+        IF FOUND THEN
+            RAISE EXCEPTION 'The period % of business unit "%" is being closed', to_char(hit.month, 'YYYY-MM'),
+                hit.business_unit_id USING ERRCODE = 'PC409';
+        END IF;{_first_closed(rows)}"""
+
+
+NEW_ROWS = "SELECT owner_id, business_unit_id, date FROM new_rows"
+OLD_ROWS = "SELECT owner_id, business_unit_id, date FROM old_rows"
+
+GUARD_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION movements_period_guard() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    hit record;
+BEGIN
+    IF current_setting('app.period_guard', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN{_check(NEW_ROWS)}
+    ELSIF TG_OP = 'DELETE' THEN{_check(OLD_ROWS)}
+    ELSE{_check(NEW_ROWS + " UNION ALL " + OLD_ROWS)}
+    END IF;
+    IF FOUND THEN
+        RAISE EXCEPTION 'The period % of business unit "%" is closed', to_char(hit.month, 'YYYY-MM'),
+            hit.business_unit_id USING ERRCODE = 'PC409';
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+GUARD_TRIGGERS = [
+    """CREATE TRIGGER movements_period_guard_insert AFTER INSERT ON movements
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movements_period_guard()""",
+    """CREATE TRIGGER movements_period_guard_update AFTER UPDATE ON movements
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movements_period_guard()""",
+    """CREATE TRIGGER movements_period_guard_delete AFTER DELETE ON movements
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movements_period_guard()""",
+]
+
+RLS_POLICY = """
+CREATE POLICY period_closes_owner_isolation ON period_closes
+    USING (owner_id = current_setting('app.owner_id', true))
+    WITH CHECK (owner_id = current_setting('app.owner_id', true))
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'period_closes',
+        sa.Column('owner_id', sa.String(), nullable=False),
+        sa.Column('business_unit_id', sa.String(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('income_total', sa.Numeric(18, 2), nullable=False),
+        sa.Column('expense_total', sa.Numeric(18, 2), nullable=False),
+        sa.Column('movement_count', sa.Integer(), nullable=False),
+        sa.Column('tag_totals', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('closed_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('owner_id', 'business_unit_id', 'month'),
+    )
+    op.execute(RLS_POLICY)
+    op.execute("ALTER TABLE period_closes ENABLE ROW LEVEL SECURITY")
+    op.execute(GUARD_FUNCTION)
+    for trigger in GUARD_TRIGGERS:
+        op.execute(trigger)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Closed movements keep status closed; only the guard and the snapshots go
+    for event in EVENTS:
+        op.execute(f"DROP TRIGGER IF EXISTS movements_period_guard_{event} ON movements")
+    op.execute("DROP FUNCTION IF EXISTS movements_period_guard()")
+    op.drop_table('period_closes')
@@ -0,0 +1,290 @@
+"""typed_movement_columns
+
+Move movements.date / amount / type / status / created_at / updated_at from
+text and float to date, numeric(14,2), enums and timestamptz without a long
+table lock:
+
+0. refuse to start while rows hold values the typed columns cannot take
+   (a missing or empty status becomes 'pending'; nothing else is guessed)
+1. add nullable typed shadow columns, kept in sync by a row trigger
+2. backfill them in primary-key batches, each in its own transaction
+3. add NOT NULL checks, validate them and build the indexes concurrently
+4. swap the columns in one short transaction
+
+A value that does not convert becomes NULL in its shadow column instead of
+failing the write, so the old application keeps working during steps 1-3;
+such rows are reported before step 3. Steps 1-3 are idempotent: after
+fixing the reported rows, run the upgrade again and it picks up from there.
+
+Revision ID: 4412d092e634
+Revises: 4acf37766a0c
+Create Date: 2026-10-17 12:41:52.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '4412d092e634'
+down_revision: Union[str, Sequence[str], None] = '4acf37766a0c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# column: (typed column type, conversion of the current value as text {})
+COLUMNS = {
+    'date': ('date', '{}::date'),
+    'amount': ('numeric(14, 2)', "nullif(round({}::numeric, 2)::numeric(14, 2), 'NaN')"),
+    'type': ('movement_type', '{}::movement_type'),
+    'status': ('movement_status', "coalesce(nullif({}, ''), 'pending')::movement_status"),
+    'created_at': ('timestamptz', '{}::timestamptz'),
+    'updated_at': ('timestamptz', '{}::timestamptz'),
+}
+SAMPLE_SIZE = 20  # ids listed when rows cannot be converted
+
+# Keyset indexes on the converted columns are built under a temporary name
+# and take over the old names in the swap
+RENAMED_INDEXES = [
+    ('ix_movements_created_at_id', ['created_at', 'id']),
+    ('ix_movements_status_created_at_id', ['status', 'created_at', 'id']),
+    ('ix_movements_type_created_at_id', ['type', 'created_at', 'id']),
+]
+NEW_INDEXES = [
+    ('ix_movements_date_id', ['date', 'id']),
+    ('ix_movements_business_unit_id_date', ['business_unit_id', 'date']),
+]
+
+
+def _typed(column: str) -> str:
+    return f'{column}_typed'
+
+
+def _convert(column: str, value: str) -> str:
+    return f'movements_convert_{column}({value}::text)'
+
+
+def _convert_function(column: str) -> str:
+    """Conversion of one column that yields NULL instead of raising on a bad value."""
+    type_, expression = COLUMNS[column]
+    return f"""
+CREATE OR REPLACE FUNCTION movements_convert_{column}(value text) RETURNS {type_}
+LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN {expression.format('value')};
+EXCEPTION WHEN data_exception THEN
+    RETURN NULL;
+END;
+$$
+"""
+
+
+def _upsert_deltas(rows: str) -> str:
+    return f"""
+        INSERT INTO kpi_daily_rollups AS r
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(business_unit_id, ''), date, coalesce(status::text, ''),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+               sum(sign)
+        FROM ({rows}) AS changed
+        GROUP BY 1, 2, 3
+        HAVING sum(sign) <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'income') <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'expense') <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (business_unit_id, day, status) DO UPDATE SET
+            income_total = r.income_total + excluded.income_total,
+            expense_total = r.expense_total + excluded.expense_total,
+            movement_count = r.movement_count + excluded.movement_count;"""
+
+
+_ROLLUP_COLUMNS = "business_unit_id, date, status, type, amount"
+_NEW_ROWS = f"SELECT {_ROLLUP_COLUMNS}, 1 AS sign FROM new_rows"
+_OLD_ROWS = f"SELECT {_ROLLUP_COLUMNS}, -1 AS sign FROM old_rows"
+
+# Same as before except status::text, which works on both the text and the enum column
+ROLLUP_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION kpi_rollup_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{_upsert_deltas(_NEW_ROWS)}
+    ELSIF TG_OP = 'DELETE' THEN{_upsert_deltas(_OLD_ROWS)}
+    ELSIF TG_OP = 'UPDATE' THEN{_upsert_deltas(_NEW_ROWS + " UNION ALL " + _OLD_ROWS)}
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE kpi_daily_rollups;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+# Writes made while the backfill runs fill the typed columns themselves
+SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION movements_typed_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+{assignments}
+    RETURN NEW;
+END;
+$$
+""".format(assignments="\n".join(
+    f"    NEW.{_typed(column)} := {_convert(column, 'NEW.' + column)};" for column in COLUMNS
+))
+
+
+def _refuse_unconverted(conn, unconverted: dict) -> None:
+    """Fail with a report when any row matches its column's condition in `unconverted`."""
+    counts = conn.execute(sa.text("SELECT " + ", ".join(
+        f"count(*) FILTER (WHERE {condition})" for condition in unconverted.values()
+    ) + " FROM movements")).one()
+    if not any(counts):
+        return
+    ids = conn.execute(sa.text(
+        f"SELECT id FROM movements WHERE {' OR '.join(unconverted.values())} ORDER BY id LIMIT {SAMPLE_SIZE}"
+    )).scalars().all()
+    raise RuntimeError(
+        "movements has rows with values the typed columns cannot hold ("
+        + ", ".join(f"{column}: {count}" for column, count in zip(unconverted, counts) if count)
+        + f"), e.g. in rows {', '.join(ids)}. Correct or delete them and run the upgrade again."
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    for name, labels in (('movement_type', "'income', 'expense'"),
+                         ('movement_status', "'pending', 'classified', 'closed'")):
+        if not conn.execute(sa.text("SELECT to_regtype(:name)"), {"name": name}).scalar():
+            op.execute(f"CREATE TYPE {name} AS ENUM ({labels})")
+    for column in COLUMNS:
+        op.execute(_convert_function(column))
+    # Before any change to movements, so nothing is left behind when it fails
+    _refuse_unconverted(conn, {column: f"{_convert(column, column)} IS NULL" for column in COLUMNS})
+    op.execute(ROLLUP_FUNCTION)
+
+    op.execute("ALTER TABLE movements " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {_typed(column)} {type_}" for column, (type_, _) in COLUMNS.items()
+    ))
+    op.execute(SYNC_FUNCTION)
+    op.execute("DROP TRIGGER IF EXISTS movements_typed_sync ON movements")
+    op.execute(
+        "CREATE TRIGGER movements_typed_sync BEFORE INSERT OR UPDATE ON movements "
+        "FOR EACH ROW EXECUTE FUNCTION movements_typed_sync()"
+    )
+
+    with op.get_context().autocommit_block():
+        assignments = ", ".join(f"{_typed(column)} = {_convert(column, column)}" for column in COLUMNS)
+        last_id = ""
+        while True:
+            upto = conn.execute(
+                sa.text(
+                    "SELECT max(id) FROM (SELECT id FROM movements WHERE id > :last_id "
+                    "ORDER BY id LIMIT :batch_size) AS batch"
+                ),
+                {"last_id": last_id, "batch_size": BATCH_SIZE},
+            ).scalar()
+            if upto is None:
+                break
+            conn.execute(
+                sa.text(f"UPDATE movements SET {assignments} WHERE id > :last_id AND id <= :upto"),
+                {"last_id": last_id, "upto": upto},
+            )
+            last_id = upto
+
+        # Bad values written by the application since the check above; from
+        # here on NOT NULL checks refuse them (NOT VALID: new rows only)
+        _refuse_unconverted(conn, {column: f"{_typed(column)} IS NULL" for column in COLUMNS})
+        op.execute("ALTER TABLE movements " + ", ".join(
+            f"DROP CONSTRAINT IF EXISTS ck_{_typed(column)}_not_null, "
+            f"ADD CONSTRAINT ck_{_typed(column)}_not_null CHECK ({_typed(column)} IS NOT NULL) NOT VALID"
+            for column in COLUMNS
+        ))
+        # Full scans, but they only block schema changes, not reads or writes
+        for column in COLUMNS:
+            op.execute(f"ALTER TABLE movements VALIDATE CONSTRAINT ck_{_typed(column)}_not_null")
+        # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+        index_names = [f'{name}_typed' for name, _ in RENAMED_INDEXES] + [name for name, _ in NEW_INDEXES]
+        invalid = conn.execute(
+            sa.text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid AND c.relname = ANY(:names)"
+            ),
+            {"names": index_names},
+        ).scalars().all()
+        for name in invalid:
+            op.drop_index(name, table_name='movements', postgresql_concurrently=True, if_exists=True)
+        for name, columns in RENAMED_INDEXES:
+            op.create_index(f'{name}_typed', 'movements', [_typed(c) if c in COLUMNS else c for c in columns],
+                            postgresql_concurrently=True, if_not_exists=True)
+        for name, columns in NEW_INDEXES:
+            op.create_index(name, 'movements', [_typed(c) if c in COLUMNS else c for c in columns],
+                            postgresql_concurrently=True, if_not_exists=True)
+
+    # The swap: catalog changes only, SET NOT NULL is proven by the validated checks
+    op.execute("LOCK TABLE movements IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER movements_typed_sync ON movements")
+    op.execute("DROP FUNCTION movements_typed_sync()")
+    for column in COLUMNS:
+        op.execute(f"DROP FUNCTION movements_convert_{column}(text)")
+    op.execute("ALTER TABLE movements " + ", ".join(f"DROP COLUMN {column}" for column in COLUMNS))
+    for column in COLUMNS:
+        op.execute(f"ALTER TABLE movements RENAME COLUMN {_typed(column)} TO {column}")
+    op.execute("ALTER TABLE movements " + ", ".join(f"ALTER COLUMN {column} SET NOT NULL" for column in COLUMNS))
+    op.execute("ALTER TABLE movements " + ", ".join(
+        f"DROP CONSTRAINT ck_{_typed(column)}_not_null" for column in COLUMNS
+    ))
+    for name, _ in RENAMED_INDEXES:
+        op.execute(f"ALTER INDEX {name}_typed RENAME TO {name}")
+
+    # The rollup is small (units x days x statuses); rewrite it in place. Rows
+    # whose day or status spell the same value differently are merged first
+    # (movements without a status became 'pending'), and empty rows, left over
+    # from movements deleted before the upgrade, are dropped.
+    op.execute("""
+        WITH old AS (DELETE FROM kpi_daily_rollups RETURNING *)
+        INSERT INTO kpi_daily_rollups
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT business_unit_id, to_char(day::date, 'YYYY-MM-DD'), coalesce(nullif(status, ''), 'pending'),
+               sum(income_total), sum(expense_total), sum(movement_count)
+        FROM old
+        WHERE movement_count <> 0
+        GROUP BY 1, 2, 3
+    """)
+    op.execute(
+        "ALTER TABLE kpi_daily_rollups "
+        "ALTER COLUMN day TYPE date USING day::date, "
+        "ALTER COLUMN income_total TYPE numeric(18, 2) USING round(income_total::numeric, 2), "
+        "ALTER COLUMN expense_total TYPE numeric(18, 2) USING round(expense_total::numeric, 2)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Rewrites the table under an exclusive lock; not meant for production use
+    with op.get_context().autocommit_block():
+        for name, _ in NEW_INDEXES:
+            op.drop_index(name, table_name='movements', postgresql_concurrently=True, if_exists=True)
+
+    # Render timestamps as the ISO strings the application used to write
+    op.execute("SET LOCAL timezone = 'UTC'")
+    op.execute(
+        "ALTER TABLE kpi_daily_rollups "
+        "ALTER COLUMN day TYPE varchar USING day::text, "
+        "ALTER COLUMN income_total TYPE double precision, "
+        "ALTER COLUMN expense_total TYPE double precision"
+    )
+    op.execute(
+        "ALTER TABLE movements "
+        "ALTER COLUMN date TYPE varchar USING date::text, "
+        "ALTER COLUMN amount TYPE double precision, "
+        "ALTER COLUMN type TYPE varchar USING type::text, "
+        "ALTER COLUMN status TYPE varchar USING status::text, "
+        "ALTER COLUMN status DROP NOT NULL, "
+        "ALTER COLUMN created_at TYPE varchar USING to_json(created_at) #>> '{}', "
+        "ALTER COLUMN updated_at TYPE varchar USING to_json(updated_at) #>> '{}'"
+    )
+    op.execute("DROP TYPE movement_status")
+    op.execute("DROP TYPE movement_type")
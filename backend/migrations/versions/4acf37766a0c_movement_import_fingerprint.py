@@ -0,0 +1,33 @@
+"""movement_import_fingerprint
+
+Revision ID: 4acf37766a0c
+Revises: 0b1a6b821024
+Create Date: 2026-10-17 11:20:05.731942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '4acf37766a0c'
+down_revision: Union[str, Sequence[str], None] = '0b1a6b821024'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('movements', sa.Column('fingerprint', sa.String(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ux_movements_fingerprint', 'movements', ['fingerprint'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ux_movements_fingerprint', table_name='movements',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('movements', 'fingerprint')
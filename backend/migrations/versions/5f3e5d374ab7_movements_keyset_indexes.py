@@ -0,0 +1,38 @@
+"""movements_keyset_indexes
+
+Revision ID: 5f3e5d374ab7
+Revises: e8de99727e8a
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '5f3e5d374ab7'
+down_revision: Union[str, Sequence[str], None] = 'e8de99727e8a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_movements_created_at_id', ['created_at', 'id']),
+    ('ix_movements_status_created_at_id', ['status', 'created_at', 'id']),
+    ('ix_movements_type_created_at_id', ['type', 'created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction; build without locking writes
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'movements', columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='movements', postgresql_concurrently=True, if_exists=True)
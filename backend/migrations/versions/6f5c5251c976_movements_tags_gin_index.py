@@ -0,0 +1,33 @@
+"""movements_tags_gin_index
+
+Revision ID: 6f5c5251c976
+Revises: 4412d092e634
+Create Date: 2026-10-17 13:26:40.112873
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '6f5c5251c976'
+down_revision: Union[str, Sequence[str], None] = '4412d092e634'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # jsonb_path_ops only supports @>, but is smaller and faster than the default jsonb_ops
+    with op.get_context().autocommit_block():
+        op.create_index('ix_movements_tags', 'movements', ['tags'], postgresql_using='gin',
+                        postgresql_ops={'tags': 'jsonb_path_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_movements_tags', table_name='movements',
+                      postgresql_concurrently=True, if_exists=True)
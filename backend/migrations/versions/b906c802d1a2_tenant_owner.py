@@ -0,0 +1,336 @@
+"""tenant_owner
+
+Scope movements, business units and tags to the user who owns them:
+
+1. owner_id columns (foreign key to users) on the three tables; rows that
+   predate ownership go to the first admin, or the oldest user (the upgrade
+   refuses to run while there are rows but no user), and the columns become
+   NOT NULL once every row has an owner
+2. the KPI rollup and the ETag counters gain an owner dimension, and the
+   reference data notifications name the owners a write touched
+3. the btree indexes on movements are rebuilt concurrently with owner_id as
+   their leading column; the fingerprint becomes unique per owner
+4. row-level security policies on owner_id = app.owner_id (see tenancy.py)
+
+Revision ID: b906c802d1a2
+Revises: c6089e8dadf0
+Create Date: 2026-10-17 16:30:12.208461
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b906c802d1a2'
+down_revision: Union[str, Sequence[str], None] = 'c6089e8dadf0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+TENANT_TABLES = ('movements', 'business_units', 'tags')
+REFERENCE_TABLES = ('business_units', 'tags')
+EVENTS = ('insert', 'update', 'delete', 'truncate')
+
+# (old name, old columns, new name, new columns, unique)
+MOVEMENT_INDEXES = [
+    ('ix_movements_created_at_id', ['created_at', 'id'],
+     'ix_movements_owner_created_at_id', ['owner_id', 'created_at', 'id'], False),
+    ('ix_movements_status_created_at_id', ['status', 'created_at', 'id'],
+     'ix_movements_owner_status_created_at_id', ['owner_id', 'status', 'created_at', 'id'], False),
+    ('ix_movements_type_created_at_id', ['type', 'created_at', 'id'],
+     'ix_movements_owner_type_created_at_id', ['owner_id', 'type', 'created_at', 'id'], False),
+    ('ix_movements_date_id', ['date', 'id'],
+     'ix_movements_owner_date_id', ['owner_id', 'date', 'id'], False),
+    ('ix_movements_business_unit_id_date', ['business_unit_id', 'date'],
+     'ix_movements_owner_business_unit_id_date', ['owner_id', 'business_unit_id', 'date'], False),
+    ('ux_movements_fingerprint', ['fingerprint'],
+     'ux_movements_owner_fingerprint', ['owner_id', 'fingerprint'], True),
+]
+NEW_INDEXES = [
+    ('ix_business_units_owner_created_at', 'business_units', ['owner_id', 'created_at', 'id']),
+    ('ix_tags_owner_created_at', 'tags', ['owner_id', 'created_at', 'id']),
+    ('ix_kpi_daily_rollups_owner_day', 'kpi_daily_rollups', ['owner_id', 'day']),
+]
+
+# Rows that predate ownership belong to the first admin, or else the oldest user
+DEFAULT_OWNER = "SELECT id FROM users ORDER BY role = 'admin' DESC, created_at, id LIMIT 1"
+
+
+def _statement_triggers(name: str, table: str, function: str) -> list:
+    return [
+        f"""CREATE TRIGGER {table}_{name}_insert AFTER INSERT ON {table}
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+        f"""CREATE TRIGGER {table}_{name}_update AFTER UPDATE ON {table}
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+        f"""CREATE TRIGGER {table}_{name}_delete AFTER DELETE ON {table}
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+        f"""CREATE TRIGGER {table}_{name}_truncate AFTER TRUNCATE ON {table}
+           FOR EACH STATEMENT EXECUTE FUNCTION {function}()""",
+    ]
+
+
+def _per_event(name: str, branch, truncate: str) -> str:
+    """A statement trigger function with one branch per event (transition tables differ by event)."""
+    return f"""
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{branch("SELECT {columns}, 1 AS sign FROM new_rows")}
+    ELSIF TG_OP = 'DELETE' THEN{branch("SELECT {columns}, -1 AS sign FROM old_rows")}
+    ELSIF TG_OP = 'UPDATE' THEN{branch(
+        "SELECT {columns}, 1 AS sign FROM new_rows UNION ALL SELECT {columns}, -1 AS sign FROM old_rows"
+    )}
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        {truncate}
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+
+def _rollup_deltas(rows: str, owner: bool) -> str:
+    owner_column, owner_value = ("owner_id, ", "coalesce(owner_id, ''), ") if owner else ("", "")
+    groups = "1, 2, 3, 4" if owner else "1, 2, 3"
+    rows = rows.format(columns=f"{owner_column}business_unit_id, date, status, type, amount")
+    return f"""
+        INSERT INTO kpi_daily_rollups AS r
+            ({owner_column}business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT {owner_value}coalesce(business_unit_id, ''), date, coalesce(status::text, ''),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+               sum(sign)
+        FROM ({rows}) AS changed
+        GROUP BY {groups}
+        HAVING sum(sign) <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'income') <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'expense') <> 0
+        ORDER BY {groups}
+        ON CONFLICT ({owner_column}business_unit_id, day, status) DO UPDATE SET
+            income_total = r.income_total + excluded.income_total,
+            expense_total = r.expense_total + excluded.expense_total,
+            movement_count = r.movement_count + excluded.movement_count;"""
+
+
+def _version_bump(rows: str) -> str:
+    return f"""
+        INSERT INTO table_versions AS v (table_name, owner_id, version)
+        SELECT DISTINCT TG_TABLE_NAME, coalesce(owner_id, ''), 1 FROM ({rows.format(columns='owner_id')}) AS changed
+        ORDER BY 2
+        ON CONFLICT (table_name, owner_id) DO UPDATE SET version = v.version + 1;"""
+
+
+def _notify(rows: str) -> str:
+    return f"""
+        PERFORM pg_notify('reference_data', TG_TABLE_NAME || ':' || owner)
+        FROM (SELECT DISTINCT coalesce(owner_id, '') AS owner
+              FROM ({rows.format(columns='owner_id')}) AS changed) AS owners;"""
+
+
+ROLLUP_FUNCTION = _per_event(
+    'kpi_rollup_apply', lambda rows: _rollup_deltas(rows, owner=True), "TRUNCATE kpi_daily_rollups;"
+)
+VERSION_FUNCTION = _per_event(
+    'table_version_bump', _version_bump,
+    "UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;",
+)
+NOTIFY_FUNCTION = _per_event(
+    'reference_data_notify', _notify, "PERFORM pg_notify('reference_data', TG_TABLE_NAME);"
+)
+
+# As of the previous revisions, for downgrade
+OLD_ROLLUP_FUNCTION = _per_event(
+    'kpi_rollup_apply', lambda rows: _rollup_deltas(rows, owner=False), "TRUNCATE kpi_daily_rollups;"
+)
+OLD_VERSION_FUNCTION = """
+CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_versions AS v (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = v.version + 1;
+    RETURN NULL;
+END;
+$$
+"""
+OLD_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION reference_data_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('reference_data', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$
+"""
+
+RLS_POLICY = """
+CREATE POLICY {table}_owner_isolation ON {table}
+    USING (owner_id = current_setting('app.owner_id', true))
+    WITH CHECK (owner_id = current_setting('app.owner_id', true))
+"""
+
+
+def _backfill_owner(conn, owner_id: str) -> None:
+    """Assign unowned rows to `owner_id` in primary-key batches, one transaction each."""
+    for table in TENANT_TABLES:
+        last_id = ""
+        while True:
+            upto = conn.execute(
+                sa.text(
+                    f"SELECT max(id) FROM (SELECT id FROM {table} WHERE id > :last_id "
+                    "ORDER BY id LIMIT :batch_size) AS batch"
+                ),
+                {"last_id": last_id, "batch_size": BATCH_SIZE},
+            ).scalar()
+            if upto is None:
+                break
+            conn.execute(
+                sa.text(
+                    f"UPDATE {table} SET owner_id = :owner_id "
+                    "WHERE id > :last_id AND id <= :upto AND owner_id IS NULL"
+                ),
+                {"owner_id": owner_id, "last_id": last_id, "upto": upto},
+            )
+            last_id = upto
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    if conn.execute(sa.text(DEFAULT_OWNER)).scalar() is None and conn.execute(sa.text(
+        "SELECT " + " OR ".join(f"EXISTS (SELECT 1 FROM {table})" for table in TENANT_TABLES)
+    )).scalar():
+        raise RuntimeError(
+            "Movements, business units or tags exist but there is no user to own them. "
+            "Register a user (or delete the rows) and run the upgrade again."
+        )
+
+    for table in TENANT_TABLES:
+        op.add_column(table, sa.Column('owner_id', sa.String(), nullable=True))
+        op.create_foreign_key(f'{table}_owner_id_fkey', table, 'users', ['owner_id'], ['id'], ondelete='CASCADE')
+
+    # Existing totals start out unowned and follow their rows to the owner during the backfill
+    op.execute("LOCK TABLE movements IN SHARE ROW EXCLUSIVE MODE")
+    op.add_column('kpi_daily_rollups', sa.Column('owner_id', sa.String(), nullable=False, server_default=''))
+    op.alter_column('kpi_daily_rollups', 'owner_id', server_default=None)
+    op.drop_constraint('kpi_daily_rollups_pkey', 'kpi_daily_rollups', type_='primary')
+    op.create_primary_key('kpi_daily_rollups_pkey', 'kpi_daily_rollups',
+                          ['owner_id', 'business_unit_id', 'day', 'status'])
+    op.execute(ROLLUP_FUNCTION)
+
+    # Old counters are per table only; every ETag changes anyway
+    op.execute("DELETE FROM table_versions")
+    op.add_column('table_versions', sa.Column('owner_id', sa.String(), nullable=False, server_default=''))
+    op.alter_column('table_versions', 'owner_id', server_default=None)
+    op.drop_constraint('table_versions_pkey', 'table_versions', type_='primary')
+    op.create_primary_key('table_versions_pkey', 'table_versions', ['table_name', 'owner_id'])
+    op.execute(VERSION_FUNCTION)
+    for table in TENANT_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_version_bump ON {table}")
+        for trigger in _statement_triggers('version', table, 'table_version_bump'):
+            op.execute(trigger)
+
+    op.execute(NOTIFY_FUNCTION)
+    for table in REFERENCE_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_reference_notify ON {table}")
+        for trigger in _statement_triggers('reference_notify', table, 'reference_data_notify'):
+            op.execute(trigger)
+
+    for table in TENANT_TABLES:
+        op.execute(RLS_POLICY.format(table=table))
+        op.execute(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY")
+
+    with op.get_context().autocommit_block():
+        owner_id = conn.execute(sa.text(DEFAULT_OWNER)).scalar()
+        if owner_id is not None:
+            _backfill_owner(conn, owner_id)
+
+        # NOT NULL without a long lock: a NOT VALID check holds for new rows at once,
+        # rows written since the backfill are assigned, and validating the check only
+        # blocks schema changes. SET NOT NULL then trusts the check instead of scanning.
+        for table in TENANT_TABLES:
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT ck_{table}_owner_id_not_null "
+                       "CHECK (owner_id IS NOT NULL) NOT VALID")
+            if owner_id is not None:
+                conn.execute(sa.text(f"UPDATE {table} SET owner_id = :owner_id WHERE owner_id IS NULL"),
+                             {"owner_id": owner_id})
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT ck_{table}_owner_id_not_null")
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN owner_id SET NOT NULL")
+            op.execute(f"ALTER TABLE {table} DROP CONSTRAINT ck_{table}_owner_id_not_null")
+        conn.execute(sa.text(
+            "DELETE FROM kpi_daily_rollups WHERE owner_id = '' "
+            "AND movement_count = 0 AND income_total = 0 AND expense_total = 0"
+        ))
+
+        for old_name, _, new_name, columns, unique in MOVEMENT_INDEXES:
+            op.create_index(new_name, 'movements', columns, unique=unique,
+                            postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index(old_name, table_name='movements', postgresql_concurrently=True, if_exists=True)
+        for name, table, columns in NEW_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fails if two owners imported the same statement line: the fingerprint becomes globally unique again
+    with op.get_context().autocommit_block():
+        for name, table, _ in NEW_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+        for old_name, old_columns, new_name, _, unique in MOVEMENT_INDEXES:
+            op.create_index(old_name, 'movements', old_columns, unique=unique,
+                            postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index(new_name, table_name='movements', postgresql_concurrently=True, if_exists=True)
+
+    for table in TENANT_TABLES:
+        op.execute(f"ALTER TABLE {table} DISABLE ROW LEVEL SECURITY")
+        op.execute(f"DROP POLICY IF EXISTS {table}_owner_isolation ON {table}")
+
+    for table in REFERENCE_TABLES:
+        for event in EVENTS:
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_reference_notify_{event} ON {table}")
+    op.execute(OLD_NOTIFY_FUNCTION)
+    for table in REFERENCE_TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_reference_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION reference_data_notify()"
+        )
+
+    for table in TENANT_TABLES:
+        for event in EVENTS:
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_version_{event} ON {table}")
+    op.execute("DELETE FROM table_versions")
+    op.drop_constraint('table_versions_pkey', 'table_versions', type_='primary')
+    op.drop_column('table_versions', 'owner_id')
+    op.create_primary_key('table_versions_pkey', 'table_versions', ['table_name'])
+    op.execute(OLD_VERSION_FUNCTION)
+    for table in TENANT_TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_version_bump AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump()"
+        )
+
+    op.execute("LOCK TABLE movements IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(OLD_ROLLUP_FUNCTION)
+    op.execute("DELETE FROM kpi_daily_rollups")
+    op.drop_constraint('kpi_daily_rollups_pkey', 'kpi_daily_rollups', type_='primary')
+    op.drop_column('kpi_daily_rollups', 'owner_id')
+    op.create_primary_key('kpi_daily_rollups_pkey', 'kpi_daily_rollups', ['business_unit_id', 'day', 'status'])
+    op.execute("""
+        INSERT INTO kpi_daily_rollups
+            (business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(business_unit_id, ''), date, status::text,
+               coalesce(sum(amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(amount) FILTER (WHERE type = 'expense'), 0),
+               count(*)
+        FROM movements
+        GROUP BY 1, 2, 3
+    """)
+
+    for table in TENANT_TABLES:
+        op.drop_constraint(f'{table}_owner_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'owner_id')
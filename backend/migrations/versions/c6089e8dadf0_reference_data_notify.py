@@ -0,0 +1,49 @@
+"""reference_data_notify
+
+NOTIFY reference_data with the table name after every write statement on
+business_units and tags, for the per-worker reference cache.
+
+Revision ID: c6089e8dadf0
+Revises: ce33a539d8ae
+Create Date: 2026-10-17 15:48:09.517324
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c6089e8dadf0'
+down_revision: Union[str, Sequence[str], None] = 'ce33a539d8ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CACHED_TABLES = ('business_units', 'tags')
+
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION reference_data_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('reference_data', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTION)
+    for table in CACHED_TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_reference_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION reference_data_notify()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in CACHED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_reference_notify ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS reference_data_notify()")
@@ -0,0 +1,57 @@
+"""table_versions
+
+Per-table change counters for ETags, bumped by statement-level triggers
+on movements, business_units and tags.
+
+Revision ID: ce33a539d8ae
+Revises: efcf6db5463e
+Create Date: 2026-10-17 15:10:42.381206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'ce33a539d8ae'
+down_revision: Union[str, Sequence[str], None] = 'efcf6db5463e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VERSIONED_TABLES = ('movements', 'business_units', 'tags')
+
+VERSION_FUNCTION = """
+CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_versions AS v (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = v.version + 1;
+    RETURN NULL;
+END;
+$$
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'table_versions',
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name'),
+    )
+    op.execute(VERSION_FUNCTION)
+    for table in VERSIONED_TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_version_bump AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION table_version_bump()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in VERSIONED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_version_bump ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS table_version_bump()")
+    op.drop_table('table_versions')
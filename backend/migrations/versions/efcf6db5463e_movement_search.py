@@ -0,0 +1,77 @@
+"""movement_search
+
+Stored Spanish tsvector over description and responsible with a GIN index,
+plus a trigram index on the description for the fuzzy fallback when the
+pg_trgm extension is available.
+
+Adding a stored generated column rewrites movements under an exclusive
+lock; run it in a maintenance window on large tables.
+
+Revision ID: efcf6db5463e
+Revises: 6f5c5251c976
+Create Date: 2026-10-17 14:02:11.904316
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'efcf6db5463e'
+down_revision: Union[str, Sequence[str], None] = '6f5c5251c976'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+FOLD_FUNCTION = """
+CREATE OR REPLACE FUNCTION search_fold(text) RETURNS text
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT lower(translate($1,
+        'ÁÀÂÄÉÈÊËÍÌÎÏÓÒÔÖÚÙÛÜÑÇáàâäéèêëíìîïóòôöúùûüñç',
+        'AAAAEEEEIIIIOOOOUUUUNCaaaaeeeeiiiioooouuuunc'))
+$$
+"""
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('spanish', search_fold(coalesce(description, ''))), 'A') || "
+    "setweight(to_tsvector('spanish', search_fold(coalesce(responsible, ''))), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(FOLD_FUNCTION)
+    op.add_column('movements', sa.Column('search_vector', postgresql.TSVECTOR(),
+                                         sa.Computed(SEARCH_VECTOR, persisted=True)))
+
+    trigram = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first() is not None
+    if trigram:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    else:
+        logger.warning("pg_trgm is not available; skipping the fuzzy search index")
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_movements_search_vector', 'movements', ['search_vector'], postgresql_using='gin',
+                        postgresql_concurrently=True, if_not_exists=True)
+        if trigram:
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_movements_description_trgm "
+                "ON movements USING gin (search_fold(description) gin_trgm_ops)"
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_movements_description_trgm', table_name='movements',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_movements_search_vector', table_name='movements',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('movements', 'search_vector')
+    op.execute("DROP FUNCTION search_fold(text)")
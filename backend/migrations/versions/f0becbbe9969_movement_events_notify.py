@@ -0,0 +1,87 @@
+"""movement_events_notify
+
+NOTIFY movement_events after every write statement on movements, once per
+owner, with the row ids and the KPI change, for the live update streams
+(see live.py).
+
+Revision ID: f0becbbe9969
+Revises: 425651eefb9f
+Create Date: 2026-10-17 22:14:36.281905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f0becbbe9969'
+down_revision: Union[str, Sequence[str], None] = '425651eefb9f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EVENTS = ('insert', 'update', 'delete', 'truncate')
+
+
+def _notify(changes: str) -> str:
+    return f"""
+        PERFORM pg_notify('movement_events', json_build_object(
+            'op', lower(TG_OP),
+            'owner', owner_id,
+            'count', count(DISTINCT id),
+            'ids', CASE WHEN count(DISTINCT id) <= 100 THEN array_agg(DISTINCT id) END,
+            'income', coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+            'expense', coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+            'movements', sum(sign),
+            'pending', coalesce(sum(sign) FILTER (WHERE status = 'pending'), 0)
+        )::text)
+        FROM ({changes}) AS changed
+        WHERE owner_id IS NOT NULL
+        GROUP BY owner_id;"""
+
+
+NEW_ROWS = "SELECT owner_id, id, type, amount, status, 1 AS sign FROM new_rows"
+OLD_ROWS = "SELECT owner_id, id, type, amount, status, -1 AS sign FROM old_rows"
+
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION movement_events_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{_notify(NEW_ROWS)}
+    ELSIF TG_OP = 'DELETE' THEN{_notify(OLD_ROWS)}
+    ELSIF TG_OP = 'UPDATE' THEN{_notify(NEW_ROWS + " UNION ALL " + OLD_ROWS)}
+    ELSE
+        PERFORM pg_notify('movement_events', json_build_object('op', 'truncate')::text);
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+NOTIFY_TRIGGERS = [
+    """CREATE TRIGGER movements_events_insert AFTER INSERT ON movements
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+    """CREATE TRIGGER movements_events_update AFTER UPDATE ON movements
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+    """CREATE TRIGGER movements_events_delete AFTER DELETE ON movements
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+    """CREATE TRIGGER movements_events_truncate AFTER TRUNCATE ON movements
+       FOR EACH STATEMENT EXECUTE FUNCTION movement_events_notify()""",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTION)
+    for trigger in NOTIFY_TRIGGERS:
+        op.execute(trigger)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for event in EVENTS:
+        op.execute(f"DROP TRIGGER IF EXISTS movements_events_{event} ON movements")
+    op.execute("DROP FUNCTION IF EXISTS movement_events_notify()")
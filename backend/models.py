@@ -1,6 +1,9 @@
-from sqlalchemy import Column, String, Float, Text
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import (
+    Column, String, Text, Integer, BigInteger, Index, Date, DateTime, Numeric, Enum, Computed, ForeignKey, or_,
+)
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import DeclarativeBase, deferred
+from typing import Sequence
 import uuid
 
 
@@ -27,27 +30,79 @@ class User(Base):
     updated_at = Column(String, nullable=False)
 
 
+MOVEMENT_TYPES = ("income", "expense")
+MOVEMENT_STATUSES = ("pending", "classified", "closed")
+
+# Column order of the records given to COPY by bulk loads
+MOVEMENT_COPY_COLUMNS = (
+    "id", "type", "amount", "currency", "description", "responsible",
+    "business_unit_id", "status", "date", "tags", "created_at", "updated_at", "owner_id",
+)
+
+# search_fold() (lowercase, accents removed) is created with the schema, see search.py
+MOVEMENT_SEARCH_VECTOR = (
+    "setweight(to_tsvector('spanish', search_fold(coalesce(description, ''))), 'A') || "
+    "setweight(to_tsvector('spanish', search_fold(coalesce(responsible, ''))), 'B')"
+)
+
+
 class Movement(Base):
     __tablename__ = "movements"
+    __table_args__ = (
+        # Every query is scoped to one owner, so the btree indexes lead with owner_id:
+        # each tenant scans only its own slice, however big the others are.
+        # Keyset pagination over (created_at, id), with and without the list filters
+        Index("ix_movements_owner_created_at_id", "owner_id", "created_at", "id"),
+        Index("ix_movements_owner_status_created_at_id", "owner_id", "status", "created_at", "id"),
+        Index("ix_movements_owner_type_created_at_id", "owner_id", "type", "created_at", "id"),
+        # Date-range filters, exports and per-unit reports
+        Index("ix_movements_owner_date_id", "owner_id", "date", "id"),
+        Index("ix_movements_owner_business_unit_id_date", "owner_id", "business_unit_id", "date"),
+        # Tag filters are containment (@>) queries; jsonb_path_ops indexes exactly those
+        Index("ix_movements_tags", "tags", postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}),
+        Index("ix_movements_search_vector", "search_vector", postgresql_using="gin"),
+        # Re-imported statement lines are skipped with ON CONFLICT DO NOTHING, per owner.
+        # Unique indexes must contain the partition key; the fingerprint covers the date anyway.
+        Index("ux_movements_owner_fingerprint", "owner_id", "fingerprint", "date", unique=True),
+        # One partition per month of the movement date, see partitions.py
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    type = Column(String, nullable=False)  # income | expense
-    amount = Column(Float, nullable=False)
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # tenant
+    type = Column(Enum(*MOVEMENT_TYPES, name="movement_type"), nullable=False)
+    amount = Column(Numeric(14, 2), nullable=False)
     currency = Column(String, default="CRC")
     description = Column(Text, default="")
     responsible = Column(String, nullable=True)
     business_unit_id = Column(String, nullable=True)
-    status = Column(String, default="pending")  # pending | classified | closed
-    date = Column(String, nullable=False)
+    status = Column(Enum(*MOVEMENT_STATUSES, name="movement_status"), nullable=False, default="pending")
+    date = Column(Date, primary_key=True)  # the partition key, so part of the primary key
     tags = Column(JSONB, default=[])
-    created_at = Column(String, nullable=False)
-    updated_at = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=True)  # imported lines only, see importers/
+    search_vector = deferred(Column(TSVECTOR, Computed(MOVEMENT_SEARCH_VECTOR, persisted=True)))
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    @classmethod
+    def tagged(cls, tags: Sequence[str], match: str = "any"):
+        """
+        Condition for movements carrying any (or all) of `tags`.
+        Written as @> containments so the GIN index on tags serves it.
+        """
+        if match == "all":
+            return cls.tags.contains(list(tags))
+        return or_(*(cls.tags.contains([tag]) for tag in tags))
 
 
 class BusinessUnit(Base):
     __tablename__ = "business_units"
+    __table_args__ = (
+        Index("ix_business_units_owner_created_at", "owner_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String, nullable=False)
     type = Column(String, default="other")  # branch | brand | event | other
     created_at = Column(String, nullable=False)
@@ -55,7 +110,94 @@ class BusinessUnit(Base):
 
 class Tag(Base):
     __tablename__ = "tags"
+    __table_args__ = (
+        Index("ix_tags_owner_created_at", "owner_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String, nullable=False)
     created_at = Column(String, nullable=False)
+
+
+class KpiDailyRollup(Base):
+    """
+    Per owner, business unit, day and status totals of the movements table.
+    Maintained by statement-level triggers on movements (see rollups.py),
+    so it changes in the same transaction as the rows it summarizes.
+    """
+    __tablename__ = "kpi_daily_rollups"
+    __table_args__ = (
+        # KPIs without a unit filter read one owner's date range across all units
+        Index("ix_kpi_daily_rollups_owner_day", "owner_id", "day"),
+    )
+
+    owner_id = Column(String, primary_key=True, default="")  # "" = no owner
+    business_unit_id = Column(String, primary_key=True, default="")  # "" = no unit
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    income_total = Column(Numeric(18, 2), nullable=False, default=0)
+    expense_total = Column(Numeric(18, 2), nullable=False, default=0)
+    movement_count = Column(Integer, nullable=False, default=0)
+
+
+class KpiArchivedRollup(Base):
+    """
+    Rollup rows of the months moved to the cold archive (see archive.py).
+    KPI queries add them to the live rollup; restoring a month drops them again.
+    """
+    __tablename__ = "kpi_archived_rollups"
+    __table_args__ = (
+        Index("ix_kpi_archived_rollups_owner_day", "owner_id", "day"),
+    )
+
+    owner_id = Column(String, primary_key=True, default="")
+    business_unit_id = Column(String, primary_key=True, default="")
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    income_total = Column(Numeric(18, 2), nullable=False, default=0)
+    expense_total = Column(Numeric(18, 2), nullable=False, default=0)
+    movement_count = Column(Integer, nullable=False, default=0)
+
+
+class MovementArchive(Base):
+    """A month of movements held in a Parquet file of the archive directory instead of Postgres."""
+    __tablename__ = "movement_archives"
+
+    month = Column(Date, primary_key=True)  # first day of the month
+    file = Column(String, nullable=False)  # relative to ARCHIVE_DIR
+    row_count = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class PeriodClose(Base):
+    """
+    A closed accounting month of one business unit, with its totals frozen at
+    close time (see periods.py). Rows are never updated; the movements they
+    cover can no longer be written.
+    """
+    __tablename__ = "period_closes"
+
+    owner_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    business_unit_id = Column(String, primary_key=True, default="")  # "" = movements without a unit
+    month = Column(Date, primary_key=True)  # first day of the month
+    income_total = Column(Numeric(18, 2), nullable=False)
+    expense_total = Column(Numeric(18, 2), nullable=False)
+    movement_count = Column(Integer, nullable=False)
+    # {tag: {"income": ..., "expense": ..., "movement_count": ...}} over the movements carrying the tag
+    tag_totals = Column(JSONB, nullable=False, default=dict)
+    closed_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class TableVersion(Base):
+    """
+    Change counter per table and owner, bumped by statement triggers for
+    every owner a write touches (see etags.py). Only compared for equality,
+    never interpreted.
+    """
+    __tablename__ = "table_versions"
+
+    table_name = Column(String, primary_key=True)
+    owner_id = Column(String, primary_key=True, default="")  # "" = no owner
+    version = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,37 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Cursors are opaque to clients: a URL-safe base64 encoding of the sort key
+of the last row on a page. The next page is fetched with a row comparison
+against that key, so every page costs the same regardless of depth.
+"""
+import base64
+import binascii
+import json
+from typing import Any, Sequence
+
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Sequence[Any]:
+    """
+    Decode a cursor produced by encode_cursor.
+    Raises 400 if the cursor is malformed or does not carry `size` values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
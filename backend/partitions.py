@@ -0,0 +1,275 @@
+"""
+Monthly range partitions of the movements table.
+
+`movements` is partitioned by RANGE (date) into one table per calendar month
+(movements_pYYYY_MM), plus movements_default for rows whose month has no
+partition yet, so an insert never fails for want of one. Queries filtered on
+the movement date (list and export date ranges, tag-filtered KPIs) are
+pruned to the months they can match.
+
+movements_ensure_partitions(first, last) creates the missing partitions from
+`first` to `last` and splits any month found in the default partition out
+into its own. A partition is built as a plain table and then attached, which
+only takes a SHARE UPDATE EXCLUSIVE lock on movements: reads and writes
+carry on. The API runs it at startup and every PARTITION_CHECK_INTERVAL
+seconds for the previous month through PARTITION_MONTHS_AHEAD months ahead.
+
+Old months leave with `python partitions.py detach 2024-01`: DETACH PARTITION
+is a catalog change, not a DELETE, and the month stays behind as a standalone
+table to archive or drop (--drop). Its totals leave the KPI rollup in the
+same transaction. `python partitions.py list` shows the partitions and their
+estimated sizes, `python partitions.py ensure` runs the maintenance once.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, List, Optional, TypeVar, Union
+
+from sqlalchemy import DDL, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from database import engine
+from models import Movement
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+CHECK_INTERVAL = float(os.environ.get("PARTITION_CHECK_INTERVAL", "21600"))  # seconds
+# Attaching and detaching queue behind long queries; give up and retry rather than stall everyone behind us
+LOCK_TIMEOUT = os.environ.get("PARTITION_LOCK_TIMEOUT", "5s")
+LOCK_ATTEMPTS = 10
+
+MAINTENANCE_LOCK_ID = 7_150_002  # advisory lock held while partitions are created
+LOCK_NOT_AVAILABLE = "55P03"
+
+DEFAULT_PARTITION = "movements_default"
+
+# The generated search_vector cannot be inserted, hence the explicit column list when rows move
+ENSURE_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION movements_ensure_partitions(first_month date, last_month date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month date;
+    part text;
+    columns text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock({MAINTENANCE_LOCK_ID});
+    -- Rows routed to the default partition meanwhile would make the ATTACH fail
+    LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE;
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = 'movements'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+    FOR month IN
+        SELECT generate_series(date_trunc('month', first_month), date_trunc('month', last_month),
+                               interval '1 month')::date
+        UNION
+        SELECT DISTINCT date_trunc('month', date)::date FROM {DEFAULT_PARTITION}
+        ORDER BY 1
+    LOOP
+        part := 'movements_p' || to_char(month, 'YYYY_MM');
+        -- A detached month keeps its name until it is archived; new rows for it wait in the default partition
+        CONTINUE WHEN to_regclass(part) IS NOT NULL;
+        EXECUTE format('CREATE TABLE %I (LIKE movements INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+                       'INCLUDING GENERATED INCLUDING INDEXES)', part);
+        EXECUTE format('WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= $1 AND date < $2 RETURNING %s) '
+                       'INSERT INTO %I (%s) SELECT %s FROM moved', columns, part, columns, columns)
+            USING month, (month + interval '1 month')::date;
+        EXECUTE format('ALTER TABLE movements ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       part, month, (month + interval '1 month')::date);
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$
+"""
+
+# Fresh databases are built with metadata.create_all(); the monthly partitions follow from the maintenance
+event.listen(
+    Movement.__table__, "after_create", DDL(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF movements DEFAULT")
+)
+# DDL() applies %-formatting; the function's own format() placeholders are escaped
+event.listen(Movement.__table__, "after_create", DDL(ENSURE_FUNCTION.replace("%", "%%")))
+
+
+def month_start(day: date, months: int = 0) -> date:
+    """First day of the month `months` after (or before) the month of `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"movements_p{month:%Y_%m}"
+
+
+async def ensure_months(conn: Union[AsyncConnection, AsyncSession], first: date, last: date) -> int:
+    """Create the partitions for the months from `first` to `last` that lack one. Returns how many were created."""
+    await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    return (await conn.execute(
+        text("SELECT movements_ensure_partitions(:first, :last)"), {"first": first, "last": last}
+    )).scalar()
+
+
+async def ensure_partitions(conn: AsyncConnection, today: Optional[date] = None) -> int:
+    """Create the partitions from last month to MONTHS_AHEAD months ahead. Returns how many were created."""
+    today = today or date.today()
+    return await ensure_months(conn, month_start(today, -1), month_start(today, MONTHS_AHEAD))
+
+
+async def list_partitions(conn: AsyncConnection) -> List[dict]:
+    """Attached partitions in bound order, with the planner's row estimates."""
+    rows = await conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), greatest(c.reltuples, 0)::bigint
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'movements'::regclass
+        ORDER BY c.relname = :default, c.relname
+    """), {"default": DEFAULT_PARTITION})
+    return [{"name": name, "bounds": bounds, "rows": estimate} for name, bounds, estimate in rows.all()]
+
+
+async def detach_month(conn: AsyncConnection, month: date) -> str:
+    """
+    Detach the partition of `month` within the caller's transaction and take
+    its totals out of the KPI rollup. Returns the partition's name.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    # Taken up front so no write reaches the month between the rollup update and the detach
+    await conn.execute(text("LOCK TABLE movements IN ACCESS EXCLUSIVE MODE"))
+    attached = (await conn.execute(
+        text("SELECT 1 FROM pg_inherits WHERE inhparent = 'movements'::regclass AND inhrelid = to_regclass(:name)"),
+        {"name": name},
+    )).first()
+    if attached is None:
+        raise ValueError(f"{name} is not a partition of movements")
+    # The partition holds every movement of its month, so these are exactly its totals
+    await conn.execute(
+        text("DELETE FROM kpi_daily_rollups WHERE day >= :first AND day < :next"),
+        {"first": month, "next": month_start(month, 1)},
+    )
+    # DETACH fires no triggers; change every owner's movement ETags by hand
+    await conn.execute(text("UPDATE table_versions SET version = version + 1 WHERE table_name = 'movements'"))
+    await conn.execute(text(f"ALTER TABLE movements DETACH PARTITION {name}"))
+    return name
+
+
+async def with_lock_retries(work: Callable[[AsyncConnection], Awaitable[T]], what: str) -> T:
+    """Run `work` in a transaction that waits at most LOCK_TIMEOUT for each lock, retrying while movements is busy."""
+    for attempt in range(1, LOCK_ATTEMPTS + 1):
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                return await work(conn)
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE or attempt == LOCK_ATTEMPTS:
+                raise
+            logger.info(f"movements is busy, retrying {what} ({attempt}/{LOCK_ATTEMPTS})")
+            await asyncio.sleep(attempt)
+
+
+async def detach_partition(month: date, drop: bool = False) -> str:
+    """
+    Detach the partition of `month` from movements (and drop it with `drop`).
+    Returns the partition's name; the table stays behind unless dropped.
+    """
+    async def detach(conn: AsyncConnection) -> str:
+        name = await detach_month(conn, month)
+        if drop:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        return name
+
+    return await with_lock_retries(detach, f"the detach of {partition_name(month_start(month))}")
+
+
+class PartitionMaintainer:
+    """Background task that keeps the coming months' partitions in place."""
+
+    def __init__(self):
+        self.runs = 0
+        self.created = 0
+        self.failures = 0
+        self.last_run: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        async with engine.begin() as conn:
+            created = await ensure_partitions(conn)
+        self.runs += 1
+        self.created += created
+        self.last_run = datetime.now(timezone.utc)
+        if created:
+            logger.info(f"Created {created} movement partitions")
+        return created
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Partition maintenance failed: {e}")
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "created": self.created,
+            "failures": self.failures,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+maintainer = PartitionMaintainer()
+
+
+def _month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Manage the monthly partitions of the movements table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show the partitions and their estimated row counts")
+    sub.add_parser("ensure", help="create the partitions for the coming months now")
+    detach = sub.add_parser("detach", help="detach one month from movements")
+    detach.add_argument("month", type=_month, help="YYYY-MM")
+    detach.add_argument("--drop", action="store_true", help="drop the detached table instead of keeping it")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            async with engine.connect() as conn:
+                for partition in await list_partitions(conn):
+                    print(f"{partition['name']:<24} {partition['bounds']:<60} ~{partition['rows']} rows")
+        elif args.command == "ensure":
+            created = await maintainer.run_once()
+            logger.info(f"Partitions in place ({created} created)")
+        else:
+            name = await detach_partition(args.month, drop=args.drop)
+            logger.info(f"Dropped {name}" if args.drop else f"Detached {name}; it remains as a standalone table")
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    raise SystemExit(asyncio.run(_main()))
@@ -0,0 +1,208 @@
+"""
+Accounting period close.
+
+Closing a month of a business unit (POST /periods/close) marks its movements
+closed and freezes their totals in period_closes: income, expense and count,
+overall and per tag. From then on the period is read-only: a statement-level
+trigger on movements rejects any insert, update or delete that touches a
+closed period with SQLSTATE PERIOD_CLOSED, which the API answers with 409.
+While a close runs it holds an advisory lock on its owner, unit and month
+only; writes to that period fail the same way until it commits, and every
+other period and tenant carries on. Archived months cannot be closed: their
+movements left the table (see archive.py).
+
+Snapshots never change, so KPI queries read them instead of the rollup or
+the raw rows for every month that is closed for all of its units and lies
+wholly inside the requested range; only the rest is aggregated live (see
+kpis.py). Movements without a unit are closed as business_unit_id "", the
+rollup's key for them.
+"""
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import DDL, Integer, String, and_, cast, event, func, insert, literal, or_, select, true, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+import partitions
+from models import Movement, MovementArchive, PeriodClose
+
+PERIOD_CLOSED = "PC409"  # SQLSTATE raised by the guard trigger
+# Set to 'off' (SET LOCAL) by maintenance that rewrites closed periods as they were, e.g. archive restores
+GUARD_SETTING = "app.period_guard"
+
+# Advisory lock of one owner, unit and month: close_period holds it exclusively,
+# writes take it shared. Same expression here and in SQL (see period_lock_key).
+_LOCK_KEY = "hashtextextended(p.owner_id || ':' || p.business_unit_id || ':' || to_char(p.month, 'YYYY-MM-DD'), 0)"
+
+
+def _first_closing(rows: str) -> str:
+    """
+    Share the lock of every period `rows` touch; find one that is being closed.
+    Try-locks, not waits: the close may be waiting for rows this statement holds.
+    """
+    return f"""
+        SELECT p.business_unit_id, p.month INTO hit
+        FROM (
+            SELECT DISTINCT owner_id, coalesce(business_unit_id, '') AS business_unit_id,
+                date_trunc('month', date)::date AS month
+            FROM ({rows}) AS changed
+            WHERE owner_id IS NOT NULL
+        ) AS p
+        WHERE NOT pg_try_advisory_xact_lock_shared({_LOCK_KEY})
+        LIMIT 1;"""
+
+
+def _first_closed(rows: str) -> str:
+    """Find a row of `rows` (movement rows) in a closed period."""
+    return f"""
+        SELECT c.business_unit_id, c.month INTO hit
+        FROM ({rows}) AS changed
+        JOIN period_closes c ON c.owner_id = changed.owner_id
+            AND c.business_unit_id = coalesce(changed.business_unit_id, '')
+            AND c.month = date_trunc('month', changed.date)::date
+        -- Rows deleted along with their owner go wherever the owner goes
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = changed.owner_id)
+        LIMIT 1;"""
+
+
+def _check(rows: str) -> str:
+    # Two statements: the closed check must see a close that committed while the lock was taken
+    return f"""{_first_closing(rows)}
+        IF FOUND THEN
+            RAISE EXCEPTION 'The period % of business unit "%" is being closed', to_char(hit.month, 'YYYY-MM'),
+                hit.business_unit_id USING ERRCODE = '{PERIOD_CLOSED}';
+        END IF;{_first_closed(rows)}"""
+
+
+_NEW_ROWS = "SELECT owner_id, business_unit_id, date FROM new_rows"
+_OLD_ROWS = "SELECT owner_id, business_unit_id, date FROM old_rows"
+
+# An update is refused both out of a closed period and into one
+GUARD_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION movements_period_guard() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    hit record;
+BEGIN
+    IF current_setting('{GUARD_SETTING}', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN{_check(_NEW_ROWS)}
+    ELSIF TG_OP = 'DELETE' THEN{_check(_OLD_ROWS)}
+    ELSE{_check(_NEW_ROWS + " UNION ALL " + _OLD_ROWS)}
+    END IF;
+    IF FOUND THEN
+        RAISE EXCEPTION 'The period % of business unit "%" is closed', to_char(hit.month, 'YYYY-MM'),
+            hit.business_unit_id USING ERRCODE = '{PERIOD_CLOSED}';
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+GUARD_TRIGGERS = [
+    """CREATE TRIGGER movements_period_guard_insert AFTER INSERT ON movements
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movements_period_guard()""",
+    """CREATE TRIGGER movements_period_guard_update AFTER UPDATE ON movements
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movements_period_guard()""",
+    """CREATE TRIGGER movements_period_guard_delete AFTER DELETE ON movements
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION movements_period_guard()""",
+]
+
+# Fresh databases are built with metadata.create_all(); install the triggers there too.
+# DDL() %-formats its statement, and the RAISE message has placeholders of its own.
+event.listen(Movement.__table__, "after_create", DDL(GUARD_FUNCTION.replace("%", "%%")))
+for _trigger in GUARD_TRIGGERS:
+    event.listen(Movement.__table__, "after_create", DDL(_trigger))
+
+
+def closed_period_message(error: Exception) -> Optional[str]:
+    """The guard's message if `error` (SQLAlchemy's or the driver's, e.g. from COPY) is a write to a closed period."""
+    orig = error.orig if isinstance(error, DBAPIError) else error
+    if getattr(orig, "sqlstate", None) != PERIOD_CLOSED:
+        return None
+    driver_error = orig.__cause__ or orig
+    return getattr(driver_error, "message", None) or str(driver_error)
+
+
+def _in_period(movement, owner_id: str, business_unit_id: str, month: date):
+    unit = movement.business_unit_id == business_unit_id
+    if not business_unit_id:
+        unit = or_(movement.business_unit_id.is_(None), unit)
+    return and_(
+        movement.owner_id == owner_id,
+        unit,
+        movement.date >= month,
+        movement.date < partitions.month_start(month, 1),
+    )
+
+
+def _totals(movement) -> list:
+    return [
+        func.coalesce(func.sum(movement.amount).filter(movement.type == "income"), 0),
+        func.coalesce(func.sum(movement.amount).filter(movement.type == "expense"), 0),
+        cast(func.count(), Integer),
+    ]
+
+
+def period_lock_key(owner_id: str, business_unit_id: str, month: date):
+    """The advisory lock key of a period, as the guard trigger computes it."""
+    return func.hashtextextended(f"{owner_id}:{business_unit_id}:{month.isoformat()}", 0)
+
+
+async def close_period(db: AsyncSession, owner_id: str, business_unit_id: str, month: date) -> PeriodClose:
+    """
+    Close `month` of a business unit ("" for movements without one): mark its
+    movements closed and store their totals. Runs in the session's transaction;
+    the caller commits. Raises ValueError for an archived month, whose
+    movements are no longer in the table (restore it first, see archive.py).
+    """
+    month = partitions.month_start(month)
+    in_period = _in_period(Movement, owner_id, business_unit_id, month)
+    # Only this period is held: writes that touch it until the commit fail (see _first_closing),
+    # every other period and tenant carries on
+    await db.execute(select(func.pg_advisory_xact_lock(period_lock_key(owner_id, business_unit_id, month))))
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        update(Movement).where(in_period, Movement.status != "closed").values(status="closed", updated_at=now)
+    )
+    # Checked after the update: an archive of the month can no longer commit before this transaction
+    # (it locks movements exclusively), and one that committed before it is visible here
+    archived = await db.execute(select(MovementArchive.month).where(MovementArchive.month == month))
+    if archived.first() is not None:
+        raise ValueError(f"{month:%Y-%m} is archived; restore it before closing it")
+
+    # Over its own alias, so the subquery is not correlated with (and grouped by) the outer scan
+    tagged = aliased(Movement)
+    # Each distinct tag of a movement once: tags are stored as written, a repeated one would count twice
+    elements = func.jsonb_array_elements_text(tagged.tags).table_valued("tag").render_derived("elements")
+    tags = select(elements.c.tag).distinct().lateral("tags")
+    income, expense, count = _totals(tagged)
+    per_tag = select(
+        tags.c.tag,
+        func.jsonb_build_object("income", income, "expense", expense, "movement_count", count).label("totals"),
+    ).select_from(tagged).join(tags, true()).where(
+        _in_period(tagged, owner_id, business_unit_id, month)
+    ).group_by(tags.c.tag).subquery()
+    tag_totals = select(
+        func.coalesce(func.jsonb_object_agg(per_tag.c.tag, per_tag.c.totals), func.jsonb_build_object())
+    ).scalar_subquery()
+
+    # Inserted last: the update above would otherwise meet its own close in the guard
+    snapshot = select(
+        literal(owner_id, String), literal(business_unit_id, String), literal(month), *_totals(Movement),
+        tag_totals, literal(now),
+    ).where(in_period)
+    result = await db.execute(
+        insert(PeriodClose).from_select(
+            ["owner_id", "business_unit_id", "month", "income_total", "expense_total", "movement_count",
+             "tag_totals", "closed_at"],
+            snapshot,
+        ).returning(PeriodClose)
+    )
+    return result.scalar_one()
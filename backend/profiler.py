@@ -0,0 +1,142 @@
+"""
+Opt-in per-request SQL profiler (SQL_PROFILE=1).
+
+When enabled, every request gets X-DB-Queries and X-DB-Time (ms) response
+headers covering the statements run before the response started, and at
+the end of the request:
+
+- statements slower than SQL_PROFILE_SLOW_MS are logged with their plan.
+  The plan is captured after the response, on a separate connection:
+  EXPLAIN (ANALYZE, BUFFERS) for SELECTs, plain EXPLAIN for writes, which
+  ANALYZE would execute a second time.
+- a statement shape repeated SQL_PROFILE_REPEAT times or more in one
+  request is logged as a likely N+1.
+
+Meant for staging or short production sessions: it keeps every statement
+of a request in memory and slow plans cost an extra query each.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("SQL_PROFILE", "false").strip().lower() in ("1", "true", "yes", "on")
+SLOW_MS = float(os.environ.get("SQL_PROFILE_SLOW_MS", "100"))
+REPEAT_THRESHOLD = int(os.environ.get("SQL_PROFILE_REPEAT", "5"))
+
+QUERIES_HEADER = "X-DB-Queries"
+TIME_HEADER = "X-DB-Time"
+
+# A slow statement shape is explained at most once per 5 minutes
+_explained = TTLCache(maxsize=1000, ttl=300)
+_tasks: set = set()  # keeps pending EXPLAIN tasks referenced until done
+
+
+class _Profile:
+    __slots__ = ("queries", "db_time", "shapes", "slow")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+        self.slow: List[Tuple[str, object, float]] = []
+
+
+_current: ContextVar[Optional[_Profile]] = ContextVar("sql_profile", default=None)
+
+
+def _shape(statement: str) -> str:
+    # Statements are already parameterized; only whitespace differs between runs
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None:
+        return
+    elapsed = time.perf_counter() - context._profile_started
+    shape = _shape(statement)
+    profile.queries += 1
+    profile.db_time += elapsed
+    profile.shapes[shape] += 1
+    if elapsed * 1000 >= SLOW_MS and not executemany:
+        profile.slow.append((statement, parameters, elapsed))
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware collecting the statements of each request."""
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = _Profile()
+        token = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((QUERIES_HEADER.lower().encode(), str(profile.queries).encode()))
+                headers.append((TIME_HEADER.lower().encode(), f"{profile.db_time * 1000:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._report(scope, profile)
+
+    def _report(self, scope, profile: _Profile) -> None:
+        route = getattr(scope.get("route"), "path", scope["path"])
+        where = f"{scope['method']} {route}"
+        for shape, count in profile.shapes.items():
+            if count >= REPEAT_THRESHOLD:
+                logger.warning(f"Possible N+1 in {where}: {count}x {shape[:300]}")
+        for statement, parameters, elapsed in profile.slow:
+            shape = _shape(statement)
+            if _explained.get(shape):
+                continue
+            _explained.set(shape, True)
+            task = asyncio.get_running_loop().create_task(self._explain(where, statement, parameters, elapsed))
+            _tasks.add(task)
+            task.add_done_callback(_tasks.discard)
+
+    async def _explain(self, where: str, statement: str, parameters, elapsed: float) -> None:
+        _current.set(None)  # the plan query is not part of the request
+        is_select = statement.lstrip().upper().startswith("SELECT")
+        options = "(ANALYZE, BUFFERS)" if is_select else ""
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.exec_driver_sql(f"EXPLAIN {options} {statement}", parameters)
+                plan = "\n".join(row[0] for row in result)
+                await conn.rollback()
+        except Exception as e:
+            plan = f"(EXPLAIN failed: {e})"
+        logger.warning(f"Slow query in {where}: {elapsed * 1000:.1f} ms\n{_shape(statement)}\n{plan}")
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run through `engine` (an AsyncEngine or Engine)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,166 @@
+"""
+In-process cache of the small reference tables (business units, tags).
+
+Each worker keeps the serialized list responses in memory, one entry per
+table and owner. Statement triggers on the cached tables NOTIFY the
+`reference_data` channel on commit with the table and each owner the
+statement touched, and one dedicated LISTEN connection per worker drops
+the matching entries, so every worker serves fresh data within
+milliseconds of a write from anywhere (API, generator, psql) without
+polling, and one tenant's writes never evict another tenant's lists.
+
+The cache is only trusted while the LISTEN connection (see listener.py) is
+up: while it is down every request reads the database, and everything
+cached is dropped on reconnect since notifications may have been missed
+meanwhile.
+"""
+import hashlib
+import os
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import DDL, event
+
+from listener import listener
+from models import BusinessUnit, Tag
+
+ENABLED = os.environ.get("REFERENCE_CACHE", "true").strip().lower() in ("1", "true", "yes", "on")
+CHANNEL = "reference_data"
+MAX_ENTRIES = int(os.environ.get("REFERENCE_CACHE_SIZE", "10000"))
+
+
+def _notify(owners: str) -> str:
+    """Notify `table:owner` for every owner in `owners` (a query returning owner_id)."""
+    return f"""
+        PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME || ':' || owner)
+        FROM (SELECT DISTINCT coalesce(owner_id, '') AS owner FROM ({owners}) AS changed) AS owners;"""
+
+
+# Transition tables only exist for the events that define them, hence one branch per event.
+# A bare table name (TRUNCATE) drops the entries of every owner.
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION reference_data_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{_notify("SELECT owner_id FROM new_rows")}
+    ELSIF TG_OP = 'DELETE' THEN{_notify("SELECT owner_id FROM old_rows")}
+    ELSIF TG_OP = 'UPDATE' THEN{_notify("SELECT owner_id FROM new_rows UNION SELECT owner_id FROM old_rows")}
+    ELSE
+        PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME);
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+NOTIFY_TRIGGERS = [
+    """CREATE TRIGGER {table}_reference_notify_insert AFTER INSERT ON {table}
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION reference_data_notify()""",
+    """CREATE TRIGGER {table}_reference_notify_update AFTER UPDATE ON {table}
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION reference_data_notify()""",
+    """CREATE TRIGGER {table}_reference_notify_delete AFTER DELETE ON {table}
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION reference_data_notify()""",
+    """CREATE TRIGGER {table}_reference_notify_truncate AFTER TRUNCATE ON {table}
+       FOR EACH STATEMENT EXECUTE FUNCTION reference_data_notify()""",
+]
+
+CACHED_TABLES = [BusinessUnit.__table__, Tag.__table__]
+
+# Fresh databases are built with metadata.create_all(); install the triggers there too
+for _table in CACHED_TABLES:
+    event.listen(_table, "after_create", DDL(NOTIFY_FUNCTION))
+    for _trigger in NOTIFY_TRIGGERS:
+        event.listen(_table, "after_create", DDL(_trigger.format(table=_table.name)))
+
+
+class Entry:
+    """A serialized JSON response and its strong ETag."""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class ReferenceCache:
+    def __init__(self):
+        self.listening = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: Dict[Tuple[str, str], Entry] = {}
+        # Bumped on every invalidation (per table, and per table and owner)
+        # so a load that raced one is not stored
+        self._generations: Dict[object, int] = defaultdict(int)
+        self._epoch = 0
+
+    def _generation(self, key: Tuple[str, str]) -> tuple:
+        return self._epoch, self._generations.get(key[0], 0), self._generations.get(key, 0)
+
+    async def get(self, table: str, owner_id: str, load: Callable[[], Awaitable[bytes]]) -> Entry:
+        """The cached response for `owner_id`'s rows of `table`, built with `load()` on a miss."""
+        key = (table, owner_id)
+        entry = self._entries.get(key) if self.listening else None
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        generation = self._generation(key)
+        entry = Entry(await load())
+        if self.listening and generation == self._generation(key):
+            if len(self._entries) >= MAX_ENTRIES:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, table: Optional[str] = None, owner_id: Optional[str] = None) -> None:
+        """Drop one owner's entry of a table, every entry of a table, or everything."""
+        self.invalidations += 1
+        if table is None:
+            self._epoch += 1
+            self._entries.clear()
+        elif owner_id is not None:
+            self._generations[(table, owner_id)] += 1
+            self._entries.pop((table, owner_id), None)
+        else:
+            self._generations[table] += 1
+            for key in [key for key in self._entries if key[0] == table]:
+                del self._entries[key]
+
+    def _on_notify(self, payload: str) -> None:
+        table, sep, owner_id = payload.partition(":")
+        self.invalidate(table or None, owner_id if sep else None)
+
+    def _on_connection(self, connected: bool) -> None:
+        # Writes may have gone unnoticed before (or after) this point
+        if connected:
+            self.invalidate()
+            self.listening = True
+        else:
+            self.listening = False
+            self.invalidate()
+
+    async def start(self) -> None:
+        """Subscribe to the worker's LISTEN connection; listener.start() opens it."""
+        if ENABLED:
+            listener.subscribe(CHANNEL, self._on_notify, self._on_connection)
+
+    async def stop(self) -> None:
+        self.listening = False
+        self.invalidate()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "listening": self.listening,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,193 @@
+"""
+KPI rollups: per owner / business unit / day / status totals of the movements table.
+
+The rollup is kept up to date by statement-level triggers on `movements`
+that read the statement's transition tables, so single-row writes, bulk
+inserts and COPY all update it in the same transaction as the raw rows.
+
+Run `python rollups.py verify` to compare the rollup against the raw table,
+and `python rollups.py verify --fix` to correct any drift.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Tuple
+
+from sqlalchemy import DDL, String, cast, event, func, select, text
+
+from database import async_session
+from models import KpiDailyRollup, Movement
+
+logger = logging.getLogger(__name__)
+
+
+def _upsert_deltas(rows: str) -> str:
+    """Add the grouped totals of `rows` (movement rows with a +1/-1 `sign`) into the rollup."""
+    return f"""
+        INSERT INTO kpi_daily_rollups AS r
+            (owner_id, business_unit_id, day, status, income_total, expense_total, movement_count)
+        SELECT coalesce(owner_id, ''), coalesce(business_unit_id, ''), date, coalesce(status::text, ''),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'income'), 0),
+               coalesce(sum(sign * amount) FILTER (WHERE type = 'expense'), 0),
+               sum(sign)
+        FROM ({rows}) AS changed
+        GROUP BY 1, 2, 3, 4
+        HAVING sum(sign) <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'income') <> 0
+            OR sum(sign * amount) FILTER (WHERE type = 'expense') <> 0
+        ORDER BY 1, 2, 3, 4
+        ON CONFLICT (owner_id, business_unit_id, day, status) DO UPDATE SET
+            income_total = r.income_total + excluded.income_total,
+            expense_total = r.expense_total + excluded.expense_total,
+            movement_count = r.movement_count + excluded.movement_count;"""
+
+
+_COLUMNS = "owner_id, business_unit_id, date, status, type, amount"
+_NEW_ROWS = f"SELECT {_COLUMNS}, 1 AS sign FROM new_rows"
+_OLD_ROWS = f"SELECT {_COLUMNS}, -1 AS sign FROM old_rows"
+
+# Transition tables only exist for the events that define them, hence one branch per event.
+# Groups whose net change is zero (e.g. a description edit) are skipped.
+ROLLUP_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION kpi_rollup_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{_upsert_deltas(_NEW_ROWS)}
+    ELSIF TG_OP = 'DELETE' THEN{_upsert_deltas(_OLD_ROWS)}
+    ELSIF TG_OP = 'UPDATE' THEN{_upsert_deltas(_NEW_ROWS + " UNION ALL " + _OLD_ROWS)}
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE kpi_daily_rollups;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+ROLLUP_TRIGGERS = [
+    """CREATE TRIGGER movements_kpi_rollup_insert AFTER INSERT ON movements
+       REFERENCING NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+    """CREATE TRIGGER movements_kpi_rollup_update AFTER UPDATE ON movements
+       REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+    """CREATE TRIGGER movements_kpi_rollup_delete AFTER DELETE ON movements
+       REFERENCING OLD TABLE AS old_rows
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+    """CREATE TRIGGER movements_kpi_rollup_truncate AFTER TRUNCATE ON movements
+       FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_apply()""",
+]
+
+# Fresh databases are built with metadata.create_all(); install the triggers there too
+event.listen(Movement.__table__, "after_create", DDL(ROLLUP_FUNCTION))
+for _trigger in ROLLUP_TRIGGERS:
+    event.listen(Movement.__table__, "after_create", DDL(_trigger))
+
+RollupKey = Tuple[str, str, date, str]
+Totals = Tuple[Decimal, Decimal, int]
+EMPTY: Totals = (Decimal(0), Decimal(0), 0)
+
+
+def _expected_rollups_query():
+    """Rollup rows as computed from scratch over the raw movements table."""
+    owner = func.coalesce(Movement.owner_id, "")
+    unit = func.coalesce(Movement.business_unit_id, "")
+    status = func.coalesce(cast(Movement.status, String), "")
+    return select(
+        owner,
+        unit,
+        Movement.date,
+        status,
+        func.coalesce(func.sum(Movement.amount).filter(Movement.type == "income"), 0),
+        func.coalesce(func.sum(Movement.amount).filter(Movement.type == "expense"), 0),
+        func.count(),
+    ).group_by(owner, unit, Movement.date, status)
+
+
+async def find_drift(db) -> Dict[RollupKey, Tuple[Totals, Totals]]:
+    """
+    Compare the rollup with the raw table.
+    Returns {key: (stored, expected)} for every key that disagrees.
+    Both sides must be read from the same snapshot for the result to be exact.
+    """
+    expected = {
+        (owner, unit, day, status): (income, expense, int(count))
+        for owner, unit, day, status, income, expense, count in (await db.execute(_expected_rollups_query())).all()
+    }
+    stored = {
+        (r.owner_id, r.business_unit_id, r.day, r.status): (r.income_total, r.expense_total, r.movement_count)
+        for r in (await db.execute(select(KpiDailyRollup))).scalars().all()
+    }
+
+    drift = {}
+    for key in expected.keys() | stored.keys():
+        have = stored.get(key, EMPTY)
+        want = expected.get(key, EMPTY)
+        if have != want:
+            drift[key] = (have, want)
+    return drift
+
+
+async def verify_rollups(fix: bool = False) -> int:
+    """
+    Check the rollup against the raw table and optionally correct it.
+    Returns the number of drifted keys found.
+    """
+    async with async_session() as db:
+        if fix:
+            # Block movement writes (not reads) while correcting
+            await db.execute(text("LOCK TABLE movements IN SHARE MODE"))
+        else:
+            # One snapshot for both sides so concurrent writes cannot look like drift
+            await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+        drift = await find_drift(db)
+        for (owner, unit, day, status), (have, want) in sorted(drift.items()):
+            logger.warning(
+                f"Rollup drift owner={owner or '-'} unit={unit or '-'} day={day} status={status}: "
+                f"stored={have} expected={want}"
+            )
+
+        if fix and drift:
+            keys = [
+                {"owner_id": owner, "business_unit_id": unit, "day": day, "status": status}
+                for owner, unit, day, status in drift
+            ]
+            rows = [
+                {**key, "income_total": want[0], "expense_total": want[1], "movement_count": want[2]}
+                for key, (_, want) in zip(keys, drift.values())
+                if want != EMPTY
+            ]
+            await db.execute(
+                text(
+                    "DELETE FROM kpi_daily_rollups "
+                    "WHERE owner_id = :owner_id AND business_unit_id = :business_unit_id "
+                    "AND day = :day AND status = :status"
+                ),
+                keys,
+            )
+            if rows:
+                await db.execute(KpiDailyRollup.__table__.insert(), rows)
+            logger.info(f"Corrected {len(drift)} rollup rows")
+
+        await db.commit()
+        return len(drift)
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Verify the KPI rollup table against movements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    verify = sub.add_parser("verify", help="report (and optionally fix) drift")
+    verify.add_argument("--fix", action="store_true", help="rewrite drifted rollup rows")
+    args = parser.parse_args()
+
+    drifted = await verify_rollups(fix=args.fix)
+    if drifted == 0:
+        logger.info("Rollups match the movements table")
+    return 1 if drifted and not args.fix else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    raise SystemExit(asyncio.run(_main()))
@@ -0,0 +1,134 @@
+"""
+Movement search over description and responsible.
+
+Full-text search runs on `movements.search_vector`, a stored Spanish
+tsvector of the accent-folded text with its own GIN index. When a query
+matches nothing (typos, partial words) and pg_trgm is installed, the search
+falls back to trigram word similarity on the folded description.
+
+Every match is scored, and results are ordered by score and paged with a
+keyset cursor over (mode, score, id), so a fuzzy result set keeps paging
+as fuzzy. The GIN index yields the matches; a page then costs one top-N
+sort over them (LIMIT keeps only the page in memory), and pages after the
+first skip everything ranked above the cursor.
+"""
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import DDL, event, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.sql import Select
+
+from models import Base, Movement
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = "spanish"
+MODES = ("text", "fuzzy")
+SEARCH_MODE_HEADER = "X-Search-Mode"
+
+# Minimum word_similarity for a fuzzy match ("empanadsa" ~ "empanadas")
+FUZZY_THRESHOLD = 0.4
+
+# lower() only folds ASCII under the C locale, so accents are mapped in both cases.
+# translate() is immutable, which the generated column and expression index require
+# (the unaccent extension's function is only stable).
+FOLD_FUNCTION = """
+CREATE OR REPLACE FUNCTION search_fold(text) RETURNS text
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT lower(translate($1,
+        'ÁÀÂÄÉÈÊËÍÌÎÏÓÒÔÖÚÙÛÜÑÇáàâäéèêëíìîïóòôöúùûüñç',
+        'AAAAEEEEIIIIOOOOUUUUNCaaaaeeeeiiiioooouuuunc'))
+$$
+"""
+
+TRIGRAM_EXTENSION = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+TRIGRAM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_movements_description_trgm "
+    "ON movements USING gin (search_fold(description) gin_trgm_ops)"
+)
+
+
+def _trigram_available(ddl, target, bind, **kw) -> bool:
+    return bind.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first() is not None
+
+
+# Fresh databases are built with metadata.create_all(): the folding function must exist
+# before the movements table (its generated column uses it), the trigram index after.
+event.listen(Base.metadata, "before_create", DDL(FOLD_FUNCTION))
+event.listen(Movement.__table__, "after_create", DDL(TRIGRAM_EXTENSION).execute_if(callable_=_trigram_available))
+event.listen(Movement.__table__, "after_create", DDL(TRIGRAM_INDEX).execute_if(callable_=_trigram_available))
+
+# Set by detect_fuzzy() at startup
+fuzzy_enabled = False
+
+
+async def detect_fuzzy(conn: AsyncConnection) -> bool:
+    """Enable the trigram fallback if pg_trgm is installed in this database."""
+    global fuzzy_enabled
+    result = await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+    fuzzy_enabled = result.first() is not None
+    if not fuzzy_enabled:
+        logger.warning("pg_trgm is not installed; movement search has no fuzzy fallback")
+    return fuzzy_enabled
+
+
+def search_query(base: Select, q: str, mode: str, after: Optional[Sequence] = None) -> Select:
+    """
+    Movements of `base` matching `q`, best first, with their `score`.
+    `after` is the (score, id) of the last row of the previous page.
+    """
+    if mode == "text":
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, func.search_fold(q))
+        score = func.ts_rank(Movement.search_vector, tsquery)
+        match = Movement.search_vector.op("@@")(tsquery)
+    else:
+        folded = func.search_fold(Movement.description)
+        score = func.word_similarity(func.search_fold(q), folded)
+        match = func.search_fold(q).op("<%")(folded)
+
+    query = base.add_columns(score.label("score")).where(match)
+    if after:
+        query = query.where(tuple_(score, Movement.id) < tuple_(*after))
+    return query.order_by(score.desc(), Movement.id.desc())
+
+
+async def search_movements(
+    db: AsyncSession,
+    base: Select,
+    q: str,
+    limit: int,
+    cursor: Optional[Sequence] = None,
+) -> Tuple[List[Movement], str, Optional[list]]:
+    """
+    Run a search page. `cursor` is a decoded (mode, score, id) or None for the first page.
+    Returns (movements, mode, next cursor values or None).
+    """
+    if cursor:
+        mode, score, movement_id = cursor
+        after = (score, movement_id)
+    else:
+        mode, after = "text", None
+
+    rows = await _fetch(db, base, q, mode, after, limit)
+    if not rows and not cursor and fuzzy_enabled:
+        mode = "fuzzy"
+        rows = await _fetch(db, base, q, mode, None, limit)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = [mode, last.score, last[0].id]
+    return [row[0] for row in rows], mode, next_cursor
+
+
+async def _fetch(db: AsyncSession, base: Select, q: str, mode: str, after, limit: int) -> list:
+    # Transaction-local settings, pooled connections keep the server defaults.
+    # Custom plans fold the query text into a constant, which is what lets the planner
+    # estimate how common the words are (and pick the index) instead of guessing.
+    await db.execute(select(func.set_config("plan_cache_mode", "force_custom_plan", True)))
+    if mode == "fuzzy":
+        await db.execute(select(func.set_config("pg_trgm.word_similarity_threshold", str(FUZZY_THRESHOLD), True)))
+    result = await db.execute(search_query(base, q, mode, after).limit(limit + 1))
+    return result.all()
@@ -1,19 +1,43 @@
-from fastapi import FastAPI, APIRouter, Query, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, Query, HTTPException, Depends, Request, Response, UploadFile, File
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete, update
+from sqlalchemy import select, insert, func, delete, update, tuple_
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from asyncpg.exceptions import PostgresError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer, TypeAdapter, ValidationError
+from typing import Annotated, Any, Dict, List, Literal, Optional
+import json
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
-from database import engine, get_db
-from models import Base, Movement, BusinessUnit, Tag, User
-from firebase_auth import get_current_user, get_optional_user, get_firebase_app
+from database import engine, get_db, copy_records, warm_pool, dispose_engine, pool_stats
+from models import MOVEMENT_COPY_COLUMNS, Base, Movement, BusinessUnit, PeriodClose, Tag, User
+from firebase_auth import (
+    get_current_user, get_optional_user, get_firebase_app, get_project_id, token_cache_stats, key_store,
+)
+from pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+import rollups  # noqa: F401 - installs the KPI rollup triggers on create_all
+import kpis
+import exports
+import importers
+import search
+import generator
+import users
+import etags
+import refdata
+import live
+from listener import listener
+import archive
+import partitions
+import periods
+from tenancy import get_owner_id, session_info
+import metrics
+import profiler
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / ".env")
@@ -23,37 +47,87 @@ api_router = APIRouter(prefix="/api")
 v1_router = APIRouter(prefix="/api/v1")
 
 
-# --- Startup: create tables ---
+# --- Startup / shutdown ---
+
+SCHEMA_LOCK_ID = 7_150_001  # advisory lock held while a worker creates the schema
 
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
+        # uvicorn --workers N starts N copies at once; concurrent DDL on the same objects fails
+        await conn.execute(select(func.pg_advisory_xact_lock(SCHEMA_LOCK_ID)))
         await conn.run_sync(Base.metadata.create_all)
+        await search.detect_fuzzy(conn)
     logging.info("Database tables ready")
+    await warm_pool()
+
+    # Both share the worker's one LISTEN connection, opened once they have subscribed
+    await refdata.reference_cache.start()
+    await live.hub.start(_render_movement)
+    await listener.start()
+    # Creates last month's through the coming months' movement partitions now, then keeps them ahead
+    await partitions.maintainer.start()
+
+    # Fetch signing keys now so the first authenticated requests don't pay for it
+    if get_project_id():
+        await key_store.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await key_store.stop()
+    await listener.stop()
+    await live.hub.stop()
+    await refdata.reference_cache.stop()
+    await partitions.maintainer.stop()
+    await dispose_engine()
+
+
+# --- Dependencies ---
+
+async def get_write_db(db: AsyncSession = Depends(get_db)):
+    """
+    The request's session, for endpoints that write movements: a write that
+    touches a closed period (see periods.py) is answered with 409.
+    """
+    try:
+        yield db
+    except (DBAPIError, PostgresError) as e:  # the driver's own from COPY
+        message = periods.closed_period_message(e)
+        if message is None:
+            raise
+        raise HTTPException(status_code=409, detail=message) from e
 
 
 # --- Pydantic schemas ---
 
+MovementType = Literal["income", "expense"]
+MovementStatus = Literal["pending", "classified", "closed"]
+Day = date  # YYYY-MM-DD on the wire; aliased so fields can be named `date`
+# isoformat() keeps the API's "+00:00" offset where pydantic would write "Z"
+Timestamp = Annotated[datetime, PlainSerializer(lambda v: v.isoformat(), return_type=str)]
+
+
 class MovementCreate(BaseModel):
-    type: str
+    type: MovementType
     amount: float
     currency: str = "CRC"
     description: str = ""
     responsible: Optional[str] = None
     business_unit_id: Optional[str] = None
-    status: str = "pending"
-    date: str
+    status: MovementStatus = "pending"
+    date: Day
     tags: List[str] = []
 
 
 class MovementUpdate(BaseModel):
-    type: Optional[str] = None
+    type: Optional[MovementType] = None
     amount: Optional[float] = None
     description: Optional[str] = None
     responsible: Optional[str] = None
     business_unit_id: Optional[str] = None
-    status: Optional[str] = None
-    date: Optional[str] = None
+    status: Optional[MovementStatus] = None
+    date: Optional[Day] = None
     tags: Optional[List[str]] = None
 
 
@@ -67,10 +141,41 @@ class MovementResponse(BaseModel):
     responsible: Optional[str] = None
     business_unit_id: Optional[str] = None
     status: str
-    date: str
+    date: Day
     tags: List[str] = []
-    created_at: str
-    updated_at: str
+    created_at: Timestamp
+    updated_at: Timestamp
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    errors: Optional[List[dict]] = None
+
+
+class BulkMovementResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
+
+class ImportParserInfo(BaseModel):
+    name: str
+    label: str
+
+
+class ImportLineError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    parser: str
+    lines: int
+    parsed: int
+    inserted: int
+    duplicates: int
+    errors: List[ImportLineError]
 
 
 class BusinessUnitCreate(BaseModel):
@@ -86,6 +191,11 @@ class BusinessUnitResponse(BaseModel):
     created_at: str
 
 
+class BusinessUnitUpdate(BaseModel):
+    name: Optional[str] = None
+    type: Optional[str] = None
+
+
 class TagCreate(BaseModel):
     name: str
 
@@ -119,6 +229,32 @@ class UserResponse(BaseModel):
     updated_at: str
 
 
+class GenerateRequest(BaseModel):
+    movements: int = 1000
+    units: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+    responsibles: Optional[List[str]] = None
+    date_from: Optional[Day] = None
+    date_to: Optional[Day] = None
+    income_share: Optional[float] = None
+    seed: Optional[int] = None
+    close_periods: Optional[bool] = None  # default: on for the admin's own data, off for another owner's
+    close_after_days: Optional[int] = None  # defaults to generator.CLOSE_AFTER_DAYS
+    owner_id: Optional[str] = None  # defaults to the admin making the request
+
+
+class GenerateResult(BaseModel):
+    movements: int
+    units_created: int
+    tags_created: int
+    periods_closed: int
+    seed: int
+    date_from: str
+    date_to: str
+    seconds: float
+    rows_per_second: int
+
+
 class KPISummary(BaseModel):
     total_income: float
     total_expense: float
@@ -127,6 +263,37 @@ class KPISummary(BaseModel):
     pending_count: int
 
 
+class KPIBucket(KPISummary):
+    period: str  # first day of the bucket, YYYY-MM-DD
+
+
+class KPITimeseries(BaseModel):
+    bucket: str
+    series: List[KPIBucket]
+
+
+class PeriodCloseRequest(BaseModel):
+    month: str = Field(pattern=r"^\d{4}-(0[1-9]|1[0-2])$")  # YYYY-MM
+    business_unit_id: Optional[str] = None  # None closes the movements without a unit
+
+
+class PeriodTagTotals(BaseModel):
+    income: float
+    expense: float
+    movement_count: int
+
+
+class PeriodCloseResponse(BaseModel):
+    business_unit_id: Optional[str] = None
+    month: str  # YYYY-MM
+    total_income: float
+    total_expense: float
+    balance: float
+    movement_count: int
+    tag_totals: Dict[str, PeriodTagTotals]
+    closed_at: Timestamp
+
+
 # --- Health ---
 
 @api_router.get("/health")
@@ -136,10 +303,57 @@ async def health_check():
         "status": "ok",
         "app": "Suma",
         "version": "0.1.0",
-        "firebase": firebase_status
+        "firebase": firebase_status,
+        "auth_cache": token_cache_stats(),
+        "user_cache": users.user_cache_stats(),
+        "reference_cache": refdata.reference_cache.stats(),
+        "listener": listener.stats(),
+        "live": live.hub.stats(),
+        "partitions": partitions.maintainer.stats(),
+        "db_pool": pool_stats(),
     }
 
 
+# --- Metrics ---
+
+def _pool_metrics():
+    stats = pool_stats()
+    size = metrics.Gauge("db_pool_size", "Connections kept open by the pool.")
+    size.set(stats["size"])
+    checked_out = metrics.Gauge("db_pool_checked_out", "Connections in use.")
+    checked_out.set(stats["checked_out"])
+    overflow = metrics.Gauge("db_pool_overflow", "Connections open beyond the pool size.")
+    overflow.set(stats["overflow"])
+    waits = metrics.Counter("db_pool_waits_total", "Checkouts that waited for a free connection.")
+    waits.inc(amount=stats["waits"])
+    wait_seconds = metrics.Counter("db_pool_wait_seconds_total", "Time spent waiting for a free connection.")
+    wait_seconds.inc(amount=stats["wait_time_ms"] / 1000)
+    timeouts = metrics.Counter("db_pool_timeouts_total", "Checkouts that gave up waiting.")
+    timeouts.inc(amount=stats["timeouts"])
+    return [size, checked_out, overflow, waits, wait_seconds, timeouts]
+
+
+def _live_metrics():
+    stats = live.hub.stats()
+    streams = metrics.Gauge("live_streams", "Open live update streams.")
+    streams.set(stats["streams"])
+    published = metrics.Counter("live_events_published_total", "Movement notifications sent to live streams.")
+    published.inc(amount=stats["published"])
+    resets = metrics.Counter("live_stream_resets_total", "Live streams told to refetch after falling behind.")
+    resets.inc(amount=stats["resets"])
+    return [streams, published, resets]
+
+
+metrics.instrument_engine(engine)
+metrics.register_collector(_pool_metrics)
+metrics.register_collector(_live_metrics)
+
+
+@api_router.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # --- Auth Endpoints ---
 
 @v1_router.post("/auth/register", response_model=UserResponse)
@@ -153,255 +367,684 @@ async def register_or_get_user(
     Called after successful Firebase authentication.
     Uses Firebase token to extract user info.
     """
-    firebase_uid = firebase_user.get("uid")
-    if not firebase_uid:
+    if not firebase_user.get("uid"):
         raise HTTPException(status_code=400, detail="Invalid Firebase token")
-
-    # Check if user exists
-    result = await db.execute(
-        select(User).where(User.firebase_uid == firebase_uid)
-    )
-    existing_user = result.scalar_one_or_none()
-
-    now = datetime.now(timezone.utc).isoformat()
-
-    if existing_user:
-        # Update last login info
-        updates = {"updated_at": now}
-
-        # Update display_name if provided
-        if data.display_name:
-            updates["display_name"] = data.display_name
-        if data.photo_url:
-            updates["photo_url"] = data.photo_url
-
-        await db.execute(
-            update(User)
-            .where(User.firebase_uid == firebase_uid)
-            .values(**updates)
-        )
-        await db.commit()
-        await db.refresh(existing_user)
-        return existing_user
-
-    # Create new user
-    # Extract provider from Firebase token
-    provider = None
-    firebase_info = firebase_user.get("firebase", {})
-    sign_in_provider = firebase_info.get("sign_in_provider")
-    if sign_in_provider:
-        provider = sign_in_provider
-
-    new_user = User(
-        id=str(uuid.uuid4()),
-        firebase_uid=firebase_uid,
-        email=firebase_user.get("email"),
-        phone=firebase_user.get("phone_number"),
-        display_name=data.display_name or firebase_user.get("name"),
-        photo_url=data.photo_url or firebase_user.get("picture"),
-        provider=provider,
-        role="user",
-        created_at=now,
-        updated_at=now,
-    )
-
-    db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
-
-    logger.info(f"New user registered: {new_user.id} ({new_user.email or new_user.phone})")
-    return new_user
+    return await users.register_user(db, firebase_user, data.display_name, data.photo_url)
 
 
 @v1_router.get("/auth/me", response_model=UserResponse)
-async def get_current_user_profile(
-    firebase_user: dict = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-):
+async def get_current_user_profile(user: User = Depends(users.get_local_user)):
     """
     Get current authenticated user's profile.
     """
-    firebase_uid = firebase_user.get("uid")
-
-    result = await db.execute(
-        select(User).where(User.firebase_uid == firebase_uid)
-    )
-    user = result.scalar_one_or_none()
+    return user
 
-    if not user:
-        raise HTTPException(
-            status_code=404,
-            detail="User not found. Please register first."
-        )
 
+async def require_admin(
+    firebase_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    """The registered local user behind the token, if their role is admin."""
+    user = await users.find_user(db, firebase_user.get("uid"))
+    if not user or user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
     return user
 
 
 # --- Movements ---
 
-@v1_router.get("/movements", response_model=List[MovementResponse])
+TagMatch = Literal["any", "all"]
+
+
+class MovementFilters:
+    """
+    Query parameters shared by the movement list and export endpoints.
+    `tag` can be repeated; `tag_match` says whether any or all of them must be present.
+    """
+
+    def __init__(
+        self,
+        status: Optional[MovementStatus] = None,
+        type: Optional[MovementType] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        tag: Optional[List[str]] = Query(None),
+        tag_match: TagMatch = "any",
+    ):
+        self.status = status
+        self.type = type
+        self.date_from = date_from
+        self.date_to = date_to
+        self.tags = tag or []
+        self.tag_match = tag_match
+
+    def apply(self, q, owner_id: str):
+        q = q.where(Movement.owner_id == owner_id)
+        if self.status:
+            q = q.where(Movement.status == self.status)
+        if self.type:
+            q = q.where(Movement.type == self.type)
+        if self.date_from:
+            q = q.where(Movement.date >= self.date_from)
+        if self.date_to:
+            q = q.where(Movement.date <= self.date_to)
+        if self.tags:
+            q = q.where(Movement.tagged(self.tags, self.tag_match))
+        return q
+
+
+@v1_router.get(
+    "/movements", response_model=List[MovementResponse], dependencies=[Depends(etags.conditional("movements"))]
+)
 async def list_movements(
-    status: Optional[str] = None,
-    type: Optional[str] = None,
+    response: Response,
+    filters: MovementFilters = Depends(),
     limit: int = Query(50, le=200),
     offset: int = 0,
+    cursor: Optional[str] = None,
+    owner_id: str = Depends(get_owner_id),
     db: AsyncSession = Depends(get_db),
 ):
-    q = select(Movement)
-    if status:
-        q = q.where(Movement.status == status)
-    if type:
-        q = q.where(Movement.type == type)
-    q = q.order_by(Movement.created_at.desc()).offset(offset).limit(limit)
+    """
+    List movements, newest first.
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the
+    next page; `offset` is kept for older clients but degrades on deep pages.
+    """
+    q = filters.apply(select(Movement), owner_id)
+    if cursor:
+        created_at, movement_id = decode_cursor(cursor, 2)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not isinstance(movement_id, str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        q = q.where(tuple_(Movement.created_at, Movement.id) < tuple_(created_at, movement_id))
+    elif offset:
+        q = q.offset(offset)
+    q = q.order_by(Movement.created_at.desc(), Movement.id.desc()).limit(limit + 1)
     result = await db.execute(q)
-    return result.scalars().all()
+    movements = result.scalars().all()
+
+    if len(movements) > limit:
+        movements = movements[:limit]
+        last = movements[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at.isoformat(), last.id)
+    return movements
+
+
+@v1_router.get("/movements/search", response_model=List[MovementResponse])
+async def search_movements(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    filters: MovementFilters = Depends(),
+    limit: int = Query(20, le=100),
+    cursor: Optional[str] = None,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Search descriptions and responsibles, best match first.
+    Falls back to fuzzy matching when nothing matches exactly; the
+    `X-Search-Mode` header says which one produced the results.
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, 3)
+        mode, score, movement_id = after
+        if mode not in search.MODES or not isinstance(score, (int, float)) or not isinstance(movement_id, str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    base = filters.apply(select(Movement), owner_id)
+    movements, mode, next_cursor = await search.search_movements(db, base, q, limit, after)
+    response.headers[search.SEARCH_MODE_HEADER] = mode
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*next_cursor)
+    return movements
+
+
+@v1_router.get("/movements/export")
+async def export_movements(
+    format: Literal["csv", "ndjson"] = "csv",
+    filters: MovementFilters = Depends(),
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Stream every matching movement, oldest date first, as CSV or NDJSON.
+    Rows are fetched through a server-side cursor, never all at once;
+    rows of archived months are read from their files and merged in order.
+    """
+    media_type, header, render = exports.FORMATS[format]
+    q = filters.apply(select(*exports.EXPORT_COLUMNS), owner_id)
+    q = q.order_by(Movement.date, Movement.created_at, Movement.id)
+    archived = None
+    months = await archive.archived_months(db, filters.date_from, filters.date_to)
+    if months:
+        archived = archive.iter_rows(
+            months, owner_id, columns=exports.EXPORT_FIELDS, status=filters.status, type=filters.type,
+            date_from=filters.date_from, date_to=filters.date_to, tags=filters.tags, tag_match=filters.tag_match,
+        )
+    return StreamingResponse(
+        exports.stream_export(q, render, header(), session_info(owner_id), archived),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="movements.{format}"'},
+    )
 
 
 @v1_router.post("/movements", response_model=MovementResponse)
-async def create_movement(data: MovementCreate, db: AsyncSession = Depends(get_db)):
-    now = datetime.now(timezone.utc).isoformat()
-    mov = Movement(
-        id=str(uuid.uuid4()),
-        **data.model_dump(),
-        created_at=now,
-        updated_at=now,
+async def create_movement(
+    data: MovementCreate,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_write_db),
+):
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        insert(Movement)
+        .values(id=str(uuid.uuid4()), owner_id=owner_id, **data.model_dump(), created_at=now, updated_at=now)
+        .returning(Movement)
     )
-    db.add(mov)
+    mov = result.scalar_one()
     await db.commit()
-    await db.refresh(mov)
     return mov
 
 
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "20000"))
+
+
+@v1_router.post("/movements/bulk", response_model=BulkMovementResponse)
+async def create_movements_bulk(
+    items: List[Any],
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_write_db),
+):
+    """
+    Create many movements in one transaction.
+    Every item is validated like POST /movements; valid items are loaded with
+    COPY and invalid ones are reported by index without blocking the rest.
+    """
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} movements per request")
+
+    now = datetime.now(timezone.utc)
+    results = []
+    records = []
+    for index, item in enumerate(items):
+        try:
+            data = MovementCreate.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": index, "errors": json.loads(e.json(include_url=False))})
+            continue
+        movement_id = str(uuid.uuid4())
+        records.append((
+            movement_id, data.type, data.amount, data.currency, data.description, data.responsible,
+            data.business_unit_id, data.status, data.date, json.dumps(data.tags), now, now, owner_id,
+        ))
+        results.append({"index": index, "id": movement_id})
+
+    if records:
+        await copy_records(db, Movement.__table__, MOVEMENT_COPY_COLUMNS, records)
+        await db.commit()
+
+    return {"created": len(records), "failed": len(items) - len(records), "results": results}
+
+
 @v1_router.patch("/movements/{movement_id}", response_model=MovementResponse)
-async def update_movement(movement_id: str, data: MovementUpdate, db: AsyncSession = Depends(get_db)):
+async def update_movement(
+    movement_id: str,
+    data: MovementUpdate,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_write_db),
+):
     updates = {k: v for k, v in data.model_dump().items() if v is not None}
-    updates["updated_at"] = datetime.now(timezone.utc).isoformat()
-    await db.execute(update(Movement).where(Movement.id == movement_id).values(**updates))
-    await db.commit()
-    result = await db.execute(select(Movement).where(Movement.id == movement_id))
+    updates["updated_at"] = datetime.now(timezone.utc)
+    result = await db.execute(
+        update(Movement)
+        .where(Movement.id == movement_id, Movement.owner_id == owner_id)
+        .values(**updates)
+        .returning(Movement)
+    )
     mov = result.scalar_one_or_none()
     if not mov:
         raise HTTPException(status_code=404, detail="Movement not found")
+    await db.commit()
     return mov
 
 
 @v1_router.delete("/movements/{movement_id}")
-async def delete_movement(movement_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(delete(Movement).where(Movement.id == movement_id))
-    await db.commit()
-    if result.rowcount == 0:
+async def delete_movement(
+    movement_id: str,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_write_db),
+):
+    result = await db.execute(
+        delete(Movement).where(Movement.id == movement_id, Movement.owner_id == owner_id).returning(Movement.id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Movement not found")
+    await db.commit()
     return {"deleted": True}
 
 
+# --- Imports ---
+
+IMPORT_CHUNK_SIZE = 64 * 1024
+
+
+@v1_router.get("/imports/parsers", response_model=List[ImportParserInfo])
+async def list_import_parsers():
+    return importers.list_parsers()
+
+
+@v1_router.post("/imports/{parser_name}", response_model=ImportResult)
+async def import_movements(
+    parser_name: str,
+    file: UploadFile = File(...),
+    business_unit_id: Optional[str] = None,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_write_db),
+):
+    """
+    Import a bank statement or a file of SINPE notifications as pending movements.
+    Lines already imported (same fingerprint) are counted as duplicates and skipped.
+    """
+    parser = importers.get_parser(parser_name)
+    if not parser:
+        raise HTTPException(status_code=404, detail=f"Unknown import format: {parser_name}")
+
+    async def chunks():
+        while chunk := await file.read(IMPORT_CHUNK_SIZE):
+            yield chunk
+
+    return await importers.run_import(db, parser, chunks(), owner_id, business_unit_id)
+
+
 # --- Business Units ---
 
+async def _reference_list(
+    request: Request, db: AsyncSession, owner_id: str, model, adapter: TypeAdapter
+) -> Response:
+    """The owner's full list of a small table, served from the per-worker reference cache (see refdata.py)."""
+    async def load() -> bytes:
+        result = await db.execute(
+            select(model).where(model.owner_id == owner_id).order_by(model.created_at, model.id)
+        )
+        return adapter.dump_json(adapter.validate_python(result.scalars().all(), from_attributes=True))
+
+    entry = await refdata.reference_cache.get(model.__tablename__, owner_id, load)
+    headers = {"ETag": entry.etag, "Cache-Control": etags.CACHE_CONTROL}
+    if etags.not_modified(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+_business_units_adapter = TypeAdapter(List[BusinessUnitResponse])
+_tags_adapter = TypeAdapter(List[TagResponse])
+
+
 @v1_router.get("/business-units", response_model=List[BusinessUnitResponse])
-async def list_business_units(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(BusinessUnit))
-    return result.scalars().all()
+async def list_business_units(
+    request: Request,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    return await _reference_list(request, db, owner_id, BusinessUnit, _business_units_adapter)
 
 
 @v1_router.post("/business-units", response_model=BusinessUnitResponse)
-async def create_business_unit(data: BusinessUnitCreate, db: AsyncSession = Depends(get_db)):
+async def create_business_unit(
+    data: BusinessUnitCreate,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
     now = datetime.now(timezone.utc).isoformat()
-    unit = BusinessUnit(id=str(uuid.uuid4()), **data.model_dump(), created_at=now)
-    db.add(unit)
+    result = await db.execute(
+        insert(BusinessUnit)
+        .values(id=str(uuid.uuid4()), owner_id=owner_id, **data.model_dump(), created_at=now)
+        .returning(BusinessUnit)
+    )
+    unit = result.scalar_one()
     await db.commit()
-    await db.refresh(unit)
+    refdata.reference_cache.invalidate("business_units", owner_id)
     return unit
 
 
+@v1_router.patch("/business-units/{unit_id}", response_model=BusinessUnitResponse)
+async def update_business_unit(
+    unit_id: str,
+    data: BusinessUnitUpdate,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    updates = {k: v for k, v in data.model_dump().items() if v is not None}
+    if not updates:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    result = await db.execute(
+        update(BusinessUnit)
+        .where(BusinessUnit.id == unit_id, BusinessUnit.owner_id == owner_id)
+        .values(**updates)
+        .returning(BusinessUnit)
+    )
+    unit = result.scalar_one_or_none()
+    if not unit:
+        raise HTTPException(status_code=404, detail="Business unit not found")
+    await db.commit()
+    refdata.reference_cache.invalidate("business_units", owner_id)
+    return unit
+
+
+@v1_router.delete("/business-units/{unit_id}")
+async def delete_business_unit(unit_id: str, owner_id: str = Depends(get_owner_id), db: AsyncSession = Depends(get_db)):
+    """Movements keep their business_unit_id; they just no longer resolve to a unit."""
+    result = await db.execute(
+        delete(BusinessUnit)
+        .where(BusinessUnit.id == unit_id, BusinessUnit.owner_id == owner_id)
+        .returning(BusinessUnit.id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Business unit not found")
+    await db.commit()
+    refdata.reference_cache.invalidate("business_units", owner_id)
+    return {"deleted": True}
+
+
 # --- Tags ---
 
 @v1_router.get("/tags", response_model=List[TagResponse])
-async def list_tags(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Tag))
-    return result.scalars().all()
+async def list_tags(request: Request, owner_id: str = Depends(get_owner_id), db: AsyncSession = Depends(get_db)):
+    return await _reference_list(request, db, owner_id, Tag, _tags_adapter)
 
 
 @v1_router.post("/tags", response_model=TagResponse)
-async def create_tag(data: TagCreate, db: AsyncSession = Depends(get_db)):
+async def create_tag(data: TagCreate, owner_id: str = Depends(get_owner_id), db: AsyncSession = Depends(get_db)):
     now = datetime.now(timezone.utc).isoformat()
-    tag = Tag(id=str(uuid.uuid4()), name=data.name, created_at=now)
-    db.add(tag)
+    result = await db.execute(
+        insert(Tag).values(id=str(uuid.uuid4()), owner_id=owner_id, name=data.name, created_at=now).returning(Tag)
+    )
+    tag = result.scalar_one()
     await db.commit()
-    await db.refresh(tag)
+    refdata.reference_cache.invalidate("tags", owner_id)
     return tag
 
 
+@v1_router.patch("/tags/{tag_id}", response_model=TagResponse)
+async def update_tag(
+    tag_id: str,
+    data: TagCreate,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Renames the tag only; movements store tag names and keep the old one."""
+    result = await db.execute(
+        update(Tag).where(Tag.id == tag_id, Tag.owner_id == owner_id).values(name=data.name).returning(Tag)
+    )
+    tag = result.scalar_one_or_none()
+    if not tag:
+        raise HTTPException(status_code=404, detail="Tag not found")
+    await db.commit()
+    refdata.reference_cache.invalidate("tags", owner_id)
+    return tag
+
+
+@v1_router.delete("/tags/{tag_id}")
+async def delete_tag(tag_id: str, owner_id: str = Depends(get_owner_id), db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(Tag).where(Tag.id == tag_id, Tag.owner_id == owner_id).returning(Tag.id))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Tag not found")
+    await db.commit()
+    refdata.reference_cache.invalidate("tags", owner_id)
+    return {"deleted": True}
+
+
 # --- KPIs ---
 
-@v1_router.get("/kpis/summary", response_model=KPISummary)
-async def kpi_summary(db: AsyncSession = Depends(get_db)):
-    income = await db.execute(select(func.coalesce(func.sum(Movement.amount), 0)).where(Movement.type == "income"))
-    expense = await db.execute(select(func.coalesce(func.sum(Movement.amount), 0)).where(Movement.type == "expense"))
-    count = await db.execute(select(func.count()).select_from(Movement))
-    pending = await db.execute(select(func.count()).select_from(Movement).where(Movement.status == "pending"))
+async def _kpi_rows(
+    db: AsyncSession,
+    owner_id: str,
+    bucket: Optional[str],
+    date_from: Optional[date],
+    date_to: Optional[date],
+    business_unit_id: Optional[str],
+    tags: List[str],
+    tag_match: str,
+) -> list:
+    """
+    KPI rows of a summary (no bucket) or a timeseries: closed months from their
+    snapshots (see periods.py), the rest live, plus the archived rows a tag
+    filter has to read (see archive.py).
+    """
+    closed = []
+    # Per-tag snapshot totals add up for one tag, not for a union or intersection of several
+    if bucket in kpis.SNAPSHOT_BUCKETS and len(tags) <= 1:
+        query = kpis.closed_months_query(owner_id, date_from, date_to, business_unit_id)
+        closed = (await db.execute(query)).scalars().all()
+    if bucket:
+        live = kpis.timeseries_query(owner_id, bucket, date_from, date_to, business_unit_id, tags, tag_match, closed)
+    else:
+        live = kpis.summary_query(owner_id, date_from, date_to, business_unit_id, tags, tag_match, closed)
+    sources = [(await db.execute(live)).all()]
+    if closed:
+        query = kpis.snapshot_query(owner_id, closed, bucket, business_unit_id, tags[0] if tags else None)
+        sources.append((await db.execute(query)).all())
+    if tags:
+        months = [m for m in await archive.archived_months(db, date_from, date_to) if m.month not in closed]
+        if months:
+            sources.append(
+                await archive.kpi_rows(months, owner_id, bucket, date_from, date_to, business_unit_id, tags, tag_match)
+            )
+    return kpis.merge_rows(*sources) if len(sources) > 1 else sources[0]
+
+
+@v1_router.get("/kpis/summary", response_model=KPISummary, dependencies=[Depends(etags.conditional("movements"))])
+async def kpi_summary(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None),
+    tag_match: TagMatch = "any",
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Totals in one aggregate pass; served from the daily rollup unless filtering by tag."""
+    rows = await _kpi_rows(db, owner_id, None, date_from, date_to, business_unit_id, tag or [], tag_match)
+    return kpis.to_kpis(rows[0])
+
+
+@v1_router.get(
+    "/kpis/timeseries", response_model=KPITimeseries, dependencies=[Depends(etags.conditional("movements"))]
+)
+async def kpi_timeseries(
+    bucket: Literal["day", "week", "month"] = "day",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    business_unit_id: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None),
+    tag_match: TagMatch = "any",
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    KPI totals per day, week (starting Monday) or month, oldest first.
+    Buckets without movements are omitted.
+    """
+    rows = await _kpi_rows(db, owner_id, bucket, date_from, date_to, business_unit_id, tag or [], tag_match)
+    return {
+        "bucket": bucket,
+        "series": [{"period": row.period.isoformat(), **kpis.to_kpis(row)} for row in rows],
+    }
+
+
+# --- Live updates ---
 
-    total_income = float(income.scalar())
-    total_expense = float(expense.scalar())
+def _render_movement(movement: Movement) -> dict:
+    return MovementResponse.model_validate(movement).model_dump(mode="json")
 
+
+@v1_router.get("/live")
+async def live_updates(owner_id: str = Depends(get_owner_id)):
+    """
+    Server-Sent Events with the caller's movement changes and KPI deltas as
+    they commit (see live.py). The request's session is closed before the
+    stream starts, so an open stream holds no database connection.
+    """
+    if live.hub.stream_count >= live.MAX_STREAMS:
+        raise HTTPException(status_code=503, detail="Too many live connections", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        live.hub.stream(owner_id),
+        media_type="text/event-stream",
+        # Proxies (nginx) would otherwise buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Periods ---
+
+def _period_response(close: PeriodClose) -> dict:
+    total_income = float(close.income_total)
+    total_expense = float(close.expense_total)
     return {
+        "business_unit_id": close.business_unit_id or None,
+        "month": f"{close.month:%Y-%m}",
         "total_income": total_income,
         "total_expense": total_expense,
         "balance": total_income - total_expense,
-        "movement_count": count.scalar(),
-        "pending_count": pending.scalar(),
+        "movement_count": close.movement_count,
+        "tag_totals": close.tag_totals,
+        "closed_at": close.closed_at,
     }
 
 
+@v1_router.get("/periods", response_model=List[PeriodCloseResponse])
+async def list_periods(
+    business_unit_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Closed periods with their frozen totals, oldest month first."""
+    q = select(PeriodClose).where(PeriodClose.owner_id == owner_id)
+    if business_unit_id:
+        q = q.where(PeriodClose.business_unit_id == business_unit_id)
+    if date_from:
+        q = q.where(PeriodClose.month >= partitions.month_start(date_from))
+    if date_to:
+        q = q.where(PeriodClose.month <= date_to)
+    result = await db.execute(q.order_by(PeriodClose.month, PeriodClose.business_unit_id))
+    return [_period_response(close) for close in result.scalars().all()]
+
+
+@v1_router.post("/periods/close", response_model=PeriodCloseResponse)
+async def close_period(
+    data: PeriodCloseRequest,
+    owner_id: str = Depends(get_owner_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Close a month of a business unit (or of the movements without one): its
+    movements become closed and read-only, and their totals are frozen.
+    """
+    month = datetime.strptime(data.month, "%Y-%m").date()
+    if month >= partitions.month_start(date.today()):
+        raise HTTPException(status_code=400, detail="Only months that have ended can be closed")
+    unit = data.business_unit_id or ""
+    if unit:
+        found = await db.execute(
+            select(BusinessUnit.id).where(BusinessUnit.id == unit, BusinessUnit.owner_id == owner_id)
+        )
+        if found.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Business unit not found")
+    if await db.get(PeriodClose, (owner_id, unit, month)) is not None:
+        raise HTTPException(status_code=409, detail="The period is already closed")
+    try:
+        close = await periods.close_period(db, owner_id, unit, month)
+        await db.commit()
+    except ValueError as e:  # archived
+        raise HTTPException(status_code=409, detail=str(e))
+    except IntegrityError:  # closed concurrently
+        raise HTTPException(status_code=409, detail="The period is already closed")
+    return _period_response(close)
+
+
 # --- Seed ---
 
+# Small fixed dataset for demos and the API tests
+DEMO_DATASET = generator.GeneratorConfig(
+    movements=100,
+    units=["Sucursal Centro", "Feria del Agricultor"],
+    tags=["SINPE", "Efectivo", "Proveedor"],
+    responsibles=["Maria", "Carlos"],
+    seed=2026,
+    close_after_days=None,  # demo users edit any month
+)
+GENERATE_MAX_MOVEMENTS = int(os.environ.get("GENERATE_MAX_MOVEMENTS", "10000000"))
+# Every month of the range becomes a partition of movements
+GENERATE_MAX_DAYS = int(os.environ.get("GENERATE_MAX_DAYS", "3660"))
+
+
 @api_router.post("/seed")
-async def seed_data(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(func.count()).select_from(Movement))
-    if result.scalar() > 0:
-        cnt = (await db.execute(select(func.count()).select_from(Movement))).scalar()
+async def seed_data(owner_id: str = Depends(get_owner_id), db: AsyncSession = Depends(get_write_db)):
+    """Load the demo dataset for the caller, unless they already have movements."""
+    cnt = (await db.execute(select(func.count()).where(Movement.owner_id == owner_id))).scalar()
+    if cnt > 0:
         return {"message": "Data already seeded", "movement_count": cnt}
 
-    now = datetime.now(timezone.utc).isoformat()
+    try:
+        report = await generator.generate(db, DEMO_DATASET, owner_id)
+    except ValueError as e:  # existing rows or a closed period, as in generate_movements
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        "message": "Seed complete",
+        "movements": report["movements"],
+        "units": report["units_created"],
+        "tags": report["tags_created"],
+    }
 
-    u1_id, u2_id = str(uuid.uuid4()), str(uuid.uuid4())
-    units = [
-        BusinessUnit(id=u1_id, name="Sucursal Centro", type="branch", created_at=now),
-        BusinessUnit(id=u2_id, name="Feria del Agricultor", type="event", created_at=now),
-    ]
-    db.add_all(units)
-
-    tags = [
-        Tag(id=str(uuid.uuid4()), name="SINPE", created_at=now),
-        Tag(id=str(uuid.uuid4()), name="Efectivo", created_at=now),
-        Tag(id=str(uuid.uuid4()), name="Proveedor", created_at=now),
-    ]
-    db.add_all(tags)
-
-    movements = [
-        Movement(id=str(uuid.uuid4()), type="income", amount=45000, currency="CRC",
-                 description="Venta de cafe molido", responsible="Maria",
-                 business_unit_id=u1_id, status="classified",
-                 date="2026-01-15", tags=["SINPE"], created_at=now, updated_at=now),
-        Movement(id=str(uuid.uuid4()), type="expense", amount=12000, currency="CRC",
-                 description="Compra de bolsas", responsible=None,
-                 business_unit_id=u1_id, status="pending",
-                 date="2026-01-16", tags=["Proveedor"], created_at=now, updated_at=now),
-        Movement(id=str(uuid.uuid4()), type="income", amount=75000, currency="CRC",
-                 description="Ventas feria sabado", responsible="Carlos",
-                 business_unit_id=u2_id, status="pending",
-                 date="2026-01-18", tags=["Efectivo"], created_at=now, updated_at=now),
-        Movement(id=str(uuid.uuid4()), type="expense", amount=8500, currency="CRC",
-                 description="Gasolina transporte", responsible="Carlos",
-                 business_unit_id=u2_id, status="classified",
-                 date="2026-01-18", tags=["Efectivo"], created_at=now, updated_at=now),
-        Movement(id=str(uuid.uuid4()), type="income", amount=32000, currency="CRC",
-                 description="Pedido especial empanadas", responsible="Maria",
-                 business_unit_id=None, status="pending",
-                 date="2026-01-20", tags=["SINPE"], created_at=now, updated_at=now),
-    ]
-    db.add_all(movements)
-    await db.commit()
 
-    return {"message": "Seed complete", "movements": 5, "units": 2, "tags": 3}
+@v1_router.post("/admin/generate", response_model=GenerateResult)
+async def generate_movements(
+    data: GenerateRequest,
+    admin: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_write_db),
+):
+    """
+    Load synthetic movements (see generator.py) for the admin themselves, or
+    for `owner_id`; runs until every row is in, one COPY and commit per batch.
+    `close_periods` closes the months older than `close_after_days` at the
+    end of the range (see generator.py); it defaults to true on the admin's
+    own data and cannot be set for another owner, whose periods hold their
+    real movements too: a close cannot be undone. The range is capped at
+    GENERATE_MAX_DAYS since every month becomes a partition. Reusing a seed
+    for the same owner fails with 409 since it regenerates the same ids, as
+    do rows that fall in a closed period; the error says how many movements
+    were loaded before the failing batch.
+    """
+    if data.movements > GENERATE_MAX_MOVEMENTS:
+        raise HTTPException(status_code=413, detail=f"At most {GENERATE_MAX_MOVEMENTS} movements per request")
+    owner_id = data.owner_id or admin.id
+    close_periods = data.close_periods
+    if owner_id != admin.id:
+        if await db.get(User, owner_id) is None:
+            raise HTTPException(status_code=404, detail="Owner not found")
+        # Closing would freeze the months of the owner's real movements too, for good
+        if close_periods or data.close_after_days is not None:
+            raise HTTPException(status_code=400, detail="Periods are only closed on the admin's own data")
+        close_periods = False
+    settings = data.model_dump(exclude_none=True, exclude={"owner_id", "close_periods"})
+    if close_periods is False:
+        settings["close_after_days"] = None
+    try:
+        config = generator.GeneratorConfig(**settings).resolve()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if (config.date_to - config.date_from).days > GENERATE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"The date range spans at most {GENERATE_MAX_DAYS} days")
+
+    logger.info(f"User {admin.id} generating {data.movements} movements for {owner_id} (seed {config.seed})")
+    try:
+        return await generator.generate(db, config, owner_id)
+    except ValueError as e:  # existing rows or a closed period; earlier batches stay loaded
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 # --- Wire up ---
@@ -415,7 +1058,15 @@ app.add_middleware(
     allow_origins=os.environ.get("CORS_ORIGINS", "*").split(","),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        NEXT_CURSOR_HEADER, search.SEARCH_MODE_HEADER, profiler.QUERIES_HEADER, profiler.TIME_HEADER, "ETag",
+    ],
 )
+if profiler.ENABLED:
+    profiler.instrument_engine(engine)
+    app.add_middleware(profiler.ProfilerMiddleware, engine=engine)
+# Outermost, so the timings include every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
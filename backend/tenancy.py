@@ -0,0 +1,70 @@
+"""
+Tenant scoping: every movement, business unit and tag belongs to one user.
+
+Endpoints take the caller's user id from `get_owner_id` and filter every
+query by it explicitly; the indexes on the tenant tables all lead with
+owner_id, so a request only ever touches its own owner's slice and a busy
+tenant's volume does not show up in anyone else's plans.
+
+Row-level security is the safety net behind those filters. The policies
+below only admit rows whose owner_id matches the `app.owner_id` setting.
+They are enabled but not forced, so table owners and superusers (migrations,
+the generator, psql) bypass them; to have Postgres enforce them, run the
+API as a role that does not own the tables and set TENANT_RLS=1, which
+makes every transaction of a request set `app.owner_id` first.
+"""
+import os
+
+from fastapi import Depends
+from sqlalchemy import DDL, event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import BusinessUnit, Movement, PeriodClose, Tag, User
+from users import get_local_user
+
+TENANT_RLS = os.environ.get("TENANT_RLS", "").strip().lower() in ("1", "true", "yes", "on")
+
+OWNER_SETTING = "app.owner_id"
+
+TENANT_TABLES = [Movement.__table__, BusinessUnit.__table__, Tag.__table__, PeriodClose.__table__]
+
+RLS_POLICY = f"""
+CREATE POLICY {{table}}_owner_isolation ON {{table}}
+    USING (owner_id = current_setting('{OWNER_SETTING}', true))
+    WITH CHECK (owner_id = current_setting('{OWNER_SETTING}', true))
+"""
+
+# Fresh databases are built with metadata.create_all(); install the policies there too
+for _table in TENANT_TABLES:
+    event.listen(_table, "after_create", DDL(RLS_POLICY.format(table=_table.name)))
+    event.listen(_table, "after_create", DDL(f"ALTER TABLE {_table.name} ENABLE ROW LEVEL SECURITY"))
+
+_SET_OWNER = text(f"SELECT set_config('{OWNER_SETTING}', :owner_id, true)")
+
+
+@event.listens_for(Session, "after_begin")
+def _set_owner_on_begin(session, transaction, connection) -> None:
+    """Scope each new transaction of a tenant session to its owner (TENANT_RLS only)."""
+    owner_id = session.info.get("owner_id")
+    if owner_id is not None:
+        connection.execute(_SET_OWNER, {"owner_id": owner_id})
+
+
+def session_info(owner_id: str) -> dict:
+    """`info` for a session opened outside the request (e.g. a streaming export) on behalf of `owner_id`."""
+    return {"owner_id": owner_id} if TENANT_RLS else {}
+
+
+async def get_owner_id(
+    user: User = Depends(get_local_user),
+    db: AsyncSession = Depends(get_db),
+) -> str:
+    """FastAPI dependency: the id of the tenant the request acts for (the caller)."""
+    if TENANT_RLS:
+        db.info["owner_id"] = user.id
+        if db.in_transaction():
+            # Looking the user up may already have opened the request's first transaction
+            await db.execute(_SET_OWNER, {"owner_id": user.id})
+    return user.id
@@ -0,0 +1,324 @@
+"""
+SUMA auth cache unit tests
+Tests for the TTL cache, local token verification and the signing key store;
+they need no running API or database
+"""
+import time
+import pytest
+
+
+class Clock:
+    """Stand-in for the `time` module of the code under test, moved by hand"""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    """A fresh RSA private key and its public key in PEM"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return key, public_pem
+
+
+class TestTTLCache:
+    """cache.TTLCache expiry, LRU eviction and counters"""
+
+    def test_entries_expire_at_their_deadline(self, monkeypatch):
+        """Test an entry is served until its expires_at, and one already expired is not stored"""
+        import cache
+
+        clock = Clock()
+        monkeypatch.setattr(cache, "time", clock)
+        ttl_cache = cache.TTLCache(maxsize=10, ttl=60)
+        ttl_cache.set("token", {"uid": "a"}, expires_at=clock.now + 10)
+        ttl_cache.set("default", "ttl")
+        ttl_cache.set("stale", "x", expires_at=clock.now)
+        assert "stale" not in ttl_cache._data
+        clock.now += 9.9
+        assert ttl_cache.get("token") == {"uid": "a"}
+        clock.now += 0.1
+        assert ttl_cache.get("token") is None
+        assert len(ttl_cache) == 1
+        assert ttl_cache.get("default") == "ttl"
+        clock.now += 50
+        assert ttl_cache.get("default") is None
+
+    def test_evicts_least_recently_used_at_maxsize(self):
+        """Test the entry read or written longest ago goes first once maxsize is reached"""
+        from cache import TTLCache
+
+        ttl_cache = TTLCache(maxsize=2)
+        ttl_cache.set("a", 1)
+        ttl_cache.set("b", 2)
+        assert ttl_cache.get("a") == 1
+        ttl_cache.set("c", 3)
+        assert len(ttl_cache) == 2
+        assert ttl_cache.get("b") is None
+        assert (ttl_cache.get("a"), ttl_cache.get("c")) == (1, 3)
+
+    def test_counts_hits_and_misses(self, monkeypatch):
+        """Test stats() counts hits, misses and expired reads as misses"""
+        import cache
+
+        clock = Clock()
+        monkeypatch.setattr(cache, "time", clock)
+        ttl_cache = cache.TTLCache(maxsize=5)
+        ttl_cache.set("a", 1, expires_at=clock.now + 1)
+        ttl_cache.get("a")
+        ttl_cache.get("a")
+        ttl_cache.get("missing")
+        clock.now += 1
+        ttl_cache.get("a")
+        assert ttl_cache.stats() == {"size": 0, "maxsize": 5, "hits": 2, "misses": 2}
+
+
+class TestTokenVerification:
+    """firebase_auth.verify_token: decoded claims cached until exp, unless revocation is checked"""
+
+    PROJECT_ID = "test-cache-project"
+
+    def token(self, rsa_key, uid, exp):
+        import jwt
+
+        claims = {
+            "iss": f"https://securetoken.google.com/{self.PROJECT_ID}", "aud": self.PROJECT_ID,
+            "sub": uid, "iat": int(time.time()), "exp": exp,
+        }
+        return jwt.encode(claims, rsa_key[0], algorithm="RS256", headers={"kid": "k1"})
+
+    @pytest.fixture
+    def decoded(self, rsa_key, monkeypatch):
+        """Verify against a local keyset with an empty cache; yields the tokens whose signature was checked"""
+        import firebase_auth
+        from cache import TTLCache
+
+        monkeypatch.setattr(firebase_auth, "get_project_id", lambda: self.PROJECT_ID)
+        monkeypatch.setattr(firebase_auth, "key_store",
+                            firebase_auth.SigningKeyStore(firebase_auth.static_key_source({"k1": rsa_key[1]})))
+        monkeypatch.setattr(firebase_auth, "_token_cache", TTLCache(maxsize=10))
+        decoded = []
+        decode = firebase_auth.decode_firebase_token
+
+        def counting_decode(id_token, *args):
+            decoded.append(id_token)
+            return decode(id_token, *args)
+        monkeypatch.setattr(firebase_auth, "decode_firebase_token", counting_decode)
+        return decoded
+
+    def test_claims_are_cached_until_exp(self, decoded, rsa_key, monkeypatch):
+        """Test a token is verified once, then served from the cache until it expires"""
+        import asyncio
+        import cache
+        import firebase_auth
+
+        exp = int(time.time()) + 3600
+        token = self.token(rsa_key, "cached-user", exp)
+
+        async def scenario():
+            first = await firebase_auth.verify_token(token)
+            first["uid"] = "changed by the caller"
+            second = await firebase_auth.verify_token(token)
+            assert second["uid"] == "cached-user"
+            assert decoded == [token]
+            assert firebase_auth._token_cache.stats()["hits"] == 1
+
+            # At exp the cached claims are gone and the token is checked again
+            monkeypatch.setattr(cache, "time", Clock(exp))
+            await firebase_auth.verify_token(token)
+            assert decoded == [token, token]
+
+        asyncio.run(scenario())
+
+    def test_check_revoked_bypasses_the_cache(self, decoded, rsa_key, monkeypatch):
+        """Test FIREBASE_CHECK_REVOKED sends every call to the Admin SDK and caches nothing"""
+        import asyncio
+        import firebase_auth
+
+        token = self.token(rsa_key, "revocable-user", int(time.time()) + 3600)
+        admin_calls = []
+
+        def verify_firebase_token(id_token, check_revoked=False):
+            admin_calls.append(check_revoked)
+            return {"uid": "revocable-user"}
+
+        monkeypatch.setattr(firebase_auth, "CHECK_REVOKED", True)
+        monkeypatch.setattr(firebase_auth, "verify_firebase_token", verify_firebase_token)
+
+        async def scenario():
+            await firebase_auth.verify_token(token)
+            await firebase_auth.verify_token(token)
+
+        asyncio.run(scenario())
+        assert admin_calls == [True, True]
+        assert decoded == []
+        assert firebase_auth._token_cache.stats() == {"size": 0, "maxsize": 10, "hits": 0, "misses": 0}
+
+    def test_key_fetch_failure_is_503_not_401(self, decoded, rsa_key, monkeypatch):
+        """Test an unreachable key source answers 503, while a token signed by an unknown key still gets 401"""
+        import asyncio
+        import firebase_auth
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from fastapi import HTTPException
+
+        token = self.token(rsa_key, "unlucky-user", int(time.time()) + 3600)
+
+        async def unreachable():
+            raise RuntimeError("503 Service Unavailable")
+
+        async def verify(id_token):
+            with pytest.raises(HTTPException) as error:
+                await firebase_auth.verify_token(id_token)
+            return error.value.status_code
+
+        other_key = (rsa.generate_private_key(public_exponent=65537, key_size=2048),)
+        forged = self.token(other_key, "forged", int(time.time()) + 3600)
+        assert asyncio.run(verify(forged)) == 401
+        monkeypatch.setattr(firebase_auth, "key_store", firebase_auth.SigningKeyStore(unreachable))
+        assert asyncio.run(verify(token)) == 503
+        assert decoded == [forged]
+
+
+class TestSigningKeyStore:
+    """firebase_auth.SigningKeyStore caching, refresh schedule and key rotation"""
+
+    def counting_source(self, keysets, max_age=None):
+        """A key source serving `keysets` in turn (the last one repeats), raising any that is an exception"""
+        from firebase_auth import static_key_source
+
+        calls = []
+
+        async def source():
+            keys = keysets[min(len(calls), len(keysets) - 1)]
+            calls.append(keys)
+            if isinstance(keys, Exception):
+                raise keys
+            return await static_key_source(keys, max_age)()
+        return source, calls
+
+    def test_max_age_parsing(self):
+        """Test Cache-Control max-age is read as seconds, and missing means none"""
+        from firebase_auth import _parse_max_age
+
+        assert _parse_max_age("public, max-age=19845, must-revalidate, no-transform") == 19845
+        assert _parse_max_age("no-cache") is None
+        assert _parse_max_age(None) is None
+
+    def test_keys_expire_after_max_age(self, rsa_key, monkeypatch):
+        """Test keys are kept for the source's max-age, or default_max_age without one"""
+        import asyncio
+        import firebase_auth
+
+        clock = Clock()
+        monkeypatch.setattr(firebase_auth, "time", clock)
+        source, calls = self.counting_source([{"k1": rsa_key[1]}], max_age=600)
+        store = firebase_auth.SigningKeyStore(source, default_max_age=3600)
+
+        async def scenario():
+            assert await store.get_key("k1") is not None
+            assert store.expires_at == clock.now + 600
+            clock.now += 599
+            await store.get_key("k1")
+            assert len(calls) == 1
+            clock.now += 1
+            await store.get_key("k1")
+            assert len(calls) == 2
+
+            store.set_source(self.counting_source([{"k1": rsa_key[1]}])[0])
+            await store.get_key("k1")
+            assert store.expires_at == clock.now + 3600
+
+        asyncio.run(scenario())
+
+    def test_background_refresh_runs_refresh_margin_early(self, rsa_key, monkeypatch):
+        """Test the refresh loop wakes refresh_margin seconds before the keys expire"""
+        import asyncio
+        import firebase_auth
+
+        clock = Clock()
+        monkeypatch.setattr(firebase_auth, "time", clock)
+        source, calls = self.counting_source([{"k1": rsa_key[1]}], max_age=3600)
+        store = firebase_auth.SigningKeyStore(source, refresh_margin=300)
+        delays = []
+
+        async def sleep(delay):
+            if len(delays) == 2:
+                raise asyncio.CancelledError
+            delays.append(delay)
+            clock.now += delay
+
+        async def scenario():
+            await store.refresh()
+            monkeypatch.setattr(firebase_auth.asyncio, "sleep", sleep)
+            with pytest.raises(asyncio.CancelledError):
+                await store._refresh_loop()
+
+        asyncio.run(scenario())
+        assert delays == [3300, 3300]
+        assert len(calls) == 3
+
+    def test_unknown_kid_refreshes_early_at_most_every_min_refresh_interval(self, rsa_key, monkeypatch):
+        """Test a rotated key is fetched on first sight, without refetching for every bogus kid"""
+        import asyncio
+        import firebase_auth
+
+        clock = Clock()
+        monkeypatch.setattr(firebase_auth, "time", clock)
+        source, calls = self.counting_source([{"k1": rsa_key[1]}, {"k1": rsa_key[1], "k2": rsa_key[1]}])
+        store = firebase_auth.SigningKeyStore(source, min_refresh_interval=30)
+
+        async def scenario():
+            await store.get_key("k1")
+            clock.now += 10
+            assert await store.get_key("k2") is None  # throttled: k1's keyset is 10s old
+            assert len(calls) == 1
+            clock.now += 20
+            assert await store.get_key("k2") is not None
+            assert len(calls) == 2
+            clock.now += 30
+            assert await store.get_key("k2") is not None
+            assert len(calls) == 2  # known kid, keys still fresh
+
+        asyncio.run(scenario())
+
+    def test_failed_refresh_keeps_old_keys(self, rsa_key, monkeypatch):
+        """Test a source outage leaves the current keys in use and retries before they expire"""
+        import asyncio
+        import firebase_auth
+
+        clock = Clock()
+        monkeypatch.setattr(firebase_auth, "time", clock)
+        source, calls = self.counting_source([{"k1": rsa_key[1]}, RuntimeError("certs unavailable")], max_age=3600)
+        store = firebase_auth.SigningKeyStore(source, refresh_margin=300)
+        sleeps = []
+
+        async def sleep(delay):
+            if sleeps:
+                raise asyncio.CancelledError
+            sleeps.append(delay)
+            clock.now += delay
+
+        async def scenario():
+            key = await store.get_key("k1")
+            expires_at = store.expires_at
+            monkeypatch.setattr(firebase_auth.asyncio, "sleep", sleep)
+            with pytest.raises(asyncio.CancelledError):
+                await store._refresh_loop()
+            assert len(calls) == 2
+            assert store.expires_at == max(expires_at, clock.now + 330)
+            assert await store.get_key("k1") is key
+            assert len(calls) == 2
+
+        asyncio.run(scenario())
@@ -2,9 +2,14 @@
 SUMA API Test Suite
 Tests for authentication endpoints, movements CRUD, business units, tags, and KPIs
 """
+import csv
+import io
+import json
+import time
 import pytest
 import requests
 import os
+import uuid
 
 # Get API URL from environment - no default value
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL')
@@ -13,6 +18,57 @@ if BASE_URL:
 else:
     raise RuntimeError("REACT_APP_BACKEND_URL environment variable must be set")
 
+# Movements, units, tags and KPIs belong to the calling user, so those tests need a token:
+# either a real Firebase ID token in TEST_ID_TOKEN, or TEST_SIGNING_KEY pointing at the
+# private key (PEM) of a key the server trusts through FIREBASE_SIGNING_KEYS_FILE, which
+# lets the tests mint tokens for as many users as they need.
+TEST_ID_TOKEN = os.environ.get('TEST_ID_TOKEN')
+TEST_SIGNING_KEY = os.environ.get('TEST_SIGNING_KEY')
+TEST_SIGNING_KEY_ID = os.environ.get('TEST_SIGNING_KEY_ID', 'test')
+FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID')
+
+CAN_MINT = bool(TEST_SIGNING_KEY and FIREBASE_PROJECT_ID)
+requires_auth = pytest.mark.skipif(
+    not (TEST_ID_TOKEN or CAN_MINT), reason="set TEST_ID_TOKEN, or TEST_SIGNING_KEY and FIREBASE_PROJECT_ID"
+)
+requires_minting = pytest.mark.skipif(not CAN_MINT, reason="set TEST_SIGNING_KEY and FIREBASE_PROJECT_ID")
+# Maintenance (archive.py, partitions.py) runs in the test process against the API's database
+requires_database = pytest.mark.skipif(
+    not (CAN_MINT and os.environ.get('DATABASE_URL')), reason="set DATABASE_URL to the API's database"
+)
+
+
+def mint_token(uid):
+    """A Firebase-shaped ID token for `uid`, signed with TEST_SIGNING_KEY"""
+    import jwt
+
+    with open(TEST_SIGNING_KEY) as f:
+        key = f.read()
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{FIREBASE_PROJECT_ID}",
+        "aud": FIREBASE_PROJECT_ID,
+        "sub": uid,
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+        "email": f"{uid}@example.com",
+        "firebase": {"sign_in_provider": "password"},
+    }
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": TEST_SIGNING_KEY_ID})
+
+
+def user_session(token, session=None):
+    """A requests session that authenticates as the (registered) owner of `token`"""
+    session = session or requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    session.post(f"{BASE_URL}/api/v1/auth/register", json={"display_name": "TEST_User"})
+    return session
+
+
+# The user every scoped test acts as
+api = requests.Session()
+
 
 class TestHealthEndpoint:
     """Health check and basic connectivity tests"""
@@ -27,6 +83,35 @@ class TestHealthEndpoint:
         assert data["version"] == "0.1.0"
         assert data["firebase"] == "configured"
 
+    def test_health_reports_db_pool(self):
+        """Test /api/health exposes live connection pool stats"""
+        pool = requests.get(f"{BASE_URL}/api/health").json()["db_pool"]
+        assert pool["size"] >= 1
+        assert pool["checked_out"] >= 0
+        assert {"overflow", "waits", "wait_time_ms", "timeouts"} <= pool.keys()
+
+    @requires_auth
+    def test_metrics_exposes_route_and_db_series(self):
+        """Test /api/metrics reports per-route request and DB query series in Prometheus format"""
+        api.get(f"{BASE_URL}/api/v1/tags")
+        response = requests.get(f"{BASE_URL}/api/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'http_requests_total{method="GET",route="/api/v1/tags",status="200"}' in body
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/api/v1/tags",le="+Inf"}' in body
+        assert 'db_queries_total{route="/api/v1/tags"}' in body
+        assert "db_pool_checked_out" in body
+
+    @requires_auth
+    def test_sql_profile_headers(self):
+        """Test X-DB-Queries / X-DB-Time headers when the server runs with SQL_PROFILE=1"""
+        response = api.patch(f"{BASE_URL}/api/v1/movements/{uuid.uuid4()}", json={"amount": 1})
+        if "X-DB-Queries" not in response.headers:
+            pytest.skip("server is not running with SQL_PROFILE=1")
+        assert int(response.headers["X-DB-Queries"]) == 1  # UPDATE ... RETURNING, even for a 404
+        assert float(response.headers["X-DB-Time"]) > 0
+
 
 class TestAuthEndpoints:
     """Authentication endpoint tests - Firebase token validation"""
@@ -72,26 +157,206 @@ class TestAuthEndpoints:
         )
         assert response.status_code == 401
 
+    def test_movements_require_authentication(self):
+        """Test movements, tags and KPIs are only served to an authenticated owner"""
+        for path in ("/api/v1/movements", "/api/v1/tags", "/api/v1/kpis/summary"):
+            assert requests.get(f"{BASE_URL}{path}").status_code == 401
+
+
+@requires_minting
+class TestUserRegistration:
+    """POST /api/v1/auth/register upserts the local user; users.py caches it"""
+
+    def test_reregistering_keeps_the_user_and_changes_only_given_fields(self):
+        """Test a second registration returns the same user, updating only the fields it provides"""
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {mint_token(f'test-reg-{uuid.uuid4().hex[:8]}')}"
+        first = session.post(f"{BASE_URL}/api/v1/auth/register", json={
+            "display_name": "TEST_First", "photo_url": "https://example.com/first.png",
+        }).json()
+
+        second = session.post(f"{BASE_URL}/api/v1/auth/register", json={"display_name": "TEST_Second"})
+        assert second.status_code == 200
+        second = second.json()
+        assert second["id"] == first["id"]
+        assert second["display_name"] == "TEST_Second"
+        assert second["updated_at"] >= first["updated_at"]
+        unchanged = ("firebase_uid", "email", "photo_url", "provider", "role", "created_at")
+        assert {k: second[k] for k in unchanged} == {k: first[k] for k in unchanged}
+
+        # Registering with no fields changes nothing but updated_at
+        third = session.post(f"{BASE_URL}/api/v1/auth/register", json={}).json()
+        assert third["display_name"] == "TEST_Second"
+        assert third["photo_url"] == first["photo_url"]
+
+    def test_auth_me_reflects_reregistration(self):
+        """Test /api/v1/auth/me serves the profile a re-registration just wrote, not a cached one"""
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {mint_token(f'test-me-{uuid.uuid4().hex[:8]}')}"
+        assert session.get(f"{BASE_URL}/api/v1/auth/me").status_code == 404
+        registered = session.post(f"{BASE_URL}/api/v1/auth/register", json={"display_name": "TEST_Before"}).json()
+        assert session.get(f"{BASE_URL}/api/v1/auth/me").json()["display_name"] == "TEST_Before"
+
+        session.post(f"{BASE_URL}/api/v1/auth/register", json={"display_name": "TEST_After"})
+        me = session.get(f"{BASE_URL}/api/v1/auth/me").json()
+        assert me["id"] == registered["id"]
+        assert me["display_name"] == "TEST_After"
+
+    @requires_database
+    def test_invalidate_user_drops_the_cached_row(self, monkeypatch):
+        """Test find_user serves the cached row until invalidate_user() drops it"""
+        import asyncio
+
+        from sqlalchemy import update
+
+        import users
+        from cache import TTLCache
+        from database import async_session, engine
+        from models import User
+
+        monkeypatch.setattr(users, "_user_cache", TTLCache(maxsize=10, ttl=300))
+        uid = f"test-cache-{uuid.uuid4().hex[:8]}"
+        user_session(mint_token(uid))
+
+        async def find_user():
+            # A session per lookup, like separate requests
+            async with async_session() as db:
+                return await users.find_user(db, uid)
+
+        async def scenario():
+            try:
+                assert (await find_user()).display_name == "TEST_User"
+                async with async_session() as db:
+                    await db.execute(update(User).where(User.firebase_uid == uid).values(display_name="TEST_Renamed"))
+                    await db.commit()
+                assert (await find_user()).display_name == "TEST_User"
+                assert users.user_cache_stats()["hits"] == 1
+
+                users.invalidate_user(uid)
+                assert users.user_cache_stats()["size"] == 0
+                assert (await find_user()).display_name == "TEST_Renamed"
+                assert users.user_cache_stats()["misses"] == 2
+            finally:
+                await engine.dispose()
+
+        asyncio.run(scenario())
+
 
 class TestSeedEndpoint:
     """Seed data endpoint tests"""
     
+    @requires_auth
     def test_seed_is_idempotent(self):
         """Test /api/seed creates seed data and is idempotent"""
-        response = requests.post(f"{BASE_URL}/api/seed")
+        response = api.post(f"{BASE_URL}/api/seed")
         assert response.status_code == 200
         data = response.json()
         # Should either create new data or say already seeded
         assert "message" in data
         assert "seed" in data["message"].lower() or "Seed" in data["message"]
 
+    def test_generate_requires_authentication(self):
+        """Test /api/v1/admin/generate rejects requests without a token"""
+        response = requests.post(f"{BASE_URL}/api/v1/admin/generate", json={"movements": 10})
+        assert response.status_code == 401
+
+    def admin_session(self):
+        """A session of a new admin user"""
+        import asyncio
+        from datetime import datetime, timezone
+
+        from sqlalchemy import insert
+
+        from database import engine
+        from models import User
+
+        uid = f"test-admin-{uuid.uuid4().hex[:8]}"
+
+        async def make_admin():
+            # Inserted directly: a registered user would sit in the server's user cache as a plain user
+            try:
+                now = datetime.now(timezone.utc).isoformat()
+                async with engine.begin() as conn:
+                    await conn.execute(insert(User).values(
+                        id=str(uuid.uuid4()), firebase_uid=uid, role="admin", created_at=now, updated_at=now,
+                    ))
+            finally:
+                await engine.dispose()
+
+        asyncio.run(make_admin())
+        admin = requests.Session()
+        admin.headers["Authorization"] = f"Bearer {mint_token(uid)}"
+        return admin
+
+    @requires_database
+    def test_generate_closes_old_months_and_rejects_a_reused_seed(self):
+        """Test /api/v1/admin/generate closes old months as periods, and a repeated seed gets 409 with no rows added"""
+        admin = self.admin_session()
+        request = {"movements": 200, "seed": 7, "date_from": "2025-01-01", "date_to": "2025-06-30"}
+
+        response = admin.post(f"{BASE_URL}/api/v1/admin/generate", json=request)
+        assert response.status_code == 200
+        report = response.json()
+        assert report["movements"] == 200
+        # January to April lie wholly 60 days before the end; default units plus "no unit"
+        assert report["periods_closed"] == 4 * 4
+        closed = admin.get(f"{BASE_URL}/api/v1/periods").json()
+        assert sorted({period["month"] for period in closed}) == ["2025-01", "2025-02", "2025-03", "2025-04"]
+        assert sum(period["movement_count"] for period in closed) == admin.get(
+            f"{BASE_URL}/api/v1/kpis/summary", params={"date_from": "2025-01-01", "date_to": "2025-04-30"}
+        ).json()["movement_count"]
+        recent = admin.get(f"{BASE_URL}/api/v1/movements",
+                           params={"date_from": "2025-05-01", "status": "closed", "limit": 1}).json()
+        assert recent == []
+
+        response = admin.post(f"{BASE_URL}/api/v1/admin/generate", json=request)
+        assert response.status_code == 409
+        assert "already exist" in response.json()["detail"]
+        assert "0 of 200" in response.json()["detail"]
+        summary = admin.get(f"{BASE_URL}/api/v1/kpis/summary").json()
+        assert summary["movement_count"] == 200
+
+    @requires_database
+    def test_generate_for_another_owner_leaves_their_periods_open(self):
+        """Test /api/v1/admin/generate never closes periods of someone else's data"""
+        admin = self.admin_session()
+        owner = user_session(mint_token(f"test-gen-owner-{uuid.uuid4().hex[:8]}"))
+        owner_id = owner.get(f"{BASE_URL}/api/v1/auth/me").json()["id"]
+        request = {"movements": 50, "date_from": "2025-01-01", "date_to": "2025-06-30", "owner_id": owner_id}
+
+        response = admin.post(f"{BASE_URL}/api/v1/admin/generate", json={**request, "close_periods": True})
+        assert response.status_code == 400
+        response = admin.post(f"{BASE_URL}/api/v1/admin/generate", json=request)
+        assert response.status_code == 200
+        assert response.json()["periods_closed"] == 0
+        assert owner.get(f"{BASE_URL}/api/v1/periods").json() == []
+        assert owner.get(f"{BASE_URL}/api/v1/kpis/summary").json()["movement_count"] == 50
+
+    @requires_database
+    def test_generate_without_closing_and_range_cap(self):
+        """Test /api/v1/admin/generate leaves periods open with close_periods false, and refuses a huge date range"""
+        admin = self.admin_session()
+
+        response = admin.post(f"{BASE_URL}/api/v1/admin/generate", json={
+            "movements": 50, "date_from": "2025-01-01", "date_to": "2025-06-30", "close_periods": False,
+        })
+        assert response.status_code == 200
+        assert response.json()["periods_closed"] == 0
+        assert admin.get(f"{BASE_URL}/api/v1/periods").json() == []
+
+        response = admin.post(f"{BASE_URL}/api/v1/admin/generate", json={
+            "movements": 50, "date_from": "1900-01-01", "date_to": "2025-06-30", "close_periods": False,
+        })
+        assert response.status_code == 400
+
 
+@requires_auth
 class TestMovementsEndpoints:
     """Movements CRUD operations tests"""
     
     def test_list_movements_returns_data(self):
         """Test GET /api/v1/movements returns movements list"""
-        response = requests.get(f"{BASE_URL}/api/v1/movements")
+        response = api.get(f"{BASE_URL}/api/v1/movements")
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
@@ -99,7 +364,7 @@ class TestMovementsEndpoints:
     
     def test_list_movements_with_status_filter(self):
         """Test GET /api/v1/movements filters by status"""
-        response = requests.get(f"{BASE_URL}/api/v1/movements?status=pending")
+        response = api.get(f"{BASE_URL}/api/v1/movements?status=pending")
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
@@ -109,14 +374,41 @@ class TestMovementsEndpoints:
     
     def test_list_movements_with_type_filter(self):
         """Test GET /api/v1/movements filters by type"""
-        response = requests.get(f"{BASE_URL}/api/v1/movements?type=income")
+        response = api.get(f"{BASE_URL}/api/v1/movements?type=income")
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
         # All returned items should be income
         for movement in data:
             assert movement["type"] == "income"
-    
+
+    def test_list_movements_cursor_pagination(self):
+        """Test GET /api/v1/movements pages with X-Next-Cursor without repeating rows"""
+        first = api.get(f"{BASE_URL}/api/v1/movements?limit=2")
+        assert first.status_code == 200
+        cursor = first.headers.get("X-Next-Cursor")
+        assert cursor, "Seed data has more than 2 movements, a next cursor is expected"
+
+        second = api.get(f"{BASE_URL}/api/v1/movements", params={"limit": 2, "cursor": cursor})
+        assert second.status_code == 200
+        first_ids = {m["id"] for m in first.json()}
+        second_ids = {m["id"] for m in second.json()}
+        assert second_ids, "Second page should not be empty"
+        assert not first_ids & second_ids, "Pages should not overlap"
+
+    def test_list_movements_rejects_invalid_cursor(self):
+        """Test GET /api/v1/movements rejects a malformed cursor with 400"""
+        response = api.get(f"{BASE_URL}/api/v1/movements?cursor=not-a-cursor")
+        assert response.status_code == 400
+
+    def test_list_movements_rejects_cursor_with_wrong_types(self):
+        """Test GET /api/v1/movements rejects a well-encoded cursor whose id is not a string with 400"""
+        from pagination import encode_cursor
+
+        for values in (("2024-01-01T00:00:00", 5), ("2024-01-01T00:00:00", None), (None, "abc")):
+            response = api.get(f"{BASE_URL}/api/v1/movements", params={"cursor": encode_cursor(*values)})
+            assert response.status_code == 400, values
+
     def test_create_movement_and_verify(self):
         """Test POST /api/v1/movements creates a new movement"""
         create_payload = {
@@ -129,7 +421,7 @@ class TestMovementsEndpoints:
             "date": "2026-01-25",
             "tags": ["Test"]
         }
-        response = requests.post(
+        response = api.post(
             f"{BASE_URL}/api/v1/movements",
             json=create_payload
         )
@@ -148,13 +440,20 @@ class TestMovementsEndpoints:
         movement_id = data["id"]
         
         # Verify with GET (via list)
-        list_response = requests.get(f"{BASE_URL}/api/v1/movements")
+        list_response = api.get(f"{BASE_URL}/api/v1/movements")
         all_movements = list_response.json()
         found = any(m["id"] == movement_id for m in all_movements)
         assert found, "Created movement should appear in list"
-        
+
         # Cleanup
-        requests.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+        api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+
+    def test_create_movement_rejects_invalid_values(self):
+        """Test POST /api/v1/movements validates date, type and status with 422"""
+        payload = {"type": "income", "amount": 10.0, "status": "pending", "date": "2026-01-25"}
+        for field, value in (("date", "25/01/2026"), ("type", "transfer"), ("status", "done")):
+            response = api.post(f"{BASE_URL}/api/v1/movements", json={**payload, field: value})
+            assert response.status_code == 422, field
     
     def test_update_movement(self):
         """Test PATCH /api/v1/movements/{id} updates a movement"""
@@ -166,7 +465,7 @@ class TestMovementsEndpoints:
             "status": "pending",
             "date": "2026-01-26"
         }
-        create_response = requests.post(f"{BASE_URL}/api/v1/movements", json=create_payload)
+        create_response = api.post(f"{BASE_URL}/api/v1/movements", json=create_payload)
         assert create_response.status_code == 200
         movement_id = create_response.json()["id"]
         
@@ -176,7 +475,7 @@ class TestMovementsEndpoints:
             "description": "TEST_Updated description",
             "status": "classified"
         }
-        update_response = requests.patch(
+        update_response = api.patch(
             f"{BASE_URL}/api/v1/movements/{movement_id}",
             json=update_payload
         )
@@ -189,8 +488,36 @@ class TestMovementsEndpoints:
         assert updated_data["status"] == "classified"
         
         # Cleanup
-        requests.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
-    
+        api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+
+    def test_update_movement_date_to_another_month(self):
+        """Changing the date moves the row to another monthly partition; it stays findable by date"""
+        create_payload = {
+            "type": "income",
+            "amount": 750.0,
+            "description": "TEST_Move month",
+            "status": "pending",
+            "date": "2026-01-26"
+        }
+        movement_id = api.post(f"{BASE_URL}/api/v1/movements", json=create_payload).json()["id"]
+
+        update_response = api.patch(f"{BASE_URL}/api/v1/movements/{movement_id}", json={"date": "2019-03-04"})
+        assert update_response.status_code == 200
+        assert update_response.json()["date"] == "2019-03-04"
+
+        listed = api.get(
+            f"{BASE_URL}/api/v1/movements",
+            params={"date_from": "2019-03-01", "date_to": "2019-03-31", "limit": 100}
+        ).json()
+        assert movement_id in [m["id"] for m in listed]
+        january = api.get(
+            f"{BASE_URL}/api/v1/movements",
+            params={"date_from": "2026-01-01", "date_to": "2026-01-31", "limit": 100}
+        ).json()
+        assert movement_id not in [m["id"] for m in january]
+
+        api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+
     def test_delete_movement(self):
         """Test DELETE /api/v1/movements/{id} deletes a movement"""
         # First create a movement
@@ -201,29 +528,259 @@ class TestMovementsEndpoints:
             "status": "pending",
             "date": "2026-01-27"
         }
-        create_response = requests.post(f"{BASE_URL}/api/v1/movements", json=create_payload)
+        create_response = api.post(f"{BASE_URL}/api/v1/movements", json=create_payload)
         movement_id = create_response.json()["id"]
         
         # Delete the movement
-        delete_response = requests.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+        delete_response = api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
         assert delete_response.status_code == 200
         data = delete_response.json()
         assert data["deleted"] == True
         
         # Verify deletion - should get 404 if we try to update
-        verify_response = requests.patch(
+        verify_response = api.patch(
             f"{BASE_URL}/api/v1/movements/{movement_id}",
             json={"amount": 100}
         )
         assert verify_response.status_code == 404
 
 
+    def test_bulk_create_movements_reports_per_item(self):
+        """Test POST /api/v1/movements/bulk creates valid items and reports invalid ones by index"""
+        items = [
+            {"type": "income", "amount": 100.0 + i, "description": f"TEST_Bulk {i}",
+             "status": "pending", "date": "2026-01-29", "tags": ["TEST_Bulk"]}
+            for i in range(50)
+        ]
+        items.insert(10, {"type": "income", "description": "TEST_Bulk missing amount and date"})
+
+        response = api.post(f"{BASE_URL}/api/v1/movements/bulk", json=items)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 50
+        assert data["failed"] == 1
+        assert len(data["results"]) == 51
+
+        failed = data["results"][10]
+        assert failed["index"] == 10
+        assert failed["id"] is None
+        assert {tuple(e["loc"]) for e in failed["errors"]} == {("amount",), ("date",)}
+
+        created_ids = [r["id"] for r in data["results"] if r["id"]]
+        assert len(set(created_ids)) == 50
+
+        # Cleanup
+        for movement_id in created_ids:
+            api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+
+    def test_filter_movements_by_tags(self):
+        """Test GET /api/v1/movements?tag=...&tag_match=any|all filters by tag containment"""
+        a, b = f"TEST_TagA_{uuid.uuid4().hex[:6]}", f"TEST_TagB_{uuid.uuid4().hex[:6]}"
+        ids = {}
+        for name, tags in (("a", [a]), ("b", [b]), ("ab", [a, b])):
+            response = api.post(f"{BASE_URL}/api/v1/movements", json={
+                "type": "income", "amount": 10.0, "description": f"TEST_Tags {name}",
+                "date": "2026-01-30", "tags": tags,
+            })
+            ids[name] = response.json()["id"]
+
+        def listed(**params):
+            response = api.get(f"{BASE_URL}/api/v1/movements", params={"tag": [a, b], **params})
+            assert response.status_code == 200
+            return {m["id"] for m in response.json()}
+
+        assert listed() == {ids["a"], ids["b"], ids["ab"]}
+        assert listed(tag_match="all") == {ids["ab"]}
+
+        kpis = api.get(f"{BASE_URL}/api/v1/kpis/summary", params={"tag": [a, b], "tag_match": "all"}).json()
+        assert kpis["movement_count"] == 1
+        assert kpis["total_income"] == 10.0
+
+        # Cleanup
+        for movement_id in ids.values():
+            api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+
+
+@requires_auth
+class TestSearchEndpoint:
+    """Movement search tests"""
+
+    def test_search_ignores_accents_and_pages(self):
+        """Test GET /api/v1/movements/search matches accent-insensitively, best match first, with a cursor"""
+        token = f"zq{uuid.uuid4().hex[:8]}"
+        ids = []
+        for description, responsible in ((f"Compra de café {token}", None),
+                                         (f"Cafés {token} {token} para la feria", None),
+                                         ("TEST_Search otro", f"{token}")):
+            response = api.post(f"{BASE_URL}/api/v1/movements", json={
+                "type": "expense", "amount": 10.0, "description": description,
+                "responsible": responsible, "date": "2026-01-30",
+            })
+            ids.append(response.json()["id"])
+
+        response = api.get(f"{BASE_URL}/api/v1/movements/search", params={"q": f"cafe {token}", "limit": 1})
+        assert response.status_code == 200
+        assert response.headers["X-Search-Mode"] == "text"
+        first = response.json()
+        assert [m["id"] for m in first] == [ids[1]]
+
+        cursor = response.headers["X-Next-Cursor"]
+        response = api.get(f"{BASE_URL}/api/v1/movements/search",
+                                params={"q": f"cafe {token}", "limit": 1, "cursor": cursor})
+        assert [m["id"] for m in response.json()] == [ids[0]]
+        assert "X-Next-Cursor" not in response.headers
+
+        # Responsible is searched too
+        response = api.get(f"{BASE_URL}/api/v1/movements/search", params={"q": token})
+        assert {m["id"] for m in response.json()} == set(ids)
+
+        # Cleanup
+        for movement_id in ids:
+            api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+
+    def test_search_rejects_invalid_cursor(self):
+        """Test GET /api/v1/movements/search rejects a malformed cursor with 400"""
+        response = api.get(f"{BASE_URL}/api/v1/movements/search", params={"q": "cafe", "cursor": "bogus"})
+        assert response.status_code == 400
+
+
+@requires_auth
+class TestExportEndpoint:
+    """Streaming movement export tests"""
+
+    def test_export_csv_matches_filters(self):
+        """Test GET /api/v1/movements/export?format=csv returns a header and one row per movement"""
+        params = {"status": "pending", "date_from": "2026-01-01", "date_to": "2026-01-31"}
+        response = api.get(f"{BASE_URL}/api/v1/movements/export", params={**params, "format": "csv"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        listed = api.get(f"{BASE_URL}/api/v1/movements", params={**params, "limit": 200}).json()
+        assert {row["id"] for row in rows} == {m["id"] for m in listed}
+        for row in rows:
+            assert row["status"] == "pending"
+            assert "2026-01-01" <= row["date"] <= "2026-01-31"
+
+    def test_export_ndjson_rows_are_json(self):
+        """Test GET /api/v1/movements/export?format=ndjson streams one JSON object per line"""
+        response = api.get(f"{BASE_URL}/api/v1/movements/export", params={"format": "ndjson", "type": "income"})
+        assert response.status_code == 200
+        lines = [line for line in response.text.splitlines() if line]
+        assert lines, "Seed data has income movements"
+        for line in lines:
+            movement = json.loads(line)
+            assert movement["type"] == "income"
+            assert isinstance(movement["tags"], list)
+
+
+@requires_auth
+class TestImportEndpoints:
+    """Statement and SINPE notification import tests"""
+
+    def test_list_import_parsers(self):
+        """Test GET /api/v1/imports/parsers lists the bank and SINPE formats"""
+        response = api.get(f"{BASE_URL}/api/v1/imports/parsers")
+        assert response.status_code == 200
+        names = {p["name"] for p in response.json()}
+        assert {"bcr", "bn", "bac", "sinpe"} <= names
+
+    def test_reimporting_statement_skips_duplicates(self):
+        """Test POST /api/v1/imports/bcr inserts once and skips the same lines on re-import"""
+        ref = uuid.uuid4().int % 10**8
+        statement = (
+            "Banco de Costa Rica\n"
+            "Cuenta: 001-0000000-0\n"
+            "\n"
+            "Fecha contable;Número de documento;Descripción;Débitos;Créditos;Saldo\n"
+            f"02/01/2026;{ref};TEST_Import deposito;0,00;15.000,00;115.000,00\n"
+            f"03/01/2026;{ref + 1};TEST_Import pago proveedor;5.500,50;0,00;109.499,50\n"
+        ).encode("latin-1")
+
+        first = api.post(f"{BASE_URL}/api/v1/imports/bcr", files={"file": ("estado.csv", statement)})
+        assert first.status_code == 200
+        data = first.json()
+        assert data["parsed"] == 2
+        assert data["inserted"] == 2
+        assert data["errors"] == []
+
+        second = api.post(f"{BASE_URL}/api/v1/imports/bcr", files={"file": ("estado.csv", statement)})
+        assert second.status_code == 200
+        assert second.json()["inserted"] == 0
+        assert second.json()["duplicates"] == 2
+
+    def test_import_sinpe_notifications(self):
+        """Test POST /api/v1/imports/sinpe parses received and sent SINPE Movil messages"""
+        ref = uuid.uuid4().int % 10**12
+        messages = (
+            f"Ha recibido 15,000.00 colones de MARIA PEREZ por SINPE Movil. Comprobante {ref} 15/01/2026\n"
+            f"Usted envio CRC 3.500,00 a JUAN MORA por SINPE Movil el 16/01/2026. Ref: {ref + 1}\n"
+        )
+        response = api.post(f"{BASE_URL}/api/v1/imports/sinpe", files={"file": ("sms.txt", messages.encode())})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["inserted"] == 2
+
+        pending = api.get(f"{BASE_URL}/api/v1/movements", params={"status": "pending", "limit": 10}).json()
+        imported = {m["description"]: m for m in pending if m["description"].startswith("SINPE Móvil")}
+        assert imported["SINPE Móvil de MARIA PEREZ"]["type"] == "income"
+        assert imported["SINPE Móvil de MARIA PEREZ"]["amount"] == 15000.0
+        assert imported["SINPE Móvil a JUAN MORA"]["type"] == "expense"
+        assert imported["SINPE Móvil a JUAN MORA"]["amount"] == 3500.0
+
+    @requires_database
+    def test_reimporting_undated_notifications_on_another_day(self):
+        """Notifications without a date are stored under the import day, and still skipped when imported again later"""
+        import asyncio
+        from datetime import date
+
+        import importers
+        from database import async_session, engine
+        from importers.sinpe import SinpeNotificationParser
+
+        owner = user_session(mint_token(f"test-undated-{uuid.uuid4().hex[:8]}"))
+        owner_id = owner.get(f"{BASE_URL}/api/v1/auth/me").json()["id"]
+        ref = uuid.uuid4().int % 10**12
+        messages = (
+            f"Ha recibido 15,000.00 colones de MARIA PEREZ por SINPE Movil. Comprobante {ref}\n"
+            "Usted envio CRC 3.500,00 a JUAN MORA por SINPE Movil\n"
+        ).encode()
+
+        async def chunks():
+            yield messages
+
+        async def import_on(day):
+            async with async_session() as db:
+                return await importers.run_import(db, SinpeNotificationParser(day), chunks(), owner_id)
+
+        async def scenario():
+            try:
+                first = await import_on(date(2026, 1, 15))
+                second = await import_on(date(2026, 1, 16))
+            finally:
+                await engine.dispose()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first["inserted"] == 2
+        assert second["inserted"] == 0
+        assert second["duplicates"] == 2
+        stored = owner.get(f"{BASE_URL}/api/v1/movements").json()
+        assert {m["date"] for m in stored} == {"2026-01-15"}
+
+    def test_import_unknown_format(self):
+        """Test POST /api/v1/imports/{parser} returns 404 for an unknown format"""
+        response = api.post(f"{BASE_URL}/api/v1/imports/nope", files={"file": ("x.csv", b"x")})
+        assert response.status_code == 404
+
+
+@requires_auth
 class TestBusinessUnitsEndpoints:
     """Business Units CRUD tests"""
     
     def test_list_business_units(self):
         """Test GET /api/v1/business-units returns list"""
-        response = requests.get(f"{BASE_URL}/api/v1/business-units")
+        response = api.get(f"{BASE_URL}/api/v1/business-units")
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
@@ -234,7 +791,7 @@ class TestBusinessUnitsEndpoints:
             "name": "TEST_Nueva Sucursal",
             "type": "branch"
         }
-        response = requests.post(
+        response = api.post(
             f"{BASE_URL}/api/v1/business-units",
             json=create_payload
         )
@@ -246,13 +803,28 @@ class TestBusinessUnitsEndpoints:
         assert data["type"] == "branch"
         assert "created_at" in data
 
+    def test_update_and_delete_business_unit(self):
+        """Test PATCH/DELETE /api/v1/business-units/{id} and their 404s"""
+        unit = api.post(f"{BASE_URL}/api/v1/business-units", json={"name": "TEST_Unidad temporal"}).json()
 
+        response = api.patch(f"{BASE_URL}/api/v1/business-units/{unit['id']}", json={"type": "event"})
+        assert response.status_code == 200
+        assert response.json()["name"] == "TEST_Unidad temporal"
+        assert response.json()["type"] == "event"
+
+        assert api.delete(f"{BASE_URL}/api/v1/business-units/{unit['id']}").status_code == 200
+        assert api.delete(f"{BASE_URL}/api/v1/business-units/{unit['id']}").status_code == 404
+        response = api.patch(f"{BASE_URL}/api/v1/business-units/{unit['id']}", json={"name": "x"})
+        assert response.status_code == 404
+
+
+@requires_auth
 class TestTagsEndpoints:
     """Tags CRUD tests"""
     
     def test_list_tags(self):
         """Test GET /api/v1/tags returns list"""
-        response = requests.get(f"{BASE_URL}/api/v1/tags")
+        response = api.get(f"{BASE_URL}/api/v1/tags")
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
@@ -262,7 +834,7 @@ class TestTagsEndpoints:
         create_payload = {
             "name": "TEST_NuevoTag"
         }
-        response = requests.post(
+        response = api.post(
             f"{BASE_URL}/api/v1/tags",
             json=create_payload
         )
@@ -273,13 +845,49 @@ class TestTagsEndpoints:
         assert data["name"] == "TEST_NuevoTag"
         assert "created_at" in data
 
+    def test_rename_and_delete_tag(self):
+        """Test PATCH/DELETE /api/v1/tags/{id} and their 404s"""
+        tag = api.post(f"{BASE_URL}/api/v1/tags", json={"name": "TEST_Temporal"}).json()
+
+        response = api.patch(f"{BASE_URL}/api/v1/tags/{tag['id']}", json={"name": "TEST_Renombrado"})
+        assert response.status_code == 200
+        assert response.json()["name"] == "TEST_Renombrado"
+
+        assert api.delete(f"{BASE_URL}/api/v1/tags/{tag['id']}").status_code == 200
+        assert api.delete(f"{BASE_URL}/api/v1/tags/{tag['id']}").status_code == 404
+        assert api.patch(f"{BASE_URL}/api/v1/tags/{tag['id']}", json={"name": "x"}).status_code == 404
+
+    def test_tag_list_cache_sees_writes(self):
+        """Test GET /api/v1/tags, served from the reference cache, reflects a write right away"""
+        api.get(f"{BASE_URL}/api/v1/tags")  # make sure the list is cached
+        tag = api.post(f"{BASE_URL}/api/v1/tags", json={"name": "TEST_Cacheado"}).json()
+        assert tag["id"] in [t["id"] for t in api.get(f"{BASE_URL}/api/v1/tags").json()]
+
+        api.delete(f"{BASE_URL}/api/v1/tags/{tag['id']}")
+        assert tag["id"] not in [t["id"] for t in api.get(f"{BASE_URL}/api/v1/tags").json()]
+
+    def test_tags_conditional_get(self):
+        """Test GET /api/v1/tags answers a matching If-None-Match with 304 until tags change"""
+        etag = api.get(f"{BASE_URL}/api/v1/tags").headers["ETag"]
 
+        response = api.get(f"{BASE_URL}/api/v1/tags", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        tag = api.post(f"{BASE_URL}/api/v1/tags", json={"name": "TEST_Etag"}).json()
+        response = api.get(f"{BASE_URL}/api/v1/tags", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        api.delete(f"{BASE_URL}/api/v1/tags/{tag['id']}")
+
+
+@requires_auth
 class TestKPIsEndpoint:
     """KPIs summary endpoint tests"""
     
     def test_kpis_summary_returns_valid_data(self):
         """Test GET /api/v1/kpis/summary returns valid KPI data"""
-        response = requests.get(f"{BASE_URL}/api/v1/kpis/summary")
+        response = api.get(f"{BASE_URL}/api/v1/kpis/summary")
         assert response.status_code == 200
         data = response.json()
         
@@ -301,9 +909,256 @@ class TestKPIsEndpoint:
         expected_balance = data["total_income"] - data["total_expense"]
         assert abs(data["balance"] - expected_balance) < 0.01, "Balance should equal income - expense"
 
+    def test_kpis_summary_tracks_movement_writes(self):
+        """Test GET /api/v1/kpis/summary reflects create, update and delete of a movement"""
+        before = api.get(f"{BASE_URL}/api/v1/kpis/summary").json()
+
+        create_response = api.post(f"{BASE_URL}/api/v1/movements", json={
+            "type": "income",
+            "amount": 1234.5,
+            "description": "TEST_KPI rollup",
+            "status": "pending",
+            "date": "2026-01-28"
+        })
+        movement_id = create_response.json()["id"]
+        created = api.get(f"{BASE_URL}/api/v1/kpis/summary").json()
+        assert created["movement_count"] == before["movement_count"] + 1
+        assert created["pending_count"] == before["pending_count"] + 1
+        assert abs(created["total_income"] - before["total_income"] - 1234.5) < 0.01
+
+        api.patch(f"{BASE_URL}/api/v1/movements/{movement_id}", json={"type": "expense", "status": "classified"})
+        updated = api.get(f"{BASE_URL}/api/v1/kpis/summary").json()
+        assert updated["pending_count"] == before["pending_count"]
+        assert abs(updated["total_income"] - before["total_income"]) < 0.01
+        assert abs(updated["total_expense"] - before["total_expense"] - 1234.5) < 0.01
+
+        api.delete(f"{BASE_URL}/api/v1/movements/{movement_id}")
+        after = api.get(f"{BASE_URL}/api/v1/kpis/summary").json()
+        assert after["movement_count"] == before["movement_count"]
+        assert abs(after["total_expense"] - before["total_expense"]) < 0.01
+
+
+@requires_auth
+class TestKPITimeseriesEndpoint:
+    """KPI timeseries endpoint tests"""
+
+    def test_kpis_timeseries_buckets_add_up_to_summary(self):
+        """Test GET /api/v1/kpis/timeseries buckets sum to the summary for the same range"""
+        params = {"date_from": "2026-01-01", "date_to": "2026-01-31"}
+        summary = api.get(f"{BASE_URL}/api/v1/kpis/summary", params=params).json()
+
+        for bucket in ("day", "week", "month"):
+            response = api.get(f"{BASE_URL}/api/v1/kpis/timeseries", params={**params, "bucket": bucket})
+            assert response.status_code == 200
+            data = response.json()
+            assert data["bucket"] == bucket
+
+            periods = [point["period"] for point in data["series"]]
+            assert periods == sorted(periods), "Series should be ordered oldest first"
+            assert sum(p["movement_count"] for p in data["series"]) == summary["movement_count"]
+            assert sum(p["pending_count"] for p in data["series"]) == summary["pending_count"]
+            assert abs(sum(p["total_income"] for p in data["series"]) - summary["total_income"]) < 0.01
+            assert abs(sum(p["total_expense"] for p in data["series"]) - summary["total_expense"]) < 0.01
+
+    def test_kpis_timeseries_tag_filter(self):
+        """Test GET /api/v1/kpis/timeseries only counts movements with the tag"""
+        tagged = api.get(f"{BASE_URL}/api/v1/movements", params={"limit": 200}).json()
+        expected = sum(1 for m in tagged if "SINPE" in m["tags"])
+
+        response = api.get(f"{BASE_URL}/api/v1/kpis/timeseries", params={"bucket": "month", "tag": "SINPE"})
+        assert response.status_code == 200
+        assert sum(p["movement_count"] for p in response.json()["series"]) == expected
+
+    def test_kpis_timeseries_rejects_unknown_bucket(self):
+        """Test GET /api/v1/kpis/timeseries rejects buckets other than day/week/month"""
+        response = api.get(f"{BASE_URL}/api/v1/kpis/timeseries?bucket=year")
+        assert response.status_code == 422
+
+
+@requires_minting
+class TestTenantIsolation:
+    """One user's movements, units, tags and KPIs are invisible to every other user"""
+
+    def test_other_user_cannot_see_or_change_our_data(self):
+        other = user_session(mint_token(f"test-other-{uuid.uuid4().hex[:8]}"))
+        token = uuid.uuid4().hex[:8]
+        mine = api.post(f"{BASE_URL}/api/v1/movements", json={
+            "type": "income", "amount": 5000, "date": "2026-01-15", "description": f"TEST_Aislamiento {token}",
+        }).json()
+        response = api.get(f"{BASE_URL}/api/v1/movements")
+        assert response.json()
+
+        # Same URL, different owner: a fresh empty list, never our cached ETag
+        theirs = other.get(f"{BASE_URL}/api/v1/movements", headers={"If-None-Match": response.headers["ETag"]})
+        assert theirs.status_code == 200
+        assert theirs.json() == []
+        assert other.get(f"{BASE_URL}/api/v1/movements/search", params={"q": token}).json() == []
+        assert other.get(f"{BASE_URL}/api/v1/kpis/summary").json()["movement_count"] == 0
+        assert other.get(f"{BASE_URL}/api/v1/tags").json() == []
+        assert other.get(f"{BASE_URL}/api/v1/business-units").json() == []
+
+        assert other.patch(f"{BASE_URL}/api/v1/movements/{mine['id']}", json={"amount": 1}).status_code == 404
+        assert other.delete(f"{BASE_URL}/api/v1/movements/{mine['id']}").status_code == 404
+        assert api.delete(f"{BASE_URL}/api/v1/movements/{mine['id']}").status_code == 200
+
+
+@requires_minting
+class TestPeriodClose:
+    """Closing a month freezes its totals and makes its movements read-only"""
+
+    def test_close_period_freezes_totals_and_blocks_edits(self):
+        owner = user_session(mint_token(f"test-close-{uuid.uuid4().hex[:8]}"))
+        unit = owner.post(f"{BASE_URL}/api/v1/business-units", json={"name": "TEST_Cierre"}).json()
+        created = [
+            owner.post(f"{BASE_URL}/api/v1/movements", json={
+                "type": kind, "amount": amount, "date": day, "business_unit_id": unit["id"], "tags": tags,
+            }).json()
+            for kind, amount, day, tags in [
+                ("income", 1000, "2025-03-03", ["SINPE"]),
+                ("income", 250.5, "2025-03-31", ["SINPE", "Ventas", "SINPE"]),  # a repeated tag counts once
+                ("expense", 400, "2025-03-15", ["Ventas"]),
+                ("income", 70, "2025-04-01", ["SINPE"]),
+            ]
+        ]
+        params = {"date_from": "2025-03-01", "date_to": "2025-04-30"}
+        before = owner.get(f"{BASE_URL}/api/v1/kpis/summary", params=params).json()
+        before_tag = owner.get(f"{BASE_URL}/api/v1/kpis/summary", params={**params, "tag": "SINPE"}).json()
+        before_series = owner.get(f"{BASE_URL}/api/v1/kpis/timeseries", params={**params, "bucket": "month"}).json()
+
+        payload = {"month": "2025-03", "business_unit_id": unit["id"]}
+        response = owner.post(f"{BASE_URL}/api/v1/periods/close", json=payload)
+        assert response.status_code == 200
+        close = response.json()
+        assert close["month"] == "2025-03"
+        assert close["movement_count"] == 3
+        assert abs(close["total_income"] - 1250.5) < 0.01
+        assert abs(close["balance"] - 850.5) < 0.01
+        assert close["tag_totals"]["SINPE"]["movement_count"] == 2
+        assert abs(close["tag_totals"]["SINPE"]["income"] - 1250.5) < 0.01
+        assert abs(close["tag_totals"]["Ventas"]["expense"] - 400) < 0.01
+        assert owner.get(f"{BASE_URL}/api/v1/periods").json() == [close]
+
+        # The month is read-only; the next one is not
+        march, april = created[0], created[3]
+        closed = owner.get(f"{BASE_URL}/api/v1/movements", params={"status": "closed"}).json()
+        assert sorted(m["id"] for m in closed) == sorted(m["id"] for m in created[:3])
+        assert owner.patch(f"{BASE_URL}/api/v1/movements/{march['id']}", json={"amount": 1}).status_code == 409
+        assert owner.patch(f"{BASE_URL}/api/v1/movements/{april['id']}", json={"date": "2025-03-20"}).status_code == 409
+        assert owner.delete(f"{BASE_URL}/api/v1/movements/{march['id']}").status_code == 409
+        assert owner.post(f"{BASE_URL}/api/v1/movements", json={
+            "type": "income", "amount": 5, "date": "2025-03-10", "business_unit_id": unit["id"],
+        }).status_code == 409
+        assert owner.post(f"{BASE_URL}/api/v1/periods/close", json=payload).status_code == 409
+
+        # KPIs read the snapshot for March and stay the same
+        after = owner.get(f"{BASE_URL}/api/v1/kpis/summary", params=params).json()
+        assert after["movement_count"] == before["movement_count"]
+        assert abs(after["total_income"] - before["total_income"]) < 0.01
+        after_tag = owner.get(f"{BASE_URL}/api/v1/kpis/summary", params={**params, "tag": "SINPE"}).json()
+        assert abs(after_tag["total_income"] - before_tag["total_income"]) < 0.01
+        series = owner.get(f"{BASE_URL}/api/v1/kpis/timeseries", params={**params, "bucket": "month"}).json()
+        assert [(p["period"], p["movement_count"]) for p in series["series"]] == [
+            (p["period"], p["movement_count"]) for p in before_series["series"]
+        ]
+        assert owner.delete(f"{BASE_URL}/api/v1/movements/{april['id']}").status_code == 200
+
+    @requires_database
+    def test_close_period_rejects_archived_month(self, tmp_path, monkeypatch):
+        """An archived month's movements are not in the table; closing it would freeze zeros"""
+        import asyncio
+        from datetime import date
+
+        import archive
+        import partitions
+        from database import engine
+
+        monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path)
+        owner = user_session(mint_token(f"test-close-{uuid.uuid4().hex[:8]}"))
+        for amount in (300, 200):
+            owner.post(f"{BASE_URL}/api/v1/movements", json={
+                "type": "income", "amount": amount, "date": "2019-06-10", "status": "closed",
+            })
+        month = date(2019, 6, 1)
+        params = {"date_from": "2019-06-01", "date_to": "2019-06-30"}
+
+        async def scenario():
+            try:
+                async with engine.begin() as conn:
+                    await partitions.ensure_months(conn, month, month)
+                await archive.archive_month(month)
+                try:
+                    response = owner.post(f"{BASE_URL}/api/v1/periods/close", json={"month": "2019-06"})
+                    assert response.status_code == 409
+                    assert "archived" in response.json()["detail"]
+                    assert owner.get(f"{BASE_URL}/api/v1/periods").json() == []
+                    summary = owner.get(f"{BASE_URL}/api/v1/kpis/summary", params=params).json()
+                    assert summary["movement_count"] == 2
+                    assert abs(summary["total_income"] - 500) < 0.01
+                finally:
+                    await archive.restore_month(month)
+            finally:
+                await engine.dispose()
+
+        asyncio.run(scenario())
+
+    def test_close_period_rejects_current_month(self):
+        """Test POST /api/v1/periods/close only closes months that have ended"""
+        response = api.post(f"{BASE_URL}/api/v1/periods/close", json={"month": time.strftime("%Y-%m")})
+        assert response.status_code == 400
+        assert api.post(f"{BASE_URL}/api/v1/periods/close", json={"month": "2025-13"}).status_code == 422
+
+
+def read_events(lines, count):
+    """The next `count` (event, data) pairs of the lines of a Server-Sent Events response"""
+    events, name = [], None
+    for line in lines:
+        if line.startswith("event: "):
+            name = line[len("event: "):]
+        elif line.startswith("data: "):
+            events.append((name, json.loads(line[len("data: "):])))
+            if len(events) == count:
+                return events
+    return events
+
+
+@requires_minting
+class TestLiveUpdates:
+    """GET /api/v1/live streams the owner's movement changes and KPI deltas"""
+
+    def test_live_stream_sends_own_changes(self):
+        owner = user_session(mint_token(f"test-live-{uuid.uuid4().hex[:8]}"))
+        other = user_session(mint_token(f"test-live-{uuid.uuid4().hex[:8]}"))
+        with owner.get(f"{BASE_URL}/api/v1/live", stream=True, timeout=10) as stream:
+            assert stream.status_code == 200
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            lines = stream.iter_lines(chunk_size=None, decode_unicode=True)
+            assert read_events(lines, 1)[0][0] == "ready"
+
+            # Someone else's writes never show up in our stream
+            other.post(f"{BASE_URL}/api/v1/movements", json={"type": "income", "amount": 1, "date": "2026-01-10"})
+            created = owner.post(f"{BASE_URL}/api/v1/movements", json={
+                "type": "income", "amount": 700, "date": "2026-01-10", "description": "TEST_Live",
+            }).json()
+            owner.patch(f"{BASE_URL}/api/v1/movements/{created['id']}", json={"status": "classified"})
+            owner.delete(f"{BASE_URL}/api/v1/movements/{created['id']}")
+
+            (insert, insert_kpis, update, update_kpis, delete, delete_kpis) = read_events(lines, 6)
+            assert insert == ("movements", {"op": "insert", "count": 1, "ids": [created["id"]], "movements": [created]})
+            assert insert_kpis == ("kpis", {
+                "total_income": 700, "total_expense": 0, "balance": 700, "movement_count": 1, "pending_count": 1,
+            })
+            assert update[1]["op"] == "update"
+            assert update[1]["movements"][0]["status"] == "classified"
+            assert update_kpis[1]["pending_count"] == -1 and update_kpis[1]["movement_count"] == 0
+            assert delete == ("movements", {"op": "delete", "count": 1, "ids": [created["id"]]})
+            assert delete_kpis[1]["total_income"] == -700
+
 
 # Fixtures
 @pytest.fixture(scope="session", autouse=True)
 def ensure_seed_data():
-    """Ensure seed data exists before running tests"""
-    requests.post(f"{BASE_URL}/api/seed")
+    """Register the test user and ensure they have seed data before running tests"""
+    if not (TEST_ID_TOKEN or CAN_MINT):
+        return
+    user_session(TEST_ID_TOKEN or mint_token("test-user"), api)
+    api.post(f"{BASE_URL}/api/seed")
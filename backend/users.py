@@ -0,0 +1,111 @@
+"""
+Local user records: upsert on registration and an in-process cache.
+
+Profiles change only through POST /auth/register, so authenticated
+requests look the user up in a bounded TTL cache keyed by firebase_uid
+and only hit the `users` table on a miss. Writes through this module
+refresh the entry of the process that made them; other workers catch up
+within USER_CACHE_TTL seconds. Cached rows are detached ORM objects:
+read them, never modify them.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import TTLCache
+from database import get_db
+from firebase_auth import get_current_user
+from models import User
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "300"))
+
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+async def register_user(
+    db: AsyncSession,
+    firebase_user: dict,
+    display_name: Optional[str] = None,
+    photo_url: Optional[str] = None,
+) -> User:
+    """
+    Create the local user for a Firebase identity, or refresh the existing
+    one, in a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+    New users take their profile from the request, falling back to the
+    token; existing users only change the fields the request provides.
+    """
+    firebase_uid = firebase_user["uid"]
+    now = datetime.now(timezone.utc).isoformat()
+
+    changes = {"updated_at": now}
+    if display_name:
+        changes["display_name"] = display_name
+    if photo_url:
+        changes["photo_url"] = photo_url
+
+    stmt = (
+        insert(User)
+        .values(
+            id=str(uuid.uuid4()),
+            firebase_uid=firebase_uid,
+            email=firebase_user.get("email"),
+            phone=firebase_user.get("phone_number"),
+            display_name=display_name or firebase_user.get("name"),
+            photo_url=photo_url or firebase_user.get("picture"),
+            provider=firebase_user.get("firebase", {}).get("sign_in_provider"),
+            role="user",
+            created_at=now,
+            updated_at=now,
+        )
+        .on_conflict_do_update(index_elements=[User.firebase_uid], set_=changes)
+        # xmax is 0 only on a freshly inserted row version
+        .returning(User, literal_column("xmax = 0").label("inserted"))
+    )
+    user, inserted = (await db.execute(stmt)).one()
+    await db.commit()
+
+    _user_cache.set(firebase_uid, user)
+    if inserted:
+        logger.info(f"New user registered: {user.id} ({user.email or user.phone})")
+    return user
+
+
+async def find_user(db: AsyncSession, firebase_uid: str) -> Optional[User]:
+    """The local user for `firebase_uid`, from the cache when possible."""
+    user = _user_cache.get(firebase_uid)
+    if user is None:
+        result = await db.execute(select(User).where(User.firebase_uid == firebase_uid))
+        user = result.scalar_one_or_none()
+        if user is not None:
+            _user_cache.set(firebase_uid, user)
+    return user
+
+
+def invalidate_user(firebase_uid: str) -> None:
+    """Drop a cached user after changing its row outside register_user()."""
+    _user_cache.pop(firebase_uid)
+
+
+def user_cache_stats() -> dict:
+    return {**_user_cache.stats(), "ttl": USER_CACHE_TTL}
+
+
+async def get_local_user(
+    firebase_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    """FastAPI dependency: the registered local user behind the request's token."""
+    user = await find_user(db, firebase_user["uid"])
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found. Please register first.")
+    return user
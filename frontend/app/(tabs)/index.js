@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useState } from 'react';
 import {
   View,
   Text,
@@ -8,18 +8,28 @@ import {
   Pressable,
 } from 'react-native';
 import { colors, API_URL } from '../../lib/theme';
+import { useAuth } from '../../lib/AuthContext';
+import { useLiveEvents } from '../../lib/live';
 
 export default function PendientesScreen() {
   const [movements, setMovements] = useState([]);
   const [loading, setLoading] = useState(true);
+  const { dbUser, getAuthHeader } = useAuth();
+
+  const loadPending = useCallback(async () => {
+    const headers = await getAuthHeader();
+    const res = await fetch(`${API_URL}/v1/movements?status=pending`, { headers });
+    setMovements(await res.json());
+  }, [getAuthHeader]);
 
   useEffect(() => {
+    // Movements belong to the signed-in user; wait until they are registered
+    if (!dbUser) return;
     const load = async () => {
       try {
-        await fetch(`${API_URL}/seed`, { method: 'POST' });
-        const res = await fetch(`${API_URL}/v1/movements?status=pending`);
-        const data = await res.json();
-        setMovements(data);
+        const headers = await getAuthHeader();
+        await fetch(`${API_URL}/seed`, { method: 'POST', headers });
+        await loadPending();
       } catch (e) {
         console.error('Error loading movements:', e);
       } finally {
@@ -27,7 +37,28 @@ export default function PendientesScreen() {
       }
     };
     load();
-  }, []);
+  }, [dbUser]);
+
+  // Other responsables' changes arrive as they happen instead of by polling
+  useLiveEvents({
+    movements: (event) => {
+      if (event.ids === null) {
+        loadPending().catch((e) => console.error('Error loading movements:', e));
+        return;
+      }
+      setMovements((current) => {
+        const changed = new Set(event.ids);
+        const kept = current.filter((mov) => !changed.has(mov.id));
+        if (event.op === 'delete') return kept;
+        const pending = event.movements.filter((mov) => mov.status === 'pending');
+        // Newest first, like the API
+        return [...pending, ...kept].sort((a, b) =>
+          a.created_at < b.created_at ? 1 : a.created_at > b.created_at ? -1 : 0
+        );
+      });
+    },
+    reset: () => loadPending().catch((e) => console.error('Error loading movements:', e)),
+  });
 
   const formatCRC = (amount) =>
     new Intl.NumberFormat('es-CR', {
@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useState } from 'react';
 import {
   View,
   Text,
@@ -7,25 +7,44 @@ import {
   ActivityIndicator,
 } from 'react-native';
 import { colors, API_URL } from '../../lib/theme';
+import { useAuth } from '../../lib/AuthContext';
+import { useLiveEvents } from '../../lib/live';
+
+const KPI_FIELDS = ['total_income', 'total_expense', 'balance', 'movement_count', 'pending_count'];
 
 export default function KPIsScreen() {
   const [kpis, setKpis] = useState(null);
   const [loading, setLoading] = useState(true);
+  const { dbUser, getAuthHeader } = useAuth();
+
+  const loadKpis = useCallback(async () => {
+    try {
+      const headers = await getAuthHeader();
+      const res = await fetch(`${API_URL}/v1/kpis/summary`, { headers });
+      const data = await res.json();
+      setKpis(data);
+    } catch (e) {
+      console.error('Error loading KPIs:', e);
+    } finally {
+      setLoading(false);
+    }
+  }, [getAuthHeader]);
 
   useEffect(() => {
-    const load = async () => {
-      try {
-        const res = await fetch(`${API_URL}/v1/kpis/summary`);
-        const data = await res.json();
-        setKpis(data);
-      } catch (e) {
-        console.error('Error loading KPIs:', e);
-      } finally {
-        setLoading(false);
-      }
-    };
-    load();
-  }, []);
+    // KPIs only cover the signed-in user's movements; wait until they are registered
+    if (!dbUser) return;
+    loadKpis();
+  }, [dbUser]);
+
+  // Each write's change to the totals is pushed; only a reset needs a refetch
+  useLiveEvents({
+    kpis: (delta) =>
+      setKpis((current) =>
+        current &&
+        Object.fromEntries(KPI_FIELDS.map((field) => [field, current[field] + delta[field]]))
+      ),
+    reset: loadKpis,
+  });
 
   const formatCRC = (amount) =>
     new Intl.NumberFormat('es-CR', {
@@ -0,0 +1,93 @@
+// Live movement and KPI updates from GET /v1/live (Server-Sent Events).
+// EventSource cannot send the Authorization header and React Native has no
+// streaming fetch, so the stream is read from XMLHttpRequest's progress events,
+// which work on both. The connection is reopened (with a fresh token) whenever
+// it ends; handlers get `reset` then, since events may have been missed.
+// responseText keeps everything a request received, so a long-lived stream is
+// also reopened once it has read MAX_RESPONSE_CHARS.
+import { useEffect, useRef } from 'react';
+import { API_URL } from './theme';
+import { useAuth } from './AuthContext';
+
+const DEFAULT_RETRY_MS = 3000;
+const MAX_RESPONSE_CHARS = 1 << 20;
+
+// Calls handlers[event](data) for every event of the signed-in user's stream
+export function useLiveEvents(handlers) {
+  const { dbUser, getAuthHeader } = useAuth();
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+
+  useEffect(() => {
+    if (!dbUser) return;
+    let xhr = null;
+    let timer = null;
+    let closed = false;
+    let retryMs = DEFAULT_RETRY_MS;
+    let connectedOnce = false;
+
+    const dispatch = (name, data) => {
+      const handler = handlersRef.current[name];
+      if (handler) handler(data);
+    };
+
+    const connect = async () => {
+      let headers;
+      try {
+        headers = await getAuthHeader();
+      } catch (e) {
+        timer = setTimeout(connect, retryMs);
+        return;
+      }
+      if (closed) return;
+      xhr = new XMLHttpRequest();
+      let recycled = false;
+      let seen = 0;
+      let buffer = '';
+      let name = 'message';
+      let data = [];
+      xhr.open('GET', `${API_URL}/v1/live`);
+      Object.entries(headers).forEach(([key, value]) => xhr.setRequestHeader(key, value));
+      xhr.setRequestHeader('Accept', 'text/event-stream');
+      xhr.onprogress = () => {
+        buffer += xhr.responseText.slice(seen);
+        seen = xhr.responseText.length;
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach((line) => {
+          if (line === '') {
+            if (data.length) {
+              if (name === 'ready' && connectedOnce) dispatch('reset', {});
+              else if (name !== 'ready') dispatch(name, JSON.parse(data.join('\n')));
+              connectedOnce = true;
+            }
+            name = 'message';
+            data = [];
+          } else if (line.startsWith('event: ')) {
+            name = line.slice(7);
+          } else if (line.startsWith('data: ')) {
+            data.push(line.slice(6));
+          } else if (line.startsWith('retry: ')) {
+            retryMs = parseInt(line.slice(7), 10) || DEFAULT_RETRY_MS;
+          }
+        });
+        if (seen > MAX_RESPONSE_CHARS && !recycled) {
+          recycled = true;
+          xhr.abort();
+        }
+      };
+      xhr.onloadend = () => {
+        // A recycled stream reconnects at once; the new `ready` resets the handlers
+        if (!closed) timer = setTimeout(connect, recycled ? 0 : retryMs);
+      };
+      xhr.send();
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      if (xhr) xhr.abort();
+    };
+  }, [dbUser]);
+}